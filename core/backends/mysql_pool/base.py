@@ -0,0 +1,54 @@
+import threading
+
+from django.db.backends.mysql import base
+
+from core.backends.mysql_pool.pool import ConnectionPool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The MySQL backend with connections borrowed from a pool per process
+    instead of opened for every request.
+
+    The pool is configured by the "POOL" entry of the database settings,
+    with MIN_SIZE, MAX_SIZE, TIMEOUT and MAX_AGE keys.
+    """
+
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def get_pool(self, conn_params: dict) -> ConnectionPool:
+        # Tests switch to another database name, so pools are kept per set
+        # of connection parameters
+        key = repr(sorted(conn_params.items()))
+        with self.pools_lock:
+            if key not in self.pools:
+                options = self.settings_dict.get("POOL", {})
+                self.pools[key] = ConnectionPool(
+                    connect=lambda: base.DatabaseWrapper.get_new_connection(
+                        self, conn_params
+                    ),
+                    ping=lambda connection: connection.ping(),
+                    min_size=options.get("MIN_SIZE", 0),
+                    max_size=options.get("MAX_SIZE", 10),
+                    timeout=options.get("TIMEOUT", 10),
+                    max_age=options.get("MAX_AGE"),
+                )
+            return self.pools[key]
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        return self.pool.acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using a connection closed inside a transaction
+                # until the block exits, so it can't go back to the pool
+                self.pool.discard(self.connection)
+                return
+            if not self.autocommit:
+                self.connection.rollback()
+            self.pool.release(self.connection)
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections.
+
+    `connect` opens a new connection and `ping` raises if one is no longer
+    usable. Up to `max_size` connections are open at once; borrowing waits
+    up to `timeout` seconds for one to be returned before raising
+    PoolTimeout. `min_size` connections are opened when the pool is first
+    used, every idle connection is pinged before it is handed out, and
+    connections older than `max_age` seconds are closed instead of reused.
+    """
+
+    def __init__(
+        self,
+        connect,
+        ping,
+        min_size: int = 0,
+        max_size: int = 10,
+        timeout: float = 10,
+        max_age: float = None,
+    ):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(
+                "The pool needs 0 <= min_size <= max_size and max_size >= 1"
+            )
+        self.connect = connect
+        self.ping = ping
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.condition = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        # Connections inherited from a parent process belong to it
+        self.pid = os.getpid()
+        self.idle = deque()
+        self.opened_at = {}
+        self.size = 0
+        self.filled = False
+
+    def expired(self, connection) -> bool:
+        return (
+            self.max_age is not None
+            and time.monotonic() - self.opened_at[id(connection)]
+            >= self.max_age
+        )
+
+    def open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened_at[id(connection)] = time.monotonic()
+        return connection
+
+    def fill(self):
+        with self.condition:
+            missing = max(self.min_size - self.size, 0)
+            self.size += missing
+            self.filled = True
+        for _ in range(missing):
+            connection = self.open()
+            with self.condition:
+                self.idle.append(connection)
+                self.condition.notify()
+
+    def acquire(self):
+        if self.pid != os.getpid():
+            with self.condition:
+                self.reset()
+        if not self.filled:
+            self.fill()
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No connection was returned to the pool of "
+                            f"{self.max_size} within {self.timeout}s"
+                        )
+                    self.condition.wait(remaining)
+
+                if not self.idle:
+                    self.size += 1
+                    break
+                # Most recently used first, so surplus connections age out
+                connection = self.idle.pop()
+
+            if self.expired(connection):
+                self.discard(connection)
+                continue
+            try:
+                self.ping(connection)
+            except Exception:
+                self.discard(connection)
+                continue
+            return connection
+
+        return self.open()
+
+    def release(self, connection):
+        if self.pid != os.getpid() or id(connection) not in self.opened_at:
+            return
+        if self.expired(connection):
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection):
+        with self.condition:
+            if self.opened_at.pop(id(connection), None) is None:
+                return
+            self.size -= 1
+            self.condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.condition:
+            idle = list(self.idle)
+            self.idle.clear()
+            self.filled = False
+        for connection in idle:
+            self.discard(connection)
@@ -0,0 +1,96 @@
+import json
+import zipfile
+
+from django.core.management.base import BaseCommand
+
+from core.management.snapshot import (
+    MANIFEST,
+    SNAPSHOT_VERSION,
+    encode_value,
+    get_natural_keys,
+    get_snapshot_models,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Saves the store, tags, likes and core tables to a compressed "
+        "snapshot file that load_snapshot can restore."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Snapshot file to write.")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of rows stored per compressed chunk.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        tables = []
+
+        with zipfile.ZipFile(
+            options["path"], "w", compression=zipfile.ZIP_DEFLATED
+        ) as snapshot:
+            for model in get_snapshot_models():
+                label = model._meta.label_lower
+                columns = [
+                    field.attname for field in model._meta.concrete_fields
+                ]
+                rows = (
+                    model._base_manager.order_by("pk")
+                    .values_list(*columns)
+                    .iterator(chunk_size=chunk_size)
+                )
+
+                row_count = 0
+                chunk_count = 0
+                chunk = []
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) == chunk_size:
+                        self.write_chunk(snapshot, label, chunk_count, chunk)
+                        row_count += len(chunk)
+                        chunk_count += 1
+                        chunk = []
+                if chunk:
+                    self.write_chunk(snapshot, label, chunk_count, chunk)
+                    row_count += len(chunk)
+                    chunk_count += 1
+
+                tables.append(
+                    {
+                        "model": label,
+                        "columns": columns,
+                        "rows": row_count,
+                        "chunks": chunk_count,
+                    }
+                )
+                self.stdout.write(f"  {row_count} {label}")
+
+            snapshot.writestr(
+                MANIFEST,
+                json.dumps(
+                    {
+                        "version": SNAPSHOT_VERSION,
+                        **get_natural_keys(),
+                        "tables": tables,
+                    }
+                ),
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshot saved to {options['path']}")
+        )
+
+    def write_chunk(self, snapshot, label, index, rows):
+        # Stored column by column, which compresses much better than rows
+        columns = [
+            [encode_value(value) for value in column] for column in zip(*rows)
+        ]
+        snapshot.writestr(
+            f"{label}/{index:06d}.json",
+            json.dumps(columns, separators=(",", ":")),
+        )
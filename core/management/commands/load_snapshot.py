@@ -0,0 +1,189 @@
+import json
+import zipfile
+
+from django.apps import apps
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from core.management.snapshot import (
+    MANIFEST,
+    SNAPSHOT_VERSION,
+    get_referencing_models,
+    get_snapshot_models,
+)
+
+# Stands for ids of MAPPED_MODELS objects this database doesn't have
+MISSING = object()
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces the store, tags, likes and core tables with the content "
+        "of a snapshot saved by dump_snapshot, and rebuilds the search "
+        "index. Users' groups missing from the database are created, and "
+        "rows pointing to content types or permissions it doesn't have "
+        "are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Snapshot file to load.")
+
+    def handle(self, *args, **options):
+        with zipfile.ZipFile(options["path"]) as snapshot:
+            manifest = json.loads(snapshot.read(MANIFEST))
+            if manifest["version"] != SNAPSHOT_VERSION:
+                raise CommandError(
+                    f"Unsupported snapshot version {manifest['version']}"
+                )
+
+            models = get_snapshot_models()
+            tables = {table["model"]: table for table in manifest["tables"]}
+
+            with transaction.atomic():
+                mappings = {
+                    ContentType: self.map_content_types(
+                        manifest["content_types"]
+                    ),
+                    # Snapshots from before users' groups were saved
+                    Group: self.map_groups(manifest.get("groups", {})),
+                    Permission: self.map_permissions(
+                        manifest.get("permissions", {})
+                    ),
+                }
+
+                self.clear_tables(models)
+                with connection.constraint_checks_disabled():
+                    for model in models:
+                        table = tables.get(model._meta.label_lower)
+                        if table:
+                            self.load_table(snapshot, model, table, mappings)
+
+                # Foreign keys weren't checked while loading
+                connection.check_constraints(
+                    table_names=[model._meta.db_table for model in models]
+                )
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                        no_style(), models
+                    ):
+                        cursor.execute(sql)
+
+                # Snapshots leave the search index out, it is built from
+                # the loaded objects instead
+                call_command("rebuild_search_index", stdout=self.stdout)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshot loaded from {options['path']}")
+        )
+
+    def map_content_types(self, content_types: dict) -> dict:
+        # Content type ids differ between databases, so generic relations
+        # are mapped through the app label and model name
+        mapping = {}
+        for id, label in content_types.items():
+            app_label, model_name = label.split(".")
+            try:
+                model = apps.get_model(app_label, model_name)
+            except LookupError:
+                continue
+            mapping[int(id)] = ContentType.objects.get_for_model(model).id
+        return mapping
+
+    def map_groups(self, groups: dict) -> dict:
+        mapping = {}
+        for id, name in groups.items():
+            group, _ = Group.objects.get_or_create(name=name)
+            mapping[int(id)] = group.id
+        return mapping
+
+    def map_permissions(self, permissions: dict) -> dict:
+        ids = {
+            (app_label, model, codename): id
+            for id, app_label, model, codename in Permission.objects.values_list(
+                "id",
+                "content_type__app_label",
+                "content_type__model",
+                "codename",
+            )
+        }
+        return {
+            int(id): ids[tuple(key)]
+            for id, key in permissions.items()
+            if tuple(key) in ids
+        }
+
+    def clear_tables(self, models: list):
+        # The search index only points to the snapshot's objects through
+        # content types, so it isn't found among the referencing models
+        search_models = list(apps.get_app_config("search").get_models())
+        tables = [
+            model._meta.db_table
+            for model in models
+            + get_referencing_models(models)
+            + search_models
+        ]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sql_flush(no_style(), tables):
+                cursor.execute(sql)
+
+    def load_table(self, snapshot, model, table: dict, mappings: dict):
+        fields_by_column = {
+            field.attname: field for field in model._meta.concrete_fields
+        }
+        fields = [fields_by_column[column] for column in table["columns"]]
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            connection.ops.quote_name(model._meta.db_table),
+            ", ".join(
+                connection.ops.quote_name(field.column) for field in fields
+            ),
+            ", ".join(["%s"] * len(fields)),
+        )
+
+        label = model._meta.label_lower
+        skipped = 0
+        with connection.cursor() as cursor:
+            for index in range(table["chunks"]):
+                columns = json.loads(
+                    snapshot.read(f"{label}/{index:06d}.json")
+                )
+                columns = [
+                    self.decode_column(field, column, mappings)
+                    for field, column in zip(fields, columns)
+                ]
+                rows = [
+                    row
+                    for row in zip(*columns)
+                    if not any(value is MISSING for value in row)
+                ]
+                skipped += len(columns[0]) - len(rows)
+                cursor.executemany(sql, rows)
+        self.stdout.write(f"  {table['rows'] - skipped} {label}")
+        if skipped:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"  Skipped {skipped} {label} pointing to objects "
+                    "missing from this database"
+                )
+            )
+
+    def decode_column(self, field, values: list, mappings: dict):
+        mapping = (
+            mappings.get(field.related_model) if field.is_relation else None
+        )
+        if mapping is not None:
+            values = [
+                None if value is None else mapping.get(value, MISSING)
+                for value in values
+            ]
+        return [
+            (
+                value
+                if value is None or value is MISSING
+                else field.get_db_prep_save(field.to_python(value), connection)
+            )
+            for value in values
+        ]
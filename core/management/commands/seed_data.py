@@ -1,10 +1,27 @@
 import random
+import uuid
+from itertools import accumulate
+from multiprocessing import Pool
 
-import faker_commerce
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from faker import Faker
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
 
+from core.management.fake_data import (
+    fake_customers,
+    fake_paragraphs,
+    fake_products,
+    fake_users,
+    generate,
+    get_faker,
+)
 from core.models import User
 from likes.models import LikedItem
 from store.models import (
@@ -21,212 +38,483 @@ from store.models import (
 )
 from tags.models import Tag, TaggedItem
 
+# Number of rows generated with --scale 1
+USERS = 50
+PROMOTIONS = 5
+COLLECTIONS = 10
+PRODUCTS = 100
+REVIEWS = 1000
+ORDERS = 30
+CARTS = 20
+TAGS = 15
+
+
+class Popularity:
+    # Picks items with Zipf-like weights, the first items being the most
+    # popular, so a few products and customers get most of the activity
+
+    def __init__(self, items: list, skew: float, rng: random.Random):
+        self.items = rng.sample(items, len(items))
+        self.cum_weights = list(
+            accumulate(1 / rank**skew for rank in range(1, len(items) + 1))
+        )
+        self.rng = rng
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def choices(self, count: int) -> list:
+        return self.rng.choices(
+            self.items, cum_weights=self.cum_weights, k=count
+        )
+
+    def sample(self, count: int) -> list:
+        count = min(count, len(self.items))
+        picked = {}
+        while len(picked) < count:
+            picked.setdefault(self.choice(), None)
+        return list(picked)
+
 
 class Command(BaseCommand):
     help = "Generates random data for the store, tags, and likes apps."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=1,
+            help=(
+                "Multiplies the number of generated rows, "
+                f"e.g. --scale 1000 creates {PRODUCTS * 1000} products."
+            ),
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=None,
+            help="Seed for reproducible data.",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help=(
+                "Zipf exponent for picking products and customers, "
+                "0 picks them uniformly."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes generating fake text.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of rows inserted per query.",
+        )
+
     def handle(self, *args, **options):
         self.stdout.write("Generating mock data...")
-        fake = Faker()
-        fake.add_provider(faker_commerce.Provider)
-
-        # Clean existing data (optional, but good for fresh runs)
-        repr(CartItem.objects.all().delete())
-        repr(Cart.objects.all().delete())
-        repr(OrderItem.objects.all().delete())
-        repr(Order.objects.all().delete())
-        repr(Product.objects.all().delete())
-        repr(Collection.objects.all().delete())
-        repr(Promotion.objects.all().delete())
-        repr(Customer.objects.all().delete())
-        repr(Address.objects.all().delete())
-        repr(Review.objects.all().delete())
-        repr(Tag.objects.all().delete())
-        repr(TaggedItem.objects.all().delete())
-        repr(LikedItem.objects.all().delete())
-        repr(User.objects.filter(is_superuser=False).delete())
-
-        # Create Users
-        users = []
-        for _ in range(50):
-            user = User.objects.create_user(
-                username=fake.unique.user_name(),
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                email=fake.unique.email(),
-                # All mock users have the same password
-                password="Pass@123",
-            )
-            users.append(user)
-
-        # Create Promotions
-        promotions = []
-        for _ in range(5):
-            promotion = Promotion.objects.create(
-                description=fake.catch_phrase(),
-                discount=round(random.uniform(5, 20), 2),
+        self.scale = options["scale"]
+        self.seed = (
+            options["seed"]
+            if options["seed"] is not None
+            else random.randrange(2**32)
+        )
+        self.skew = options["skew"]
+        self.batch_size = options["batch_size"]
+        self.rng = random.Random(self.seed)
+        self.fake = get_faker(self.seed)
+        self.pool = (
+            Pool(options["workers"]) if options["workers"] > 1 else None
+        )
+
+        try:
+            self.clear_data()
+            users = self.create_users()
+            customers = self.create_customers(users)
+            promotions = self.create_promotions()
+            collections = self.create_collections()
+            products = self.create_products(collections, promotions)
+
+            # The same products and customers stay popular in every table
+            self.popular_products = Popularity(
+                list(products), self.skew, self.rng
             )
-            promotions.append(promotion)
+            self.popular_customers = Popularity(customers, self.skew, self.rng)
+            self.create_reviews()
+            self.create_orders(products)
+            self.create_carts()
+            self.create_tags(products, collections)
+            self.create_likes(users)
+            # bulk_create() skips the signals that keep the index current
+            call_command("rebuild_search_index", stdout=self.stdout)
+        finally:
+            if self.pool:
+                self.pool.close()
+                self.pool.join()
 
-        # Create Collections
-        collections = []
-        for _ in range(10):
-            collection = Collection.objects.create(
-                title=fake.ecommerce_category()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Mock data generated successfully! (--seed {self.seed})"
             )
-            collections.append(collection)
-
-        # Create Products
-        products = []
-        for _ in range(100):
-            product = Product.objects.create(
-                title=fake.ecommerce_name(),
-                slug=fake.slug(),
-                description=fake.paragraph(),
-                price=round(random.uniform(10, 9999.99), 2),
-                inventory=random.randint(0, 100),
-                collection=random.choice(collections),
+        )
+
+    def count(self, base: int) -> int:
+        return max(1, round(base * self.scale))
+
+    def generate(self, function, total: int):
+        # Yields chunks of fake rows, each seeded from its offset so the
+        # output doesn't depend on the number of workers
+        tasks = [
+            (
+                function,
+                self.seed + start,
+                start,
+                min(self.batch_size, total - start),
             )
-            # Add promotions to products
-            product_promotions = random.sample(
-                promotions, random.randint(0, len(promotions))
+            for start in range(0, total, self.batch_size)
+        ]
+        if self.pool:
+            return self.pool.imap(generate, tasks)
+        return map(generate, tasks)
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def report(self, model, count: int):
+        self.stdout.write(f"  {count} {model._meta.verbose_name_plural}")
+
+    def clear_data(self):
+        # Truncating is much faster than deleting row by row and doesn't
+        # fire signals for every deleted like
+        tables = [
+            model._meta.db_table
+            for label in ("store", "tags", "likes", "search")
+            for model in apps.get_app_config(label).get_models(
+                include_auto_created=True
             )
-            product.promotions.set(product_promotions)
-            products.append(product)
-
-        # Update featured product for some collections
-        for collection in collections:
-            if (
-                random.random() < 0.5 and products
-            ):  # 50% chance to have a featured product
-                collection.featured_product = random.choice(products)
-                collection.save()
-
-        # Retrieve Customers
-        # Customer is created by signal when User is created
-        customers = Customer.objects.all()
-
-        # Update Customers and create Addresses
-        for customer in customers:
-            customer.phone = fake.phone_number()
-            customer.birth_date = fake.date_of_birth(
-                minimum_age=18, maximum_age=90
+        ]
+        with connection.constraint_checks_disabled():
+            connection.ops.execute_sql_flush(
+                connection.ops.sql_flush(no_style(), tables)
             )
-            customer.membership = random.choice(
+        User.objects.filter(is_superuser=False).delete()
+
+    @transaction.atomic()
+    def create_users(self) -> list[int]:
+        # Hashing once instead of per user, all mock users have the same
+        # password
+        password = make_password("Pass@123")
+        start = (User.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+        total = self.count(USERS)
+
+        for chunk in self.generate(fake_users, total):
+            self.bulk_create(
+                User,
                 [
-                    Customer.MEMBERSHIP_BRONZE,
-                    Customer.MEMBERSHIP_SILVER,
-                    Customer.MEMBERSHIP_GOLD,
-                ]
+                    User(
+                        id=start + id,
+                        username=username,
+                        first_name=first_name,
+                        last_name=last_name,
+                        email=email,
+                        password=password,
+                    )
+                    for id, username, first_name, last_name, email in chunk
+                ],
             )
-            customer.save()
+        self.report(User, total)
+        return list(range(start, start + total))
 
-            Address.objects.create(
-                street=fake.street_address(),
-                city=fake.city(),
-                zip=fake.postcode()[:50],
-                customer=customer,
-            )
+    @transaction.atomic()
+    def create_customers(self, users: list[int]) -> list[int]:
+        # Customers are normally created by a signal, which bulk_create
+        # doesn't send
+        memberships = [
+            Customer.MEMBERSHIP_BRONZE,
+            Customer.MEMBERSHIP_SILVER,
+            Customer.MEMBERSHIP_GOLD,
+        ]
+        customer_id = 1
+
+        for chunk in self.generate(fake_customers, len(users)):
+            customers = []
+            addresses = []
+            for phone, birth_date, street, city, zip in chunk:
+                customers.append(
+                    Customer(
+                        id=customer_id,
+                        user_id=users[customer_id - 1],
+                        phone=phone,
+                        birth_date=birth_date,
+                        membership=self.rng.choice(memberships),
+                    )
+                )
+                addresses.append(
+                    Address(
+                        customer_id=customer_id,
+                        street=street,
+                        city=city,
+                        zip=zip,
+                    )
+                )
+                customer_id += 1
+            self.bulk_create(Customer, customers)
+            self.bulk_create(Address, addresses)
+        self.report(Customer, len(users))
+        return list(range(1, customer_id))
+
+    @transaction.atomic()
+    def create_promotions(self) -> list[int]:
+        total = self.count(PROMOTIONS)
+        self.bulk_create(
+            Promotion,
+            [
+                Promotion(
+                    id=id,
+                    description=self.fake.catch_phrase(),
+                    discount=round(self.rng.uniform(5, 20), 2),
+                )
+                for id in range(1, total + 1)
+            ],
+        )
+        self.report(Promotion, total)
+        return list(range(1, total + 1))
 
-        # Create Reviews
-        reviews = []
-        for _ in range(1000):
-            review = Review.objects.create(
-                description=fake.paragraph(),
-                product=random.choice(products),
-                customer=random.choice(customers),
+    @transaction.atomic()
+    def create_collections(self) -> list[int]:
+        total = self.count(COLLECTIONS)
+        self.bulk_create(
+            Collection,
+            [
+                Collection(id=id, title=self.fake.ecommerce_category())
+                for id in range(1, total + 1)
+            ],
+        )
+        self.report(Collection, total)
+        return list(range(1, total + 1))
+
+    @transaction.atomic()
+    def create_products(
+        self, collections: list[int], promotions: list[int]
+    ) -> dict:
+        # Maps product ids to prices, needed for order items
+        prices = {}
+        ProductPromotion = Product.promotions.through
+        product_id = 1
+
+        for chunk in self.generate(fake_products, self.count(PRODUCTS)):
+            products = []
+            product_promotions = []
+            for title, description, price, inventory in chunk:
+                products.append(
+                    Product(
+                        id=product_id,
+                        title=title,
+                        slug=f"{slugify(title)}-{product_id}",
+                        description=description,
+                        price=price,
+                        inventory=inventory,
+                        collection_id=self.rng.choice(collections),
+                    )
+                )
+                product_promotions.extend(
+                    ProductPromotion(
+                        product_id=product_id, promotion_id=promotion_id
+                    )
+                    for promotion_id in self.rng.sample(
+                        promotions,
+                        self.rng.randint(0, min(PROMOTIONS, len(promotions))),
+                    )
+                )
+                prices[product_id] = price
+                product_id += 1
+            self.bulk_create(Product, products)
+            self.bulk_create(ProductPromotion, product_promotions)
+
+        # 50% chance for a collection to have a featured product
+        featured = [
+            Collection(
+                id=id, featured_product_id=self.rng.randint(1, len(prices))
             )
-            reviews.append(review)
-
-        # Create Orders
-        orders = []
-        for _ in range(30):
-            order = Order.objects.create(
-                customer=random.choice(customers),
-                payment_status=random.choice(
-                    [
-                        Order.PAYMENT_PENDING,
-                        Order.PAYMENT_COMPLETE,
-                        Order.PAYMENT_FAILED,
-                    ]
-                ),
+            for id in collections
+            if self.rng.random() < 0.5
+        ]
+        Collection.objects.bulk_update(
+            featured, ["featured_product"], batch_size=self.batch_size
+        )
+        self.report(Product, len(prices))
+        return prices
+
+    @transaction.atomic()
+    def create_reviews(self):
+        total = self.count(REVIEWS)
+
+        for chunk in self.generate(fake_paragraphs, total):
+            self.bulk_create(
+                Review,
+                [
+                    Review(
+                        description=description,
+                        product_id=product_id,
+                        customer_id=customer_id,
+                    )
+                    for description, product_id, customer_id in zip(
+                        chunk,
+                        self.popular_products.choices(len(chunk)),
+                        self.popular_customers.choices(len(chunk)),
+                    )
+                ],
             )
-            orders.append(order)
-
-        # Create OrderItems
-        for order in orders:
-            num_items = random.randint(1, 5)
-            selected_products = random.sample(products, num_items)
-            for product in selected_products:
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=random.randint(1, 10),
-                    # Use product's price at the time of order
-                    unit_price=product.price,
+        self.report(Review, total)
+
+    @transaction.atomic()
+    def create_orders(self, products: dict):
+        statuses = [
+            Order.PAYMENT_PENDING,
+            Order.PAYMENT_COMPLETE,
+            Order.PAYMENT_FAILED,
+        ]
+        total = self.count(ORDERS)
+
+        for start in range(1, total + 1, self.batch_size):
+            orders = []
+            order_items = []
+            for order_id in range(
+                start, min(start + self.batch_size, total + 1)
+            ):
+                orders.append(
+                    Order(
+                        id=order_id,
+                        customer_id=self.popular_customers.choice(),
+                        payment_status=self.rng.choice(statuses),
+                    )
                 )
+                order_items.extend(
+                    OrderItem(
+                        order_id=order_id,
+                        product_id=product_id,
+                        quantity=self.rng.randint(1, 10),
+                        # Use product's price at the time of order
+                        unit_price=products[product_id],
+                    )
+                    for product_id in self.popular_products.sample(
+                        self.rng.randint(1, 5)
+                    )
+                )
+            self.bulk_create(Order, orders)
+            self.bulk_create(OrderItem, order_items)
+        self.report(Order, total)
+
+    @transaction.atomic()
+    def create_carts(self):
+        total = self.count(CARTS)
 
-        # Create Carts and CartItems
-        carts = []
-        for _ in range(20):
-            cart = Cart.objects.create()
-            carts.append(cart)
-
-            num_items = random.randint(1, 5)
-            selected_products = random.sample(products, num_items)
-            for product in selected_products:
-                CartItem.objects.create(
-                    cart=cart, product=product, quantity=random.randint(1, 5)
+        for start in range(0, total, self.batch_size):
+            carts = []
+            cart_items = []
+            for _ in range(min(self.batch_size, total - start)):
+                cart = Cart(id=uuid.UUID(int=self.rng.getrandbits(128)))
+                carts.append(cart)
+                cart_items.extend(
+                    CartItem(
+                        cart_id=cart.id,
+                        product_id=product_id,
+                        quantity=self.rng.randint(1, 5),
+                    )
+                    for product_id in self.popular_products.sample(
+                        self.rng.randint(1, 5)
+                    )
                 )
+            self.bulk_create(Cart, carts)
+            self.bulk_create(CartItem, cart_items)
+        self.report(Cart, total)
 
-        # Create Tags
-        tags = []
-        for _ in range(15):
-            tag = Tag.objects.create(label=fake.unique.word().capitalize())
-            tags.append(tag)
+    @transaction.atomic()
+    def create_tags(self, products: dict, collections: list[int]):
+        labels = {}
+        while len(labels) < self.count(TAGS):
+            label = self.fake.word().capitalize()
+            if label in labels:
+                label = f"{label}{len(labels)}"
+            labels[label] = None
+
+        tags = [Tag(id=id, label=label) for id, label in enumerate(labels, 1)]
+        self.bulk_create(Tag, tags)
+        popular_tags = Popularity(
+            [tag.id for tag in tags], self.skew, self.rng
+        )
 
-        # Create TaggedItems for Products and Collections
         product_content_type = ContentType.objects.get_for_model(Product)
         collection_content_type = ContentType.objects.get_for_model(Collection)
+        tagged_items = []
+        # 70% chance for a product and 40% for a collection to have tags
+        for content_type, ids, chance, most in [
+            (product_content_type, products, 0.7, 3),
+            (collection_content_type, collections, 0.4, 2),
+        ]:
+            for id in ids:
+                if self.rng.random() >= chance:
+                    continue
 
-        for product in products:
-            if random.random() < 0.7 and tags:  # 70% chance to have tags
-                selected_tags = random.sample(
-                    tags, random.randint(1, min(3, len(tags)))
-                )
-                for tag in selected_tags:
-                    TaggedItem.objects.create(
-                        tag=tag,
-                        content_type=product_content_type,
-                        object_id=product.id,
+                tagged_items.extend(
+                    TaggedItem(
+                        tag_id=tag_id,
+                        content_type=content_type,
+                        object_id=id,
                     )
+                    for tag_id in popular_tags.sample(
+                        self.rng.randint(1, most)
+                    )
+                )
+                if len(tagged_items) >= self.batch_size:
+                    self.bulk_create(TaggedItem, tagged_items)
+                    tagged_items = []
+        self.bulk_create(TaggedItem, tagged_items)
+        self.report(Tag, len(tags))
 
-        for collection in collections:
-            if random.random() < 0.4 and tags:  # 40% chance to have tags
-                selected_tags = random.sample(
-                    tags, random.randint(1, min(2, len(tags)))
+    @transaction.atomic()
+    def create_likes(self, users: list[int]):
+        content_type = ContentType.objects.get_for_model(Product)
+        liked_items = []
+
+        for user_id in users:
+            # 80% chance to like some products
+            if self.rng.random() >= 0.8:
+                continue
+
+            liked_items.extend(
+                LikedItem(
+                    user_id=user_id,
+                    content_type=content_type,
+                    object_id=product_id,
                 )
-                for tag in selected_tags:
-                    TaggedItem.objects.create(
-                        tag=tag,
-                        content_type=collection_content_type,
-                        object_id=collection.id,
-                    )
-
-        # Create LikedItems for Products
-        for user in users:
-            if (
-                random.random() < 0.8 and products
-            ):  # 80% chance to like some products
-                num_likes = random.randint(1, 5)
-                liked_products = random.sample(products, num_likes)
-                for product in liked_products:
-                    LikedItem.objects.create(
-                        user=user,
-                        content_type=product_content_type,
-                        object_id=product.id,
-                    )
+                for product_id in self.popular_products.sample(
+                    self.rng.randint(1, 5)
+                )
+            )
+            if len(liked_items) >= self.batch_size:
+                self.bulk_create(LikedItem, liked_items)
+                liked_items = []
+        self.bulk_create(LikedItem, liked_items)
 
-        self.stdout.write(
-            self.style.SUCCESS("Mock data generated successfully!")
+        # Like counters are kept by signals, which bulk_create doesn't send
+        Product.objects.update(
+            likes_count=Coalesce(
+                Subquery(
+                    LikedItem.objects.filter(
+                        content_type=content_type, object_id=OuterRef("pk")
+                    )
+                    .values("object_id")
+                    .annotate(count=Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
         )
+        self.report(LikedItem, LikedItem.objects.count())
@@ -0,0 +1,90 @@
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarizes the slow query log: the query shapes that took the most "
+        "total time, with the views and serializers that ran them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log",
+            default=settings.SLOW_QUERY_LOG,
+            help="Slow query log to read, rotated files included.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of query shapes to show.",
+        )
+        parser.add_argument(
+            "--plans",
+            action="store_true",
+            help="Shows the EXPLAIN plan of the slowest sample of each.",
+        )
+
+    def handle(self, *args, **options):
+        log = Path(options["log"])
+        files = sorted(
+            log.parent.glob(f"{log.name}*"), key=lambda path: path.name
+        )
+        if not files:
+            raise CommandError(f"No slow query log found at {log}")
+
+        queries = defaultdict(
+            lambda: {
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "views": Counter(),
+                "serializers": Counter(),
+                "plan": None,
+            }
+        )
+        for path in files:
+            with open(path) as file:
+                for line in file:
+                    record = json.loads(line)
+                    query = queries[record["sql"]]
+                    query["count"] += 1
+                    query["total_ms"] += record["duration_ms"]
+                    query["views"][record["view"]] += 1
+                    query["serializers"][record["serializer"]] += 1
+                    if record["duration_ms"] >= query["max_ms"]:
+                        query["max_ms"] = record["duration_ms"]
+                        query["plan"] = record.get("plan")
+
+        ranked = sorted(
+            queries.items(), key=lambda item: item[1]["total_ms"], reverse=True
+        )
+        for rank, (sql, query) in enumerate(ranked[: options["top"]], 1):
+            self.stdout.write(
+                self.style.WARNING(
+                    f"#{rank} {query['total_ms']:.1f} ms total, "
+                    f"{query['count']} samples, "
+                    f"{query['total_ms'] / query['count']:.1f} ms avg, "
+                    f"{query['max_ms']:.1f} ms max"
+                )
+            )
+            self.stdout.write(f"  views: {self.most_common(query['views'])}")
+            self.stdout.write(
+                f"  serializers: {self.most_common(query['serializers'])}"
+            )
+            self.stdout.write(f"  {sql}")
+            if options["plans"] and query["plan"]:
+                for row in query["plan"]:
+                    self.stdout.write(f"    {row}")
+            self.stdout.write("")
+
+    def most_common(self, counter: Counter) -> str:
+        return ", ".join(
+            f"{name or '-'} ({count})"
+            for name, count in counter.most_common(3)
+        )
@@ -0,0 +1,85 @@
+import random
+from decimal import Decimal
+
+import faker_commerce
+from faker import Faker
+
+
+def get_faker(seed: int) -> Faker:
+    fake = Faker()
+    fake.add_provider(faker_commerce.Provider)
+    fake.seed_instance(seed)
+    return fake
+
+
+def product_name(fake: Faker) -> str:
+    # Like fake.ecommerce_name(), which picks one of these shapes with the
+    # global random module, so seeding the faker doesn't make it repeatable
+    product = fake.random_element(faker_commerce.PRODUCT_DATA["product"])
+    adjective = fake.random_element(faker_commerce.PRODUCT_DATA["adjective"])
+    material = fake.random_element(faker_commerce.PRODUCT_DATA["material"])
+    return fake.random_element(
+        [
+            product,
+            f"{adjective} {product}",
+            f"{material} {product}",
+            f"{adjective} {material} {product}",
+        ]
+    )
+
+
+def generate(task: tuple) -> list[tuple]:
+    # Unpacks a (function, seed, start, count) task for Pool.imap()
+    function, seed, start, count = task
+    return function(seed, start, count)
+
+
+def fake_users(seed: int, start: int, count: int) -> list[tuple]:
+    fake = get_faker(seed)
+    users = []
+    for id in range(start, start + count):
+        # Suffixing the id keeps usernames and emails unique at any scale
+        username = f"{fake.user_name()}{id}"
+        users.append(
+            (
+                id,
+                username,
+                fake.first_name(),
+                fake.last_name(),
+                f"{username}@{fake.free_email_domain()}",
+            )
+        )
+    return users
+
+
+def fake_customers(seed: int, start: int, count: int) -> list[tuple]:
+    fake = get_faker(seed)
+    return [
+        (
+            fake.phone_number(),
+            fake.date_of_birth(minimum_age=18, maximum_age=90),
+            fake.street_address(),
+            fake.city(),
+            fake.postcode()[:50],
+        )
+        for _ in range(count)
+    ]
+
+
+def fake_products(seed: int, start: int, count: int) -> list[tuple]:
+    fake = get_faker(seed)
+    rng = random.Random(seed)
+    return [
+        (
+            product_name(fake),
+            fake.paragraph(),
+            Decimal(f"{rng.uniform(10, 9999.99):.2f}"),
+            rng.randint(0, 100),
+        )
+        for _ in range(count)
+    ]
+
+
+def fake_paragraphs(seed: int, start: int, count: int) -> list[str]:
+    fake = get_faker(seed)
+    return [fake.paragraph() for _ in range(count)]
@@ -0,0 +1,107 @@
+import datetime
+import decimal
+import uuid
+
+from django.apps import apps
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_APPS = ["core", "store", "tags", "likes"]
+MANIFEST = "manifest.json"
+
+# Models outside the snapshot apps that snapshot tables point to, such as
+# users' groups. Their ids differ between databases, so the manifest keeps
+# their natural keys and loading maps them to the local ids.
+MAPPED_MODELS = [ContentType, Group, Permission]
+
+
+def get_snapshot_models() -> list:
+    # Models of the snapshot apps, including many-to-many tables, whose
+    # foreign keys all point inside the snapshot or to MAPPED_MODELS
+    models = [
+        model
+        for label in SNAPSHOT_APPS
+        for model in apps.get_app_config(label).get_models(
+            include_auto_created=True
+        )
+    ]
+    models = [
+        model
+        for model in models
+        if all(
+            field.related_model in models
+            or field.related_model in MAPPED_MODELS
+            for field in model._meta.concrete_fields
+            if field.is_relation
+        )
+    ]
+    return sort_dependencies(models)
+
+
+def sort_dependencies(models: list) -> list:
+    # Orders models so that foreign key targets come first. Cycles, like
+    # Collection.featured_product, are broken in the original order and
+    # rely on foreign key checks being deferred.
+    dependencies = {
+        model: {
+            field.related_model
+            for field in model._meta.concrete_fields
+            if field.is_relation
+            and field.related_model in models
+            and field.related_model is not model
+        }
+        for model in models
+    }
+    ordered = []
+    while dependencies:
+        ready = [
+            model
+            for model, targets in dependencies.items()
+            if not targets - set(ordered)
+        ] or [next(iter(dependencies))]
+        for model in ready:
+            ordered.append(model)
+            del dependencies[model]
+    return ordered
+
+
+def get_referencing_models(models: list) -> list:
+    # Models outside the snapshot that point to it, like the admin log,
+    # which have to be emptied along with the snapshot tables
+    return [
+        model
+        for model in apps.get_models(include_auto_created=True)
+        if model not in models
+        and any(
+            field.related_model in models
+            for field in model._meta.concrete_fields
+            if field.is_relation
+        )
+    ]
+
+
+def get_natural_keys() -> dict[str, dict]:
+    return {
+        "content_types": {
+            content_type.id: f"{content_type.app_label}.{content_type.model}"
+            for content_type in ContentType.objects.all()
+        },
+        "groups": {group.id: group.name for group in Group.objects.all()},
+        "permissions": {
+            permission.id: [
+                permission.content_type.app_label,
+                permission.content_type.model,
+                permission.codename,
+            ]
+            for permission in Permission.objects.select_related("content_type")
+        },
+    }
+
+
+def encode_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
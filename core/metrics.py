@@ -0,0 +1,331 @@
+import fcntl
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+
+# Upper bounds of the latency histograms, in seconds
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"'),
+        )
+        for name, value in labels.items()
+    )
+    return f"{{{pairs}}}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, "
+                f"got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def expose(self, values: dict) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for key in sorted(values):
+            lines.extend(
+                self.samples(dict(zip(self.labelnames, key)), values[key])
+            )
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def samples(self, labels: dict, value) -> list[str]:
+        return [f"{self.name}{format_labels(labels)} {format_value(value)}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            # Bucket counts are stored per bucket and summed on exposition
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def dump(self) -> list:
+        with self.lock:
+            return [
+                [list(key), [list(counts), total]]
+                for key, (counts, total) in self.values.items()
+            ]
+
+    def merge(self, current, value):
+        counts, total = value
+        if current is None:
+            return list(counts), total
+        return [a + b for a, b in zip(current[0], counts)], current[1] + total
+
+    def samples(self, labels: dict, value) -> list[str]:
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            bucket_labels = format_labels(
+                {**labels, "le": format_value(bound)}
+            )
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(
+            f"{self.name}_sum{format_labels(labels)} {format_value(total)}"
+        )
+        lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Keeps the metrics of this process. When `directory` is set, every
+    process writes its values to its own file there, and exposition adds
+    up the files of all processes, so any worker can answer a scrape.
+
+    The files of processes that exited are folded into a totals file on
+    exposition, so their counts neither pile up in files nor go missing.
+    Files are named after the host, the pid and the time the process first
+    wrote, so a process reusing a pid doesn't overwrite its predecessor's
+    counts. Whether a pid is still running can only be told on its own
+    host, or container, so a directory shared between them only has the
+    files of the scraped host folded.
+    """
+
+    totals_name = "totals.json"
+
+    def __init__(self, directory: str = None, flush_interval: float = 1.0):
+        self.metrics = {}
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.flushed_at = 0.0
+        self.lock = threading.Lock()
+        self.pid = None
+        self.path = None
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), **kw):
+        return self.register(Histogram(name, documentation, labelnames, **kw))
+
+    def dump(self) -> dict[str, list]:
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def flush(self):
+        if self.directory is None:
+            return
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self.pid != os.getpid():
+                # First write of this process, or of a forked child
+                self.pid = os.getpid()
+                self.path = self.directory / (
+                    f"metrics-{socket.gethostname()}-{self.pid}-"
+                    f"{time.time_ns()}.json"
+                )
+            self.write(self.path, self.dump())
+            self.flushed_at = time.monotonic()
+
+    def write(self, path: Path, dump: dict):
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(dump))
+        # Readers only ever see a complete file
+        os.replace(temporary, path)
+
+    def flush_if_due(self):
+        if time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def collect(self) -> dict[str, dict]:
+        if self.directory is None:
+            return self.merge([self.dump()])
+
+        self.flush()
+        # Scrapes of several workers take turns folding and reading
+        with open(self.directory / "metrics.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.fold_exited_processes()
+            return self.merge(
+                [
+                    json.loads(path.read_text())
+                    for path in self.directory.glob("*.json")
+                ]
+            )
+
+    def fold_exited_processes(self):
+        exited = []
+        for path in self.directory.glob("metrics-*.json"):
+            # Host names can contain dashes, but pids and times can't
+            host, pid, _ = path.stem.removeprefix("metrics-").rsplit("-", 2)
+            if host == socket.gethostname() and not process_exists(int(pid)):
+                exited.append(path)
+        if not exited:
+            return
+
+        totals = self.directory / self.totals_name
+        dumps = [json.loads(path.read_text()) for path in exited]
+        if totals.exists():
+            dumps.append(json.loads(totals.read_text()))
+        self.write(
+            totals,
+            {
+                name: [[list(key), value] for key, value in values.items()]
+                for name, values in self.merge(dumps).items()
+            },
+        )
+        for path in exited:
+            path.unlink()
+
+    def merge(self, dumps: list[dict]) -> dict[str, dict]:
+        collected = {name: {} for name in self.metrics}
+        for dump in dumps:
+            for name, values in dump.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in values:
+                    key = tuple(key)
+                    collected[name][key] = metric.merge(
+                        collected[name].get(key), value
+                    )
+        return collected
+
+    def expose(self) -> str:
+        lines = []
+        for name, values in self.collect().items():
+            lines.extend(self.metrics[name].expose(values))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry(settings.METRICS_DIR)
+
+request_duration = registry.histogram(
+    "nexa_http_request_duration_seconds",
+    "Time spent handling requests.",
+    ["method", "route", "status"],
+)
+db_queries = registry.counter(
+    "nexa_db_queries_total",
+    "Database queries run by requests.",
+    ["route"],
+)
+db_query_duration = registry.counter(
+    "nexa_db_query_duration_seconds_total",
+    "Time requests spent waiting on the database.",
+    ["route"],
+)
+checkouts = registry.counter(
+    "nexa_checkouts_total",
+    "Orders placed from a cart.",
+    ["result"],
+)
+cart_operations = registry.counter(
+    "nexa_cart_operations_total",
+    "Changes made to carts and their items.",
+    ["operation"],
+)
+throttled_requests = registry.counter(
+    "nexa_throttled_requests_total",
+    "Requests rejected for exceeding their throttle scope's rate.",
+    ["scope"],
+)
+shed_requests = registry.counter(
+    "nexa_shed_requests_total",
+    "Requests rejected by the load shedder.",
+    ["priority"],
+)
+cache_lookups = registry.counter(
+    "nexa_cache_lookups_total",
+    "Lookups in application caches.",
+    ["cache", "result"],
+)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
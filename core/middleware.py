@@ -0,0 +1,432 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+
+from core import metrics
+from core.queries import NPlusOneDetector, SlowQueryLogger
+from core.routers import replica_reads
+
+logger = logging.getLogger("nexa.requests")
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.view = 0.0
+        self.render = 0.0
+        self.view_started = None
+        self.render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def header(self, total: float) -> str:
+        # Durations are in milliseconds. The app time is what the view spent
+        # outside the database, which for the API is mostly serialization
+        return ", ".join(
+            [
+                f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+                f"app;dur={max(self.view - self.db, 0) * 1000:.2f}",
+                f"render;dur={self.render * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header with the SQL query count, database, view and
+    render time of every request, and logs a sample of them as JSON lines.
+
+    Disabled unless SERVER_TIMING_ENABLED is set, in which case Django drops
+    it from the middleware chain.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        request.timings = timings
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            response = self.get_response(request)
+
+        total = time.perf_counter() - timings.started
+        if timings.view_started is not None and not timings.view:
+            timings.view = time.perf_counter() - timings.view_started
+        response["Server-Timing"] = timings.header(total)
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            self.log(request, response, timings, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns
+        timings = request.timings
+        if timings.view_started is not None:
+            timings.view = time.perf_counter() - timings.view_started
+        timings.render_started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: self.rendered(timings)
+        )
+        return response
+
+    def rendered(self, timings: RequestTimings):
+        timings.render = time.perf_counter() - timings.render_started
+
+    def log(self, request, response, timings: RequestTimings, total: float):
+        match = request.resolver_match
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "route": match.route if match else None,
+                    "status": response.status_code,
+                    "queries": timings.queries,
+                    "db_ms": round(timings.db * 1000, 2),
+                    "view_ms": round(timings.view * 1000, 2),
+                    "render_ms": round(timings.render * 1000, 2),
+                    "total_ms": round(total * 1000, 2),
+                }
+            )
+        )
+
+
+class NPlusOneMiddleware:
+    """
+    Logs, or raises with NPLUSONE_DETECTION = "raise", when a request runs
+    the same query from the same line more than NPLUSONE_THRESHOLD times.
+
+    Meant for development; disabled unless NPLUSONE_DETECTION is set.
+    """
+
+    def __init__(self, get_response):
+        if settings.NPLUSONE_DETECTION not in ("log", "raise"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        detector = NPlusOneDetector()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(detector))
+            return self.get_response(request)
+
+
+class SlowQueryMiddleware:
+    """
+    Samples the queries of each request that run longer than
+    SLOW_QUERY_THRESHOLD_MS into the slow query log, with the view that ran
+    them. Disabled when the threshold is not set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.slow_query_loggers = [
+            (connection, SlowQueryLogger(connection.alias))
+            for connection in connections.all()
+        ]
+        with ExitStack() as stack:
+            for connection, wrapper in request.slow_query_loggers:
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = request.resolver_match.view_name or (
+            f"{view_func.__module__}.{view_func.__qualname__}"
+        )
+        for _, wrapper in request.slow_query_loggers:
+            wrapper.view = view
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, query count and database time of every request
+    per route in the metrics registry served at /metrics.
+
+    Async requests only record their latency: their queries run on worker
+    threads, out of reach of this thread's execute wrappers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timings = RequestTimings()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            response = self.get_response(request)
+        self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        response = await self.get_response(request)
+        self.record(request, response, timings, queries=False)
+        return response
+
+    def record(self, request, response, timings, queries=True):
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else "unmatched"
+        metrics.request_duration.observe(
+            time.perf_counter() - timings.started,
+            method=request.method,
+            route=route,
+            status=response.status_code,
+        )
+        if queries:
+            metrics.db_queries.inc(timings.queries, route=route)
+            metrics.db_query_duration.inc(timings.db, route=route)
+        metrics.registry.flush_if_due()
+
+
+class ReplicaMiddleware:
+    """
+    Lets safe requests read from the replicas, and keeps a client's reads
+    on the primary for REPLICA_STICKY_SECONDS after it made a write, so it
+    sees its own carts and orders despite replication lag.
+
+    The deadline is sent back both as a cookie and as the X-Primary-Until
+    header, which API clients that don't keep cookies can echo.
+    """
+
+    cookie = "primary_until"
+    header = "X-Primary-Until"
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        token = replica_reads.set(self.allows_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        token = replica_reads.set(self.allows_replicas(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.stick(request, response)
+
+    def allows_replicas(self, request) -> bool:
+        return request.method in SAFE_METHODS and not self.is_sticky(request)
+
+    def stick(self, request, response):
+        if request.method not in SAFE_METHODS:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            until = str(int(time.time() + seconds))
+            response.set_cookie(
+                self.cookie,
+                until,
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+            response[self.header] = until
+        return response
+
+    def is_sticky(self, request) -> bool:
+        until = request.COOKIES.get(self.cookie) or request.headers.get(
+            self.header
+        )
+        try:
+            return int(until) > time.time()
+        except (TypeError, ValueError):
+            return False
+
+
+class LatencyAverage:
+    """
+    Exponentially weighted moving average of query durations, used as an
+    execute wrapper. It decays while no queries run, so a process whose
+    requests are all shed still recovers.
+    """
+
+    alpha = 0.1
+    half_life = 1.0
+
+    def __init__(self):
+        self.average = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add(time.perf_counter() - started)
+
+    def add(self, seconds: float):
+        with self.lock:
+            now = time.monotonic()
+            self.average = self.alpha * seconds + (
+                1 - self.alpha
+            ) * self.decayed(now)
+            self.updated = now
+
+    def decayed(self, now: float) -> float:
+        return self.average * 0.5 ** ((now - self.updated) / self.half_life)
+
+    def value(self) -> float:
+        return self.decayed(time.monotonic())
+
+
+class LoadSheddingMiddleware:
+    """
+    Answers 503 while the process is overloaded, starting with the
+    requests that matter least, so checkout keeps its database connections
+    when the catalog is hammered.
+
+    The load is the larger of the requests in flight in the process over
+    LOAD_SHEDDING_MAX_IN_FLIGHT, which only means something with threaded
+    or async workers, and the average query latency over
+    LOAD_SHEDDING_DB_LATENCY_MS. Views set a `load_shedding_priority`:
+    "low" reads are shed from a load of 1, "normal" requests, the default,
+    from 2, and "high" ones never. Writes are never treated as low.
+    Viewsets can give some actions another priority with
+    `load_shedding_priorities`, such as {"create": "high"}.
+
+    Disabled unless one of the thresholds is set. Async requests only
+    count as in flight: their queries run on worker threads, out of reach
+    of this thread's execute wrappers.
+    """
+
+    shed_from = {"low": 1.0, "normal": 2.0}
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.max_in_flight = settings.LOAD_SHEDDING_MAX_IN_FLIGHT
+        self.max_latency = settings.LOAD_SHEDDING_DB_LATENCY_MS / 1000
+        if not self.max_in_flight and not self.max_latency:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.latency = LatencyAverage()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        self.started()
+        try:
+            with ExitStack() as stack:
+                if self.max_latency:
+                    for connection in connections.all():
+                        stack.enter_context(
+                            connection.execute_wrapper(self.latency)
+                        )
+                return self.get_response(request)
+        finally:
+            self.finished()
+
+    async def __acall__(self, request):
+        self.started()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.finished()
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def load(self) -> float:
+        load = 0.0
+        if self.max_in_flight:
+            load = self.in_flight / self.max_in_flight
+        if self.max_latency:
+            load = max(load, self.latency.value() / self.max_latency)
+        return load
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        priority = self.priority(request, view_func)
+        shed_from = self.shed_from.get(priority)
+        if shed_from is None or self.load() < shed_from:
+            return None
+
+        metrics.shed_requests.inc(priority=priority)
+        return JsonResponse(
+            {"detail": "The server is overloaded, try again shortly."},
+            status=503,
+            headers={"Retry-After": "1"},
+        )
+
+    def priority(self, request, view_func) -> str:
+        view = getattr(view_func, "cls", view_func)
+        action = getattr(view_func, "actions", {}).get(request.method.lower())
+        priority = getattr(view, "load_shedding_priorities", {}).get(
+            action, getattr(view, "load_shedding_priority", "normal")
+        )
+        if priority == "low" and request.method not in SAFE_METHODS:
+            return "normal"
+        return priority
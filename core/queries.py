@@ -0,0 +1,229 @@
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+logger = logging.getLogger("nexa.queries")
+
+# Frames from the execute wrappers and Django's database layer are never
+# reported as the call site
+IGNORED_PATHS = (
+    str(Path(__file__).resolve()),
+    str(Path(__file__).resolve().with_name("middleware.py")),
+    "/django/db/",
+)
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def normalize_sql(sql: str) -> str:
+    # Parameters are already placeholders, only the length of IN lists and
+    # the whitespace differ between queries of the same shape
+    return WHITESPACE.sub(" ", IN_LIST.sub("IN (...)", sql)).strip()
+
+
+def is_project_frame(filename: str) -> bool:
+    return filename.startswith(str(settings.BASE_DIR)) and not any(
+        part in filename for part in ("site-packages", "dist-packages")
+    )
+
+
+class NPlusOneDetector:
+    """
+    Execute wrapper that counts queries of the same shape issued from the
+    same line of code, and reports a fingerprint once it repeats more than
+    `threshold` times.
+
+    The call site is the innermost frame outside Django's database layer,
+    which is the line doing the lazy load: a model method, a serializer or
+    a DRF field reading a relation of a nested serializer.
+    """
+
+    def __init__(self, threshold: int = None, raise_error: bool = None):
+        self.threshold = (
+            settings.NPLUSONE_THRESHOLD if threshold is None else threshold
+        )
+        self.raise_error = (
+            settings.NPLUSONE_DETECTION == "raise"
+            if raise_error is None
+            else raise_error
+        )
+        self.counts = Counter()
+        self.reported = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Source lines are only read when a report is formatted
+        stack = traceback.StackSummary.extract(
+            traceback.walk_stack(None), lookup_lines=False
+        )
+        stack.reverse()
+        fingerprint = (normalize_sql(sql), self.call_site(stack))
+        self.counts[fingerprint] += 1
+        if (
+            self.counts[fingerprint] > self.threshold
+            and fingerprint not in self.reported
+        ):
+            self.reported.add(fingerprint)
+            self.report(fingerprint, stack)
+        return execute(sql, params, many, context)
+
+    def call_site(self, stack) -> tuple[str, int]:
+        frames = [
+            frame
+            for frame in stack
+            if not any(path in frame.filename for path in IGNORED_PATHS)
+        ]
+        frame = frames[-1] if frames else stack[-1]
+        return frame.filename, frame.lineno
+
+    def report(self, fingerprint, stack):
+        sql, (filename, lineno) = fingerprint
+        frames = [
+            frame
+            for frame in stack
+            if is_project_frame(frame.filename)
+            and not any(path in frame.filename for path in IGNORED_PATHS)
+        ]
+        message = (
+            f"Possible N+1 query: the same query ran more than "
+            f"{self.threshold} times from {filename}:{lineno}\n"
+            f"{sql}\n" + "".join(traceback.format_list(frames or stack))
+        )
+        if self.raise_error:
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+
+@contextmanager
+def detect_n_plus_one(threshold: int = None, raise_error: bool = True):
+    """
+    Watches every database connection of the current thread, for use in
+    tests and shells. Raises NPlusOneError by default.
+    """
+    detector = NPlusOneDetector(threshold, raise_error)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(detector))
+        yield detector
+
+
+slow_query_logger = logging.getLogger("nexa.slow_queries")
+explain_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="explain"
+)
+# Slow queries waiting for their EXPLAIN at most. Past that, while the
+# database is too slow to keep up, they are logged without a plan
+MAX_PENDING_EXPLAINS = 100
+pending_explains = threading.BoundedSemaphore(MAX_PENDING_EXPLAINS)
+
+
+def find_serializer() -> str | None:
+    # Name of the innermost serializer on the stack, if any
+    frame = sys._getframe(2)
+    while frame is not None:
+        instance = frame.f_locals.get("self")
+        if isinstance(instance, ListSerializer):
+            instance = instance.child
+        if isinstance(instance, BaseSerializer):
+            return type(instance).__qualname__
+        frame = frame.f_back
+    return None
+
+
+def explain(alias: str, sql: str, params) -> list[str] | None:
+    # Runs on the executor thread, which has its own connection
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"{connection.ops.explain_query_prefix()} {sql}", params
+            )
+            return [
+                " ".join(str(column) for column in row)
+                for row in cursor.fetchall()
+            ]
+    except DatabaseError:
+        return None
+    finally:
+        connection.close()
+
+
+def write_slow_query(record: dict, params):
+    try:
+        if record["sql"].startswith("SELECT") and not record["many"]:
+            record["plan"] = explain(
+                record["alias"], record["raw_sql"], params
+            )
+    finally:
+        pending_explains.release()
+    log_slow_query(record)
+
+
+def log_slow_query(record: dict):
+    del record["raw_sql"]
+    slow_query_logger.info(json.dumps(record))
+
+
+class SlowQueryLogger:
+    """
+    Execute wrapper that samples queries slower than SLOW_QUERY_THRESHOLD_MS
+    and logs them as JSON lines on "nexa.slow_queries", along with the view
+    and serializer that ran them and an EXPLAIN plan.
+
+    The plan is captured and the record written on a background thread, so
+    the request only pays for timing the query. Records that would wait
+    behind MAX_PENDING_EXPLAINS others are written right away, without a
+    plan.
+    """
+
+    def __init__(self, alias: str, view: str = None):
+        self.alias = alias
+        self.view = view
+        self.threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        self.sample_rate = settings.SLOW_QUERY_SAMPLE_RATE
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold and random.random() < (
+                self.sample_rate
+            ):
+                self.record(sql, params, many, duration)
+
+    def record(self, sql: str, params, many: bool, duration: float):
+        record = {
+            "time": timezone.now().isoformat(),
+            "alias": self.alias,
+            "sql": normalize_sql(sql),
+            "raw_sql": sql,
+            "many": many,
+            "duration_ms": round(duration * 1000, 2),
+            "view": self.view,
+            "serializer": find_serializer(),
+        }
+        if pending_explains.acquire(blocking=False):
+            explain_executor.submit(
+                write_slow_query, record, None if many else params
+            )
+        else:
+            log_slow_query(record)
@@ -0,0 +1,44 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set by ReplicaMiddleware for requests that may read from a replica.
+# Everything else, including management commands, reads from the primary.
+replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def use_primary():
+    """Sends the reads of the enclosed block to the primary database."""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a random REPLICA_DATABASES alias when the current
+    request allows it, and everything else to the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and settings.REPLICA_DATABASES:
+            return random.choice(settings.REPLICA_DATABASES)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db == "default"
@@ -1,3 +1,1095 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import re
+import sqlite3
+import uuid
+from decimal import Decimal
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.views import APIView
+
+from core.backends.mysql_pool.pool import ConnectionPool, PoolTimeout
+from core.management.snapshot import get_snapshot_models
+from core.metrics import Registry
+from core.middleware import (
+    LoadSheddingMiddleware,
+    ReplicaMiddleware,
+    ServerTimingMiddleware,
+)
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+from core.models import User
+from core.queries import (
+    NPlusOneError,
+    SlowQueryLogger,
+    detect_n_plus_one,
+    explain_executor,
+    normalize_sql,
+)
+from core.routers import replica_reads, use_primary
+from core.throttling import SlidingWindowThrottle
+from likes.models import LikedItem
+from search import indexes as search_indexes
+from search.models import SearchTerm
+from store import async_views
+from store.models import (
+    Address,
+    Cart,
+    Collection,
+    Customer,
+    Order,
+    OrderItem,
+    Product,
+    Promotion,
+    Review,
+)
+from store.views import CartViewSet, OrderViewSet, ProductViewSet
+from tags.models import Tag, TaggedItem
+
+
+class NPlusOneDetectorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for index in range(4):
+            User.objects.create_user(f"user{index}", f"user{index}@a.com")
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "id"\n  FROM "t" WHERE "id" IN (%s, %s)'),
+            normalize_sql('SELECT "id" FROM "t" WHERE "id" IN (%s)'),
+        )
+
+    def test_repeated_lazy_load_raises(self):
+        with self.assertRaisesMessage(NPlusOneError, "store/models.py"):
+            with detect_n_plus_one(threshold=2):
+                [str(customer) for customer in Customer.objects.all()]
+
+    def test_eager_load_passes(self):
+        customers = Customer.objects.select_related("user")
+        with detect_n_plus_one(threshold=2) as detector:
+            [str(customer) for customer in customers]
+        self.assertEqual(detector.reported, set())
+
+    def test_log_mode(self):
+        with self.assertLogs("nexa.queries", "WARNING"):
+            with detect_n_plus_one(threshold=2, raise_error=False):
+                [str(customer) for customer in Customer.objects.all()]
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_SAMPLE_RATE=1)
+class SlowQueryLoggerTestCase(TestCase):
+    def run_queries(self, function):
+        logger = SlowQueryLogger("default", "collection-list")
+        with connection.execute_wrapper(logger):
+            function()
+        # The executor runs one job at a time, in order
+        explain_executor.submit(lambda: None).result()
+
+    def records(self, function) -> list[dict]:
+        with self.assertLogs("nexa.slow_queries", "INFO") as logs:
+            self.run_queries(function)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_record(self):
+        [record] = self.records(
+            lambda: list(Collection.objects.filter(title="Toys"))
+        )
+        self.assertEqual(record["alias"], "default")
+        self.assertEqual(record["view"], "collection-list")
+        self.assertIsNone(record["serializer"])
+        self.assertFalse(record["many"])
+        self.assertTrue(record["sql"].startswith('SELECT "store_collection"'))
+        self.assertNotIn("raw_sql", record)
+        self.assertTrue(
+            any("store_collection" in row for row in record["plan"])
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=60000)
+    def test_threshold(self):
+        with self.assertNoLogs("nexa.slow_queries"):
+            self.run_queries(lambda: Collection.objects.count())
+
+    def test_sampling(self):
+        with override_settings(SLOW_QUERY_SAMPLE_RATE=0):
+            with self.assertNoLogs("nexa.slow_queries"):
+                self.run_queries(lambda: Collection.objects.count())
+
+        with (
+            override_settings(SLOW_QUERY_SAMPLE_RATE=0.5),
+            mock.patch("core.queries.random.random", side_effect=[0.7, 0.2]),
+        ):
+            records = self.records(
+                lambda: (Collection.objects.count(), Product.objects.count())
+            )
+        self.assertEqual(len(records), 1)
+        self.assertIn("store_product", records[0]["sql"])
+
+    def test_serializer(self):
+        class CountSerializer(serializers.Serializer):
+            count = serializers.SerializerMethodField()
+
+            def get_count(self, value) -> int:
+                return Collection.objects.count()
+
+        for many in (False, True):
+            with self.subTest(many=many):
+                [record] = self.records(
+                    lambda: CountSerializer(
+                        [{}] if many else {}, many=many
+                    ).data
+                )
+                self.assertTrue(
+                    record["serializer"].endswith("CountSerializer")
+                )
+
+    def test_pending_explains_are_bounded(self):
+        query = lambda: Collection.objects.count()
+        pending_explains = threading.BoundedSemaphore(1)
+        with mock.patch("core.queries.pending_explains", pending_explains):
+            self.assertIn("plan", self.records(query)[0])
+            # Released once the record is written
+            self.assertIn("plan", self.records(query)[0])
+
+            pending_explains.acquire()
+            self.assertNotIn("plan", self.records(query)[0])
+
+    def test_summary_command(self):
+        records = [
+            {
+                "sql": "SELECT a",
+                "duration_ms": 10,
+                "view": "a",
+                "serializer": None,
+            },
+            {
+                "sql": "SELECT b",
+                "duration_ms": 50,
+                "view": "b",
+                "serializer": None,
+                "plan": ["SCAN b"],
+            },
+            {
+                "sql": "SELECT a",
+                "duration_ms": 20,
+                "view": "a",
+                "serializer": "A",
+            },
+        ]
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            log = Path(directory) / "slow_queries.log"
+            # Rotated files are read too
+            for path, lines in (
+                (log, records[:2]),
+                (log.with_name(f"{log.name}.1"), records[2:]),
+            ):
+                path.write_text(
+                    "".join(json.dumps(line) + "\n" for line in lines)
+                )
+            call_command(
+                "slow_queries", log=str(log), plans=True, stdout=output
+            )
+
+            with self.assertRaises(CommandError):
+                call_command("slow_queries", log=f"{directory}/missing.log")
+
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                "#1 50.0 ms total, 1 samples, 50.0 ms avg, 50.0 ms max",
+                "  views: b (1)",
+                "  serializers: - (1)",
+                "  SELECT b",
+                "    SCAN b",
+                "",
+                "#2 30.0 ms total, 2 samples, 15.0 ms avg, 20.0 ms max",
+                "  views: a (2)",
+                "  serializers: - (1), A (1)",
+                "  SELECT a",
+                "",
+            ],
+        )
+
+
+class MetricsTestCase(TestCase):
+    def test_counter_exposition(self):
+        registry = Registry()
+        counter = registry.counter("jobs_total", "Jobs.", ["queue"])
+        counter.inc(queue="default")
+        counter.inc(2, queue='a "b"')
+        self.assertEqual(
+            registry.expose(),
+            "# HELP jobs_total Jobs.\n"
+            "# TYPE jobs_total counter\n"
+            'jobs_total{queue="a \\"b\\""} 2.0\n'
+            'jobs_total{queue="default"} 1.0\n',
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        histogram = registry.histogram("latency", "Latency.", buckets=[1, 2])
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value)
+        exposition = registry.expose()
+        self.assertIn('latency_bucket{le="1.0"} 1\n', exposition)
+        self.assertIn('latency_bucket{le="2.0"} 3\n', exposition)
+        self.assertIn('latency_bucket{le="+Inf"} 4\n', exposition)
+        self.assertIn("latency_sum 6.5\n", exposition)
+        self.assertIn("latency_count 4\n", exposition)
+
+    def test_labels_must_match(self):
+        counter = Registry().counter("jobs_total", "Jobs.", ["queue"])
+        with self.assertRaises(ValueError):
+            counter.inc(kind="default")
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [Registry(directory), Registry(directory)]
+            for pid, worker in enumerate(workers, 1):
+                worker.counter("jobs_total", "Jobs.").inc(pid)
+                worker.histogram("latency", "Latency.").observe(pid)
+                # Each process writes to a file named after its pid
+                with mock.patch("core.metrics.os.getpid", return_value=pid):
+                    worker.flush()
+
+            with mock.patch("core.metrics.os.getpid", return_value=1):
+                exposition = workers[0].expose()
+            self.assertIn("jobs_total 3.0\n", exposition)
+            self.assertIn("latency_count 2\n", exposition)
+            self.assertIn("latency_sum 3.0\n", exposition)
+
+    def test_exited_processes_are_folded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            running = {1, 2}
+
+            def flush(pid: int, count: int) -> Registry:
+                worker = Registry(directory)
+                worker.counter("jobs_total", "Jobs.").inc(count)
+                with mock.patch("core.metrics.os.getpid", return_value=pid):
+                    worker.flush()
+                return worker
+
+            def jobs() -> float:
+                with (
+                    mock.patch("core.metrics.os.getpid", return_value=1),
+                    mock.patch(
+                        "core.metrics.process_exists",
+                        side_effect=lambda pid: pid in running,
+                    ),
+                ):
+                    return workers[0].collect()["jobs_total"][()]
+
+            workers = [flush(1, 1), flush(2, 2)]
+            running.remove(2)
+            self.assertEqual(jobs(), 3)
+            self.assertEqual(
+                sorted(path.name for path in Path(directory).glob("*.json")),
+                [workers[0].path.name, "totals.json"],
+            )
+
+            # A new process reusing the pid adds to the exited one's count
+            running.add(2)
+            flush(2, 5)
+            self.assertEqual(jobs(), 8)
+            running.remove(2)
+            self.assertEqual(jobs(), 8)
+            self.assertEqual(len(list(Path(directory).glob("*.json"))), 2)
+
+    def test_other_hosts_files_are_not_folded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workers = []
+            for host, pid in (("web-1", 1), ("web-1-2", 2)):
+                worker = Registry(directory)
+                worker.counter("jobs_total", "Jobs.").inc(pid)
+                with (
+                    mock.patch("core.metrics.os.getpid", return_value=pid),
+                    mock.patch(
+                        "core.metrics.socket.gethostname", return_value=host
+                    ),
+                ):
+                    worker.flush()
+                workers.append(worker)
+
+            # Pid 2 isn't running on web-1, but may well be on web-1-2
+            with (
+                mock.patch("core.metrics.os.getpid", return_value=1),
+                mock.patch(
+                    "core.metrics.socket.gethostname", return_value="web-1"
+                ),
+                mock.patch(
+                    "core.metrics.process_exists",
+                    side_effect=lambda pid: pid == 1,
+                ),
+            ):
+                self.assertEqual(workers[0].collect()["jobs_total"][()], 3)
+            self.assertEqual(
+                sorted(path.name for path in Path(directory).glob("*.json")),
+                sorted(worker.path.name for worker in workers),
+            )
+
+    def test_metrics_access(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with override_settings(METRICS_TOKEN="secret"):
+            for authorization, status in (
+                ("Bearer secret", 200),
+                ("Bearer other", 403),
+                ("secret", 403),
+            ):
+                with self.subTest(authorization=authorization):
+                    response = self.client.get(
+                        url, headers={"Authorization": authorization}
+                    )
+                    self.assertEqual(response.status_code, status)
+
+        self.client.force_login(
+            User.objects.create_user("user", "user@example.com")
+        )
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(
+            User.objects.create_user(
+                "staff", "staff@example.com", is_staff=True
+            )
+        )
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_metrics_endpoint(self):
+        client = APIClient()
+        collection = Collection.objects.create(title="Toys")
+        product = Product.objects.create(
+            title="Toy",
+            slug="toy",
+            price=10,
+            inventory=10,
+            collection=collection,
+        )
+        cart_id = client.post("/store/carts/").data["id"]
+        client.post(
+            f"/store/carts/{cart_id}/items/",
+            {"product_id": product.id, "quantity": 1},
+            format="json",
+        )
+        user = User.objects.create_user("metrics", "metrics@a.com")
+        client.force_authenticate(user)
+        client.post("/store/orders/", {"cart_id": cart_id}, format="json")
+        client.post("/store/orders/", {"cart_id": cart_id}, format="json")
+
+        client.force_login(
+            User.objects.create_superuser("admin", "admin@a.com")
+        )
+        response = client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        exposition = response.content.decode()
+        self.assertIn(
+            'nexa_http_request_duration_seconds_count{method="POST",'
+            'route="cart-list",status="201"}',
+            exposition,
+        )
+        self.assertIn('nexa_db_queries_total{route="order-list"}', exposition)
+        self.assertIn('nexa_checkouts_total{result="success"}', exposition)
+        self.assertIn('nexa_checkouts_total{result="failure"}', exposition)
+        self.assertIn(
+            'nexa_cart_operations_total{operation="add_item"}', exposition
+        )
+        self.assertFalse(Cart.objects.filter(pk=cart_id).exists())
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_SAMPLE_RATE=0)
+class ServerTimingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title="Toys")
+        Product.objects.create(
+            title="Toy", price=10, inventory=10, collection=collection
+        )
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(reverse("product-list"))
+        return response, len(queries)
+
+    def test_header(self):
+        response, queries = self.get()
+        timings = dict(
+            re.fullmatch(r'(\w+);dur=([\d.]+)(?:;desc="(.*)")?', metric).group(
+                1, 2
+            )
+            for metric in response["Server-Timing"].split(", ")
+        )
+        self.assertEqual(list(timings), ["db", "app", "render", "total"])
+        self.assertIn(
+            f'db;dur={timings["db"]};desc="{queries} queries"',
+            response["Server-Timing"],
+        )
+        durations = {name: float(value) for name, value in timings.items()}
+        self.assertLessEqual(
+            durations["db"] + durations["app"] + durations["render"],
+            durations["total"] + 0.01,
+        )
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_log(self):
+        with self.assertLogs("nexa.requests", "INFO") as logs:
+            response, queries = self.get()
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(
+            {
+                key: line[key]
+                for key in ("method", "path", "route", "status", "queries")
+            },
+            {
+                "method": "GET",
+                "path": "/store/products/",
+                "route": "store/products/$",
+                "status": 200,
+                "queries": queries,
+            },
+        )
+        self.assertEqual(
+            set(line) - {"method", "path", "route", "status", "queries"},
+            {"db_ms", "view_ms", "render_ms", "total_ms"},
+        )
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ServerTimingMiddleware(lambda request: HttpResponse())
+        response, _ = self.get()
+        self.assertNotIn("Server-Timing", response)
+
+
+class ConnectionPoolTestCase(TestCase):
+    def create_pool(self, **kwargs) -> ConnectionPool:
+        self.opened = 0
+
+        def connect():
+            self.opened += 1
+            return sqlite3.connect(":memory:", check_same_thread=False)
+
+        pool = ConnectionPool(
+            connect,
+            lambda connection: connection.execute("SELECT 1"),
+            **kwargs,
+        )
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_connections_are_reused(self):
+        pool = self.create_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(self.opened, 1)
+
+    def test_min_size_is_opened_up_front(self):
+        pool = self.create_pool(min_size=3, max_size=5)
+        pool.release(pool.acquire())
+        self.assertEqual(self.opened, 3)
+        self.assertEqual(len(pool.idle), 3)
+
+    def test_checkout_timeout(self):
+        pool = self.create_pool(max_size=1, timeout=0.05)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+    def test_waits_for_a_returned_connection(self):
+        pool = self.create_pool(max_size=1, timeout=5)
+        connection = pool.acquire()
+        threading.Timer(0.05, pool.release, [connection]).start()
+        self.assertIs(pool.acquire(), connection)
+
+    def test_dead_connections_are_replaced(self):
+        pool = self.create_pool(max_size=1)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.close()
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        replacement.execute("SELECT 1")
+        self.assertEqual(pool.size, 1)
+
+    def test_old_connections_are_recycled(self):
+        pool = self.create_pool(max_age=0.05)
+        connection = pool.acquire()
+        pool.release(connection)
+        time.sleep(0.06)
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertEqual(pool.size, 1)
+
+    def test_never_exceeds_max_size(self):
+        pool = self.create_pool(max_size=3, timeout=5)
+        borrowed = set()
+        peak = shared = 0
+        lock = threading.Lock()
+
+        def work():
+            nonlocal peak, shared
+            for _ in range(20):
+                connection = pool.acquire()
+                with lock:
+                    shared += connection in borrowed
+                    borrowed.add(connection)
+                    peak = max(peak, len(borrowed))
+                time.sleep(0.001)
+                with lock:
+                    borrowed.remove(connection)
+                pool.release(connection)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(shared, 0)
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(self.opened, 3)
+
+
+@override_settings(
+    REPLICA_DATABASES=["replica1", "replica2"],
+    DATABASE_ROUTERS=["core.routers.ReplicaRouter"],
+)
+class ReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+        def view(request):
+            # Routing a queryset doesn't run it
+            return HttpResponse(Product.objects.all().db)
+
+        self.middleware = ReplicaMiddleware(view)
+
+    def test_reads_use_the_primary_outside_requests(self):
+        self.assertEqual(Product.objects.all().db, "default")
+
+    def test_replica_reads(self):
+        token = replica_reads.set(True)
+        try:
+            self.assertIn(Product.objects.all().db, settings.REPLICA_DATABASES)
+            self.assertEqual(router.db_for_write(Product), "default")
+            with use_primary():
+                self.assertEqual(Product.objects.all().db, "default")
+        finally:
+            replica_reads.reset(token)
+
+    def test_safe_requests_read_from_replicas(self):
+        response = self.middleware(self.factory.get("/"))
+        self.assertIn(response.content.decode(), settings.REPLICA_DATABASES)
+        self.assertNotIn(ReplicaMiddleware.cookie, response.cookies)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        response = self.middleware(self.factory.post("/"))
+        self.assertEqual(response.content, b"default")
+        until = response[ReplicaMiddleware.header]
+        self.assertEqual(
+            response.cookies[ReplicaMiddleware.cookie].value, until
+        )
+
+        self.factory.cookies[ReplicaMiddleware.cookie] = until
+        self.assertEqual(
+            self.middleware(self.factory.get("/")).content, b"default"
+        )
+
+    def test_sticky_header(self):
+        until = str(int(time.time()) + 60)
+        request = self.factory.get("/", HTTP_X_PRIMARY_UNTIL=until)
+        self.assertEqual(self.middleware(request).content, b"default")
+
+    def test_expired_stickiness(self):
+        self.factory.cookies[ReplicaMiddleware.cookie] = str(
+            int(time.time()) - 1
+        )
+        response = self.middleware(self.factory.get("/"))
+        self.assertIn(response.content.decode(), settings.REPLICA_DATABASES)
+
+
+class ORJSONTestCase(TestCase):
+    data = {
+        "price": Decimal("10.50"),
+        "id": uuid.uuid4(),
+        "placed_at": timezone.now(),
+        "naive": datetime.datetime(2020, 1, 1, 1, 1, 1, 123456),
+        "date": datetime.date(2020, 1, 1),
+        "text": "caf\u00e9 \u2028 \u2029",
+        1: [0.1, None, True],
+    }
+
+    def test_same_output_as_json_renderer(self):
+        self.assertEqual(
+            ORJSONRenderer().render(self.data),
+            JSONRenderer().render(self.data),
+        )
+
+    def test_indented_output_falls_back(self):
+        media_type = "application/json; indent=4"
+        self.assertEqual(
+            ORJSONRenderer().render(self.data, media_type),
+            JSONRenderer().render(self.data, media_type),
+        )
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(
+            parser.parse(io.BytesIO('{"title": "caf\u00e9"}'.encode())),
+            {"title": "caf\u00e9"},
+        )
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"price": NaN}'))
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"catalog": "3/min", "carts": "3/min"},
+    }
+)
+class SlidingWindowThrottleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.now = 600.0
+        self.throttle = SlidingWindowThrottle()
+        self.throttle.timer = lambda: self.now
+
+    def allow(self, count=1, ip="10.0.0.1", user=None, **view) -> list:
+        view = SimpleNamespace(
+            **{"throttle_scope": "catalog", "kwargs": {}, **view}
+        )
+        request = self.factory.get("/", REMOTE_ADDR=ip)
+        request.user = user or AnonymousUser()
+        return [
+            self.throttle.allow_request(request, view) for _ in range(count)
+        ]
+
+    def test_limit(self):
+        self.assertEqual(self.allow(5), [True] * 3 + [False] * 2)
+        self.assertEqual(self.throttle.wait(), 60)
+
+    def test_sliding_window(self):
+        self.allow(3)
+        # Half of the previous window still counts
+        self.now = 690.0
+        self.assertEqual(self.allow(2), [True, False])
+        self.assertAlmostEqual(self.throttle.wait(), 10)
+
+    def test_rejected_requests_are_not_counted(self):
+        self.allow(8)
+        self.now = 700.0
+        self.assertEqual(self.allow(3), [True, True, False])
+
+    def test_identities(self):
+        user = User.objects.create_user("user", "user@example.com")
+        self.allow(3)
+        self.assertEqual(self.allow(ip="10.0.0.2"), [True])
+        self.assertEqual(self.allow(4, user=user), [True] * 3 + [False])
+        self.assertEqual(self.allow(ip="10.0.0.3", user=user), [False])
+        self.assertEqual(
+            self.allow(4, throttle_identity="ip", user=user), [False] * 4
+        )
+
+    def test_cart_identity(self):
+        cart = {"throttle_scope": "carts", "throttle_identity": "cart"}
+        self.assertEqual(self.allow(4, **cart), [True] * 3 + [False])
+        self.assertEqual(
+            self.allow(3, ip="10.0.0.2", kwargs={"cart_pk": "a"}, **cart),
+            [True] * 3,
+        )
+        # The cart is limited whatever the IP
+        self.assertEqual(
+            self.allow(ip="10.0.0.3", kwargs={"pk": "a"}, **cart), [False]
+        )
+        # And so is the IP whatever the cart
+        self.assertEqual(
+            [
+                self.allow(ip="10.0.0.4", kwargs={"pk": pk}, **cart)[0]
+                for pk in "bcde"
+            ],
+            [True] * 3 + [False],
+        )
+        self.assertEqual(self.throttle.wait(), 60)
+        # The rejected request didn't count against its cart either
+        self.assertEqual(
+            self.allow(ip="10.0.0.5", kwargs={"pk": "e"}, **cart), [True]
+        )
+
+    def test_scopes_without_a_rate(self):
+        self.assertEqual(self.allow(5, throttle_scope="orders"), [True] * 5)
+        self.assertEqual(self.allow(5, throttle_scope=None), [True] * 5)
+
+    def test_views(self):
+        client = APIClient()
+        for _ in range(3):
+            self.assertEqual(
+                client.get(reverse("product-list")).status_code, 200
+            )
+        response = client.get(reverse("collection-list"))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    async def test_async_views(self):
+        request = AsyncRequestFactory().get("/store/products/")
+        request.user = AnonymousUser()
+        for _ in range(3):
+            response = await async_views.product_list(request)
+            self.assertEqual(response.status_code, 200)
+        response = await async_views.product_list(request)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    async def test_async_views_authenticate(self):
+        # Users sending a JWT from the same IP each get their own limit
+        for username in ("first", "second"):
+            user = await User.objects.acreate_user(
+                username, f"{username}@example.com"
+            )
+            token = RefreshToken.for_user(user).access_token
+            request = AsyncRequestFactory().get(
+                "/store/products/",
+                headers={"Authorization": f"JWT {token}"},
+            )
+            request.user = AnonymousUser()
+            statuses = [
+                (await async_views.product_list(request)).status_code
+                for _ in range(4)
+            ]
+            self.assertEqual(statuses, [200] * 3 + [429])
+
+        request = AsyncRequestFactory().get(
+            "/store/products/", headers={"Authorization": "JWT invalid"}
+        )
+        request.user = AnonymousUser()
+        response = await async_views.product_list(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response)
+
+
+class HighPriorityView(APIView):
+    load_shedding_priority = "high"
+
+
+@override_settings(
+    LOAD_SHEDDING_MAX_IN_FLIGHT=2, LOAD_SHEDDING_DB_LATENCY_MS=100
+)
+class LoadSheddingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = LoadSheddingMiddleware(
+            lambda request: HttpResponse(Product.objects.count())
+        )
+        self.views = {
+            "low": ProductViewSet.as_view({"get": "list", "post": "create"}),
+            "normal": CartViewSet.as_view({"post": "create"}),
+            "high": HighPriorityView.as_view(),
+        }
+
+    def shed(self, method="get") -> list[str]:
+        request = getattr(self.factory, method)("/")
+        return [
+            priority
+            for priority, view in self.views.items()
+            if self.middleware.process_view(request, view, (), {})
+        ]
+
+    def test_in_flight_requests(self):
+        self.assertEqual(self.shed(), [])
+        self.middleware.in_flight = 2
+        self.assertEqual(self.shed(), ["low"])
+        self.assertEqual(self.shed("post"), [])
+        self.middleware.in_flight = 4
+        self.assertEqual(self.shed(), ["low", "normal"])
+        self.assertEqual(self.shed("post"), ["low", "normal"])
+
+        request = self.factory.get("/")
+        response = self.middleware.process_view(
+            request, self.views["low"], (), {}
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_action_priorities(self):
+        view = OrderViewSet.as_view({"get": "list", "post": "create"})
+        self.middleware.in_flight = 4
+        for method, shed in (("get", True), ("post", False)):
+            with self.subTest(method=method):
+                request = getattr(self.factory, method)("/")
+                response = self.middleware.process_view(request, view, (), {})
+                self.assertEqual(response is not None, shed)
+
+    def test_database_latency(self):
+        self.middleware.latency.add(1.5)
+        self.assertEqual(self.shed(), ["low"])
+
+        # Recovers while no queries run
+        with mock.patch(
+            "core.middleware.time.monotonic",
+            return_value=time.monotonic() + 10,
+        ):
+            self.assertEqual(self.shed(), [])
+
+    def test_requests_are_measured(self):
+        self.middleware(self.factory.get("/"))
+        self.assertEqual(self.middleware.in_flight, 0)
+        self.assertGreater(self.middleware.latency.average, 0)
+
+    @override_settings(
+        LOAD_SHEDDING_MAX_IN_FLIGHT=0, LOAD_SHEDDING_DB_LATENCY_MS=0
+    )
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            LoadSheddingMiddleware(lambda request: HttpResponse())
+
+
+class SeedDataTestCase(TestCase):
+    def seed(self, seed: int = 1):
+        call_command("seed_data", scale=0.1, seed=seed, stdout=io.StringIO())
+
+    def rows(self) -> dict[str, list]:
+        return {
+            "products": list(
+                Product.objects.order_by("pk").values_list(
+                    "title", "price", "inventory", "collection_id"
+                )
+            ),
+            "order items": list(
+                OrderItem.objects.order_by("pk").values_list(
+                    "order_id", "product_id", "quantity", "unit_price"
+                )
+            ),
+            "likes": list(
+                LikedItem.objects.order_by("pk").values_list(
+                    "user__username", "object_id"
+                )
+            ),
+            "tags": list(
+                TaggedItem.objects.order_by("pk").values_list(
+                    "tag__label", "content_type", "object_id"
+                )
+            ),
+        }
+
+    def test_row_counts(self):
+        self.seed()
+        for model, count in (
+            (Customer, 5),
+            (Address, 5),
+            (Promotion, 1),
+            (Collection, 1),
+            (Product, 10),
+            (Review, 100),
+            (Order, 3),
+            (Cart, 2),
+            (Tag, 2),
+        ):
+            with self.subTest(model=model.__name__):
+                self.assertEqual(model.objects.count(), count)
+        self.assertEqual(User.objects.filter(is_superuser=False).count(), 5)
+
+    def test_same_seed_same_data(self):
+        self.seed()
+        rows = self.rows()
+        self.seed()
+        self.assertEqual(self.rows(), rows)
+        self.seed(2)
+        self.assertNotEqual(self.rows()["products"], rows["products"])
+
+    def test_derived_data(self):
+        self.seed()
+        self.assertEqual(
+            dict(Product.objects.values_list("pk", "likes_count")),
+            {
+                product.pk: LikedItem.objects.filter(
+                    content_type=ContentType.objects.get_for_model(Product),
+                    object_id=product.pk,
+                ).count()
+                for product in Product.objects.all()
+            },
+        )
+        for model, lookups in search_indexes.registry.items():
+            content_type = ContentType.objects.get_for_model(model)
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    set(
+                        SearchTerm.objects.filter(
+                            content_type=content_type
+                        ).values_list("object_id", "term")
+                    ),
+                    {
+                        (pk, term)
+                        for pk, *values in model.objects.values_list(
+                            "pk", *lookups
+                        )
+                        for term in search_indexes.terms(values)
+                    },
+                )
+
+
+class SnapshotTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = Collection.objects.create(title="Toys")
+        Product.objects.create(
+            title="Red ball", price=5, inventory=1, collection=cls.collection
+        )
+
+    def dump(self) -> str:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/snapshot.zip"
+        call_command("dump_snapshot", path, stdout=io.StringIO())
+        return path
+
+    def test_round_trip(self):
+        call_command("seed_data", scale=0.1, seed=1, stdout=io.StringIO())
+        models = get_snapshot_models()
+
+        def rows() -> dict:
+            return {
+                model._meta.label: model._base_manager.count()
+                for model in models
+            } | {
+                "tags": set(
+                    TaggedItem.objects.values_list(
+                        "tag__label", "content_type__model", "object_id"
+                    )
+                ),
+                "likes": set(
+                    LikedItem.objects.values_list(
+                        "user__username", "content_type__model", "object_id"
+                    )
+                ),
+            }
+
+        expected = rows()
+        path = self.dump()
+        # Loaded into a database whose content types have other ids
+        ContentType.objects.filter(
+            app_label="store", model__in=["product", "collection"]
+        ).delete()
+        ContentType.objects.clear_cache()
+        # The new ids are rolled back after the test
+        self.addCleanup(ContentType.objects.clear_cache)
+        Cart.objects.all().delete()
+        Tag.objects.create(label="Replaced")
+        call_command("load_snapshot", path, stdout=io.StringIO())
+
+        self.assertEqual(rows(), expected)
+        self.assertTrue(expected["tags"] and expected["likes"])
+        for model in (Product, Collection):
+            content_type = ContentType.objects.get_for_model(model)
+            tagged = TaggedItem.objects.filter(content_type=content_type)
+            self.assertFalse(
+                tagged.exclude(
+                    object_id__in=model.objects.values("pk")
+                ).exists()
+            )
+        self.assertFalse(
+            LikedItem.objects.exclude(
+                content_type=ContentType.objects.get_for_model(Product),
+                object_id__in=Product.objects.values("pk"),
+            ).exists()
+        )
+        self.assertFalse(
+            OrderItem.objects.exclude(
+                product__in=Product.objects.all()
+            ).exists()
+        )
+
+    def test_users_groups_and_permissions(self):
+        user = User.objects.create_user("editor", "editor@example.com")
+        user.groups.add(Group.objects.create(name="Editors"))
+        user.user_permissions.add(
+            Permission.objects.get(codename="change_product")
+        )
+        path = self.dump()
+        # Loaded into a database where the group has another id
+        Group.objects.all().delete()
+        Group.objects.create(name="Support")
+        call_command("load_snapshot", path, stdout=io.StringIO())
+
+        user = User.objects.get(username="editor")
+        self.assertQuerySetEqual(
+            user.groups.values_list("name", flat=True), ["Editors"]
+        )
+        self.assertQuerySetEqual(
+            user.user_permissions.values_list("codename", flat=True),
+            ["change_product"],
+        )
+
+    def test_rows_of_missing_permissions_are_skipped(self):
+        user = User.objects.create_user("editor", "editor@example.com")
+        user.user_permissions.add(
+            Permission.objects.get(codename="change_product"),
+            Permission.objects.get(codename="view_product"),
+        )
+        path = self.dump()
+        Permission.objects.filter(codename="view_product").delete()
+        output = io.StringIO()
+        call_command("load_snapshot", path, stdout=output)
+
+        self.assertQuerySetEqual(
+            User.objects.get(username="editor").user_permissions.values_list(
+                "codename", flat=True
+            ),
+            ["change_product"],
+        )
+        self.assertIn(
+            "Skipped 1 core.user_user_permissions", output.getvalue()
+        )
+
+    def test_load_rebuilds_the_search_index(self):
+        path = self.dump()
+        # Replaced by the snapshot, along with its search terms
+        Product.objects.create(
+            title="Blue kite", price=5, inventory=1, collection=self.collection
+        )
+        call_command("load_snapshot", path, stdout=io.StringIO())
+
+        self.assertQuerySetEqual(
+            SearchTerm.objects.search(Product.objects.all(), "ball"),
+            Product.objects.filter(title="Red ball"),
+        )
+        self.assertFalse(
+            SearchTerm.objects.search(Product.objects.all(), "kite").exists()
+        )
+        for content_type in ContentType.objects.filter(
+            pk__in=SearchTerm.objects.values("content_type")
+        ):
+            model = content_type.model_class()
+            object_ids = set(
+                SearchTerm.objects.filter(
+                    content_type=content_type
+                ).values_list("object_id", flat=True)
+            )
+            self.assertEqual(
+                object_ids,
+                set(model.objects.values_list("pk", flat=True)) & object_ids,
+            )
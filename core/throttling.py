@@ -0,0 +1,94 @@
+"""
+Rate limiting shared by all worker processes through the default cache.
+
+Views opt in with a `throttle_scope`, whose rate such as "100/min" is
+read from DEFAULT_THROTTLE_RATES like with DRF's ScopedRateThrottle, and
+pick who the rate applies to with `throttle_identity`:
+
+- "user", the default: the user, or the client IP when anonymous
+- "ip": the client IP
+- "cart": both the cart in the URL and the client IP, each allowed the
+  rate, so a cart can't be hammered from many IPs, nor can an IP get
+  around the limit with made up cart ids
+
+Limits only hold across processes with a cache they share, such as
+Redis or Memcached, see CACHES.
+"""
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from core import metrics
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Counts requests per fixed window of the rate's duration, and adds the
+    previous window's count weighted by how much of it the sliding window
+    ending now still covers. That only takes two counters per identity,
+    which the cache updates atomically with add() and incr(), unlike the
+    request history SimpleRateThrottle reads and writes back.
+    """
+
+    cache_format = "throttle:{scope}:{ident}:{window}"
+    cart_kwargs = ("cart_pk", "pk")
+
+    def __init__(self):
+        # The scope and its rate are only known once the view is, in
+        # allow_request(), unlike SimpleRateThrottle which reads them here
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, "throttle_scope", None)
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if not self.rate:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        window, self.elapsed = divmod(self.timer(), self.duration)
+        counted = []
+        for ident in self.get_idents(request, view):
+            current, previous = (
+                self.cache_format.format(
+                    scope=self.scope, ident=ident, window=int(index)
+                )
+                for index in (window, window - 1)
+            )
+            self.previous = self.cache.get(previous, 0)
+            weighted = self.previous * (1 - self.elapsed / self.duration)
+
+            # Kept through the next window, where it is the previous one
+            self.cache.add(current, 0, timeout=self.duration * 2)
+            self.count = self.cache.incr(current)
+            counted.append(current)
+            if weighted + self.count > self.num_requests:
+                break
+        else:
+            return True
+
+        # Rejected requests don't count against any identity
+        for key in counted:
+            self.count = self.cache.decr(key)
+        metrics.throttled_requests.inc(scope=self.scope)
+        return False
+
+    def get_idents(self, request, view) -> list[str]:
+        identity = getattr(view, "throttle_identity", "user")
+        ip = f"ip:{self.get_ident(request)}"
+        if identity == "cart":
+            for kwarg in self.cart_kwargs:
+                if view.kwargs.get(kwarg):
+                    return [f"cart:{view.kwargs[kwarg]}", ip]
+        elif identity == "user" and request.user.is_authenticated:
+            return [f"user:{request.user.pk}"]
+        return [ip]
+
+    def wait(self):
+        available = self.num_requests - self.count - 1
+        if available < 0 or not self.previous:
+            # Until the current window becomes the previous one
+            return self.duration - self.elapsed
+        # Until the previous window's weight leaves room for one request
+        return max(
+            self.duration * (1 - available / self.previous) - self.elapsed, 0
+        )
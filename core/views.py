@@ -1,3 +1,27 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+
+from core.metrics import registry
+
+
+def has_metrics_token(request) -> bool:
+    if not settings.METRICS_TOKEN:
+        return False
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    return hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), expected.encode()
+    )
+
+
+def metrics(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    # Routes and their traffic are not for everyone to see
+    if not (request.user.is_staff or has_metrics_token(request)):
+        raise PermissionDenied
+    return HttpResponse(
+        registry.expose(), content_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    LikedItem = apps.get_model("likes", "LikedItem")
+    duplicates = (
+        LikedItem.objects.values("user", "content_type", "object_id")
+        .annotate(first_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        LikedItem.objects.filter(
+            user=duplicate["user"],
+            content_type=duplicate["content_type"],
+            object_id=duplicate["object_id"],
+        ).exclude(id=duplicate["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("likes", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_likes, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="likeditem",
+            constraint=models.UniqueConstraint(
+                fields=("user", "content_type", "object_id"),
+                name="unique_user_liked_item",
+            ),
+        ),
+    ]
@@ -1,14 +1,41 @@
-from django.db import models
-from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, models, transaction
 
 from nexa import settings
 
 
+class LikedItemManager(models.Manager):
+    def like(self, user, model: models.Model, id: int) -> bool:
+        content_type = ContentType.objects.get_for_model(model)
+        try:
+            with transaction.atomic():
+                self.create(user=user, content_type=content_type, object_id=id)
+        except IntegrityError:
+            return False
+        return True
+
+    def unlike(self, user, model: models.Model, id: int) -> bool:
+        content_type = ContentType.objects.get_for_model(model)
+        deleted, _ = self.filter(
+            user=user, content_type=content_type, object_id=id
+        ).delete()
+        return deleted > 0
+
+
 class LikedItem(models.Model):
+    objects = LikedItemManager()
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE
     )
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content = GenericForeignKey()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "content_type", "object_id"],
+                name="unique_user_liked_item",
+            )
+        ]
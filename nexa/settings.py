@@ -54,15 +54,20 @@ INSTALLED_APPS = [
     "django_filters",
     "rest_framework",
     "djoser",
-    "debug_toolbar",
     "store",
     "tags",
     "likes",
+    "search",
     "core",
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.LoadSheddingMiddleware",
+    "core.middleware.ServerTimingMiddleware",
+    "core.middleware.NPlusOneMiddleware",
+    "core.middleware.SlowQueryMiddleware",
+    "core.middleware.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -72,6 +77,13 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.middleware.security.SecurityMiddleware"),
+        "debug_toolbar.middleware.DebugToolbarMiddleware",
+    )
+
 INTERNAL_IPS = [
     "localhost",
     "127.0.0.1",
@@ -107,6 +119,51 @@ DATABASES = {
         "HOST": os.getenv("DATABASE_HOST", "localhost"),
         "USER": os.getenv("DATABASE_USER", "root"),
         "PASSWORD": os.getenv("DATABASE_PASSWORD", ""),
+        # Used by the core.backends.mysql_pool engine
+        "POOL": {
+            "MIN_SIZE": int(os.getenv("DATABASE_POOL_MIN_SIZE", "0")),
+            "MAX_SIZE": int(os.getenv("DATABASE_POOL_MAX_SIZE", "10")),
+            "TIMEOUT": float(os.getenv("DATABASE_POOL_TIMEOUT", "10")),
+            "MAX_AGE": float(os.getenv("DATABASE_POOL_MAX_AGE", "1800")),
+        },
+    }
+}
+
+
+# Read replicas: comma separated hosts, or database files with SQLite.
+# Safe requests read from them unless the client wrote something in the
+# last REPLICA_STICKY_SECONDS.
+REPLICA_DATABASES = []
+replica_key = (
+    "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+)
+for index, replica in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), 1
+):
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"],
+        replica_key: replica,
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(f"replica{index}")
+
+if REPLICA_DATABASES:
+    DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Throttling only limits clients across processes with a shared backend,
+# such as django.core.cache.backends.redis.RedisCache
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
     }
 }
 
@@ -160,8 +217,58 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "core.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "core.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+    # Rates such as "100/min" of the views' throttle scopes, see
+    # core/throttling.py. Scopes without a rate are not limited
+    "DEFAULT_THROTTLE_CLASSES": ("core.throttling.SlidingWindowThrottle",),
+    "DEFAULT_THROTTLE_RATES": {
+        "catalog": os.getenv("THROTTLE_RATE_CATALOG"),
+        "carts": os.getenv("THROTTLE_RATE_CARTS"),
+        "orders": os.getenv("THROTTLE_RATE_ORDERS"),
+    },
 }
 
+# Serves the product, collection and cart reads from async views, which
+# only pays off when running under ASGI
+ASYNC_CATALOG_VIEWS = os.getenv("ASYNC_CATALOG_VIEWS", "False") == "True"
+
+# Unfiltered admin changelists over tables estimated at this many rows or
+# more show the table statistics' row count instead of counting
+ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv("ESTIMATED_COUNT_THRESHOLD", "100000")
+)
+
+# Number of product slugs each process maps to their ids
+PRODUCT_SLUG_CACHE_SIZE = int(os.getenv("PRODUCT_SLUG_CACHE_SIZE", "10000"))
+
+# Adding to a cart reserves stock for RESERVATION_TTL_SECONDS, see
+# store/inventory.py
+INVENTORY_RESERVATIONS = os.getenv("INVENTORY_RESERVATIONS", "False") == "True"
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+
+# Responses of requests sent with an Idempotency-Key header are replayed
+# to retries for this long, see store/idempotency.py
+IDEMPOTENCY_KEY_TTL_SECONDS = int(
+    os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400")
+)
+
+# Requests in flight per process, and average query latency, past which
+# low priority requests are rejected first, see core/middleware.py
+LOAD_SHEDDING_MAX_IN_FLIGHT = int(
+    os.getenv("LOAD_SHEDDING_MAX_IN_FLIGHT", "0")
+)
+LOAD_SHEDDING_DB_LATENCY_MS = float(
+    os.getenv("LOAD_SHEDDING_DB_LATENCY_MS", "0")
+)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=15),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -178,3 +285,61 @@ DJOSER = {
 }
 
 AUTH_USER_MODEL = "core.User"
+
+# Request instrumentation: a Server-Timing header on every response and a
+# JSON log line for this fraction of requests
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "False") == "True"
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.getenv("SERVER_TIMING_SAMPLE_RATE", "0.01")
+)
+
+# Repeated lazy loads: "log" or "raise" once the same query runs more than
+# NPLUSONE_THRESHOLD times from the same line during a request
+NPLUSONE_DETECTION = os.getenv("NPLUSONE_DETECTION", "off")
+NPLUSONE_THRESHOLD = int(os.getenv("NPLUSONE_THRESHOLD", "5"))
+
+# Queries slower than this many milliseconds are sampled into
+# SLOW_QUERY_LOG with their EXPLAIN plan, 0 turns the log off
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "0"))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "1"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", BASE_DIR / "slow_queries.log")
+
+# Metrics served at /metrics. With METRICS_DIR set, each worker process
+# writes its values there and a scrape adds up all of them. A directory
+# shared between hosts or containers only has the scraped host's exited
+# workers folded into its totals
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_DIR = os.getenv("METRICS_DIR")
+# Scrapers send it as "Authorization: Bearer <token>". Without it, only
+# staff users logged in to the admin can read /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "{message}", "style": "{"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+        "slow_queries": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SLOW_QUERY_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "delay": True,
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "nexa": {
+            "handlers": ["console"],
+            "level": os.getenv("NEXA_LOG_LEVEL", "INFO"),
+        },
+        "nexa.slow_queries": {
+            "handlers": ["slow_queries"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
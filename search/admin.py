@@ -0,0 +1,26 @@
+from search.indexes import registry
+from search.models import SearchTerm
+
+
+class IndexedSearchMixin:
+    """
+    Admin search and autocomplete by word prefix over the SearchTerm index
+    instead of icontains lookups over `search_fields`, which still have to
+    be set for the search box to show.
+
+    `search_index_model` searches the index of a related model instead,
+    reached through `search_index_path`.
+    """
+
+    search_index_model = None
+    search_index_path = "pk"
+
+    def get_search_results(self, request, queryset, search_term):
+        model = self.search_index_model or self.model
+        if not search_term or model not in registry:
+            return super().get_search_results(request, queryset, search_term)
+
+        queryset = SearchTerm.objects.search(
+            queryset, search_term, model, self.search_index_path
+        )
+        return queryset, False
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from search.models import SearchTerm, tokenize
+
+CHUNK_SIZE = 1000
+
+# Indexed lookups by model
+registry = {}
+
+
+def terms(values) -> list[str]:
+    return sorted(
+        {
+            term
+            for value in values
+            if value is not None
+            for term in tokenize(value)
+        }
+    )
+
+
+def index_queryset(model, queryset) -> int:
+    """
+    Brings the search terms of the objects in the queryset up to date, and
+    returns how many objects were read. Objects whose terms did not change
+    are not written.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    rows = queryset.values_list("pk", *registry[model]).iterator(
+        chunk_size=CHUNK_SIZE
+    )
+    count = 0
+    while batch := list(islice(rows, CHUNK_SIZE)):
+        count += len(batch)
+        indexed = SearchTerm.objects.filter(
+            content_type=content_type,
+            object_id__in=[row[0] for row in batch],
+        ).values_list("object_id", "term")
+        old_terms = defaultdict(list)
+        for object_id, term in indexed:
+            old_terms[object_id].append(term)
+        new_terms = {pk: terms(values) for pk, *values in batch}
+        changed = [
+            pk
+            for pk, object_terms in new_terms.items()
+            if sorted(old_terms[pk]) != object_terms
+        ]
+        if not changed:
+            continue
+
+        with transaction.atomic():
+            SearchTerm.objects.filter(
+                content_type=content_type, object_id__in=changed
+            ).delete()
+            SearchTerm.objects.bulk_create(
+                [
+                    SearchTerm(
+                        content_type=content_type, object_id=pk, term=term
+                    )
+                    for pk in changed
+                    for term in new_terms[pk]
+                ]
+            )
+    return count
+
+
+class Reindexer:
+    """
+    post_save receiver that reindexes the objects of `model` reaching the
+    saved instance through `path`, or the instance itself when the path
+    is empty, unless the save only updated fields
+    other than `fields`.
+    """
+
+    def __init__(self, model, path: str, fields: set[str]):
+        self.model = model
+        self.path = path
+        self.fields = fields
+
+    def __call__(self, sender, instance, update_fields=None, **kwargs):
+        if update_fields is not None and not self.fields & update_fields:
+            return
+        lookup = f"{self.path}__pk" if self.path else "pk"
+        index_queryset(
+            self.model,
+            self.model._default_manager.filter(**{lookup: instance.pk}),
+        )
+
+
+def delete_terms(sender, instance, **kwargs):
+    SearchTerm.objects.filter(
+        content_type=ContentType.objects.get_for_model(sender),
+        object_id=instance.pk,
+    ).delete()
+
+
+def register(model, fields: list[str]):
+    """
+    Indexes the words of `fields` for the model's admin search, and keeps
+    them up to date when an object is saved or deleted.
+
+    Fields can follow foreign keys, as in "user__email": saving the user
+    then reindexes the objects pointing at it. Updates that skip signals,
+    such as QuerySet.update() and bulk_create(), need the
+    rebuild_search_index command.
+    """
+    registry[model] = fields
+
+    # Fields read from each model along the lookups, by path from `model`
+    paths = {}
+    for field in fields:
+        parts = field.split("__")
+        for depth, name in enumerate(parts):
+            paths.setdefault("__".join(parts[:depth]), set()).add(name)
+
+    for path, names in paths.items():
+        sender = model
+        for part in filter(None, path.split("__")):
+            sender = sender._meta.get_field(part).related_model
+        post_save.connect(
+            Reindexer(model, path, names),
+            sender=sender,
+            weak=False,
+            dispatch_uid=f"search_{model._meta.label}_{path}",
+        )
+
+    post_delete.connect(
+        delete_terms,
+        sender=model,
+        dispatch_uid=f"search_{model._meta.label}_delete",
+    )
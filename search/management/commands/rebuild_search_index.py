@@ -0,0 +1,44 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from search.indexes import index_queryset, registry
+from search.models import SearchTerm
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the admin search index of every registered model, or of "
+        "the given ones. Run it after loading data with bulk_create() or "
+        "changing search fields with QuerySet.update()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="Models to reindex, as app_label.ModelName.",
+        )
+
+    def handle(self, *args, **options):
+        models = list(registry)
+        if options["models"]:
+            try:
+                models = [apps.get_model(label) for label in options["models"]]
+            except (LookupError, ValueError) as exc:
+                raise CommandError(exc)
+            for model in models:
+                if model not in registry:
+                    raise CommandError(
+                        f"{model._meta.label} has no search index."
+                    )
+
+        for model in models:
+            SearchTerm.objects.filter(
+                content_type=ContentType.objects.get_for_model(model)
+            ).delete()
+            count = index_queryset(model, model._default_manager.all())
+            self.stdout.write(
+                f"Indexed {count} {model._meta.verbose_name_plural}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,117 @@
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import User
+from search.models import SearchTerm, tokenize
+from store.models import Collection, Order, Product
+
+
+class SearchIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "Pass@123"
+        )
+        cls.user = User.objects.create_user(
+            "jdoe",
+            "john.doe@example.com",
+            first_name="John",
+            last_name="Doe",
+        )
+        cls.collection = Collection.objects.create(title="Garden Tools")
+        cls.product = Product.objects.create(
+            title="Rake",
+            slug="rake",
+            price=10,
+            inventory=1,
+            collection=cls.collection,
+        )
+
+    def terms(self, instance) -> list[str]:
+        return sorted(
+            SearchTerm.objects.filter(
+                content_type=ContentType.objects.get_for_model(instance),
+                object_id=instance.pk,
+            ).values_list("term", flat=True)
+        )
+
+    def search(self, model: str, query: str) -> list[int]:
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse(f"admin:store_{model}_changelist"), {"q": query}
+            )
+        self.assertFalse(any(" LIKE '%" in query["sql"] for query in queries))
+        return sorted(obj.pk for obj in response.context["cl"].result_list)
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("Crème BRÛLÉE, john.doe@example.com"),
+            ["creme", "brulee", "john", "doe", "example", "com"],
+        )
+
+    def test_saves_are_indexed(self):
+        self.assertEqual(self.terms(self.product), ["garden", "rake", "tools"])
+        self.assertEqual(
+            self.terms(self.user.customer),
+            ["com", "doe", "example", "jdoe", "john"],
+        )
+
+    def test_related_saves_are_indexed(self):
+        self.collection.title = "Yard"
+        self.collection.save()
+        self.assertEqual(self.terms(self.product), ["rake", "yard"])
+
+        self.user.first_name = "Jane"
+        self.user.save()
+        self.assertIn("jane", self.terms(self.user.customer))
+
+    def test_unrelated_updates_are_skipped(self):
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=["last_login"])
+
+    def test_deletes_are_unindexed(self):
+        customer = self.user.customer
+        self.user.delete()
+        self.assertEqual(self.terms(customer), [])
+
+    def test_admin_search(self):
+        customer = self.user.customer
+        self.assertEqual(self.search("customer", "jo DOE"), [customer.pk])
+        self.assertEqual(self.search("customer", "ohn"), [])
+        self.assertEqual(self.search("product", "gard ra"), [self.product.pk])
+
+        order = Order.objects.create(customer=customer)
+        Order.objects.create(customer=self.admin.customer)
+        self.assertEqual(self.search("order", "john"), [order.pk])
+
+    def test_autocomplete(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "app_label": "store",
+                "model_name": "product",
+                "field_name": "collection",
+                "term": "gar",
+            },
+        )
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]],
+            [str(self.collection.pk)],
+        )
+
+    def test_rebuild(self):
+        Product.objects.filter(pk=self.product.pk).update(title="Shovel")
+        output = StringIO()
+        call_command("rebuild_search_index", "store.Product", stdout=output)
+        self.assertIn("Indexed 1 products", output.getvalue())
+        self.assertEqual(
+            self.terms(self.product), ["garden", "shovel", "tools"]
+        )
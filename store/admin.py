@@ -1,11 +1,20 @@
-from django.contrib import admin
-from django.core.checks import messages
+from itertools import islice
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.db import transaction
 from django.db.models import Count
 from django.http.request import HttpRequest
+from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.http import urlencode
 
+from search.admin import IndexedSearchMixin
+from store.exports import csv_response
+from store import inventory
+from store.forms import AdjustPriceForm, ProductAdminForm, PromotionForm
 from store.models import (
     Address,
     Cart,
@@ -16,10 +25,35 @@ from store.models import (
     Product,
     Promotion,
 )
+from store.pagination import EstimatedCountPaginator
+
+
+class EstimatedCountMixin:
+    """
+    Changelist that does not count large tables, and skips the second
+    count of the whole table shown next to filtered results.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class ExportCsvMixin:
+    """
+    Adds an action that streams the `export_fields` lookups of the
+    selected rows, or of the whole filtered changelist, as CSV.
+    """
+
+    actions = ["export_csv"]
+    export_fields = []
+
+    @admin.action(description="Export selected as CSV", permissions=["view"])
+    def export_csv(self, request, queryset):
+        return csv_response(queryset, self.export_fields)
 
 
 @admin.register(Collection)
-class CollectionAdmin(admin.ModelAdmin):
+class CollectionAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ["title", "featured", "product_count"]
     list_select_related = ["featured_product"]
     list_per_page = 10
@@ -53,7 +87,10 @@ class CollectionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(
+    IndexedSearchMixin, ExportCsvMixin, EstimatedCountMixin, admin.ModelAdmin
+):
+    form = ProductAdminForm
     list_display = ["title", "price", "inventory", "collection_name"]
     list_select_related = ["collection"]
     list_editable = ["price", "inventory"]
@@ -64,15 +101,44 @@ class ProductAdmin(admin.ModelAdmin):
         "slug": ["title"],
     }
     autocomplete_fields = ["collection", "promotions"]
-    actions = ["clear_inventory"]
+    actions = [
+        "clear_inventory",
+        "adjust_prices",
+        "add_promotion",
+        "remove_promotion",
+        "export_csv",
+    ]
+    export_fields = [
+        "id",
+        "title",
+        "slug",
+        "price",
+        "stock",
+        "collection__title",
+        "last_update",
+    ]
 
     @admin.display(ordering="collection__title")
     def collection_name(self, product: Product):
         return product.collection.title if product.collection else None
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stock()
+
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(
+            request, form=ProductAdminForm, **kwargs
+        )
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        stock = obj.inventory if "inventory" in form.changed_data else None
+        inventory.save_product(obj, stock)
+
     @admin.action(description="Clear inventory")
     def clear_inventory(self, request, queryset):
-        update_count = queryset.update(inventory=0)
+        update_count = inventory.clear(queryset)
         if update_count > 0:
             self.message_user(
                 request,
@@ -86,9 +152,105 @@ class ProductAdmin(admin.ModelAdmin):
                 messages.ERROR,
             )
 
+    def render_action_form(self, request, queryset, form, title: str):
+        """
+        Asks for the action's parameters, on a page that posts the action
+        and its selection back to the changelist.
+        """
+        context = {
+            **self.admin_site.each_context(request),
+            "title": title,
+            "opts": self.model._meta,
+            "form": form,
+            "count": queryset.count(),
+            "action": request.POST["action"],
+            "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "select_across": request.POST.get("select_across") == "1",
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(
+            request, "admin/store/product/bulk_action.html", context
+        )
+
+    @admin.action(description="Adjust prices", permissions=["change"])
+    def adjust_prices(self, request, queryset):
+        form = AdjustPriceForm(
+            request.POST if "post" in request.POST else None
+        )
+        if not form.is_valid():
+            return self.render_action_form(
+                request, queryset, form, "Adjust prices"
+            )
+
+        update_count = queryset.update(
+            price=form.price_expression(), last_update=timezone.now()
+        )
+        self.message_user(
+            request,
+            f"Updated {update_count} products prices",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Add a promotion", permissions=["change"])
+    def add_promotion(self, request, queryset):
+        form = PromotionForm(request.POST if "post" in request.POST else None)
+        if not form.is_valid():
+            return self.render_action_form(
+                request, queryset, form, "Add a promotion"
+            )
+
+        promotion = form.cleaned_data["promotion"]
+        ProductPromotion = Product.promotions.through
+        product_ids = queryset.values_list("pk", flat=True).iterator(
+            chunk_size=1000
+        )
+        product_count = 0
+        with transaction.atomic():
+            while batch := list(islice(product_ids, 1000)):
+                # Products that already have the promotion are skipped
+                existing = set(
+                    ProductPromotion.objects.filter(
+                        promotion=promotion, product_id__in=batch
+                    ).values_list("product_id", flat=True)
+                )
+                added = [
+                    ProductPromotion(
+                        product_id=product_id, promotion=promotion
+                    )
+                    for product_id in batch
+                    if product_id not in existing
+                ]
+                ProductPromotion.objects.bulk_create(
+                    added, ignore_conflicts=True
+                )
+                product_count += len(added)
+        self.message_user(
+            request,
+            f"Added {promotion} to {product_count} products",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Remove a promotion", permissions=["change"])
+    def remove_promotion(self, request, queryset):
+        form = PromotionForm(request.POST if "post" in request.POST else None)
+        if not form.is_valid():
+            return self.render_action_form(
+                request, queryset, form, "Remove a promotion"
+            )
+
+        promotion = form.cleaned_data["promotion"]
+        delete_count, _ = Product.promotions.through.objects.filter(
+            promotion=promotion, product__in=queryset.values("pk")
+        ).delete()
+        self.message_user(
+            request,
+            f"Removed {promotion} from {delete_count} products",
+            messages.SUCCESS,
+        )
+
 
 @admin.register(Promotion)
-class PromotionAdmin(admin.ModelAdmin):
+class PromotionAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ["description", "discount"]
     list_per_page = 10
     search_fields = ["description"]
@@ -109,7 +271,9 @@ class CustomerFilter(admin.SimpleListFilter):
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(
+    IndexedSearchMixin, ExportCsvMixin, EstimatedCountMixin, admin.ModelAdmin
+):
     autocomplete_fields = ["user"]
     list_display = [
         "user__first_name",
@@ -128,6 +292,16 @@ class CustomerAdmin(admin.ModelAdmin):
         "user__email",
         "user__username",
     ]
+    export_fields = [
+        "id",
+        "user__first_name",
+        "user__last_name",
+        "user__email",
+        "phone",
+        "birth_date",
+        "membership",
+        "order_count",
+    ]
 
     @admin.display(ordering="order_count")
     def orders(self, customer: Customer):
@@ -140,7 +314,10 @@ class CustomerAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request: HttpRequest):
         return (
-            super().get_queryset(request).annotate(order_count=Count("order"))
+            super()
+            .get_queryset(request)
+            .select_related("user")
+            .annotate(order_count=Count("order"))
         )
 
 
@@ -160,21 +337,35 @@ class OrderItemInline(admin.TabularInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(
+    IndexedSearchMixin, ExportCsvMixin, EstimatedCountMixin, admin.ModelAdmin
+):
     list_display = ["placed_at", "payment_status", "customer_name"]
-    list_select_related = ["customer"]
+    list_select_related = ["customer__user"]
     list_editable = ["payment_status"]
     list_filter = ["payment_status", "placed_at"]
     list_per_page = 10
     autocomplete_fields = ["customer"]
-    search_fields = ["customer__first_name", "customer__last_name"]
+    search_fields = ["customer__user__first_name", "customer__user__last_name"]
+    search_index_model = Customer
+    search_index_path = "customer"
     inlines = [OrderItemInline]
+    export_fields = [
+        "id",
+        "placed_at",
+        "payment_status",
+        "customer_id",
+        "customer__user__first_name",
+        "customer__user__last_name",
+        "customer__user__email",
+    ]
 
     def customer_name(self, order: Order):
-        return f"{order.customer.first_name} {order.customer.last_name}"
+        user = order.customer.user
+        return f"{user.first_name} {user.last_name}"
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(EstimatedCountMixin, admin.ModelAdmin):
     list_display = ["create_at"]
     list_per_page = 10
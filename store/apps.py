@@ -7,3 +7,19 @@ class StoreConfig(AppConfig):
 
     def ready(self) -> None:
         import store.signals.handlers
+        from search.indexes import register
+
+        from store.models import Collection, Customer, Product, Promotion
+
+        register(Collection, ["title"])
+        register(Promotion, ["description"])
+        register(Product, ["title", "collection__title"])
+        register(
+            Customer,
+            [
+                "user__first_name",
+                "user__last_name",
+                "user__email",
+                "user__username",
+            ],
+        )
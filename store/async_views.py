@@ -0,0 +1,209 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import (
+    AuthenticationFailed,
+    Throttled,
+    ValidationError,
+)
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from store import views
+from store.filters import ProductFilter
+from store.models import Cart, Product
+from store.pagination import TenObjectPagination
+from store.serializers import (
+    CartSerializer,
+    CollectionSerializer,
+    ProductSerializer,
+)
+
+
+def render(data, status=status.HTTP_200_OK) -> HttpResponse:
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(
+        renderer.render(data),
+        status=status,
+        content_type=renderer.media_type,
+    )
+
+
+def not_found(model) -> HttpResponse:
+    return render(
+        {"detail": f"No {model._meta.object_name} matches the given query."},
+        status=status.HTTP_404_NOT_FOUND,
+    )
+
+
+def check_throttles(request, view_class, actions, kwargs):
+    """
+    Returns a 429 response when one of the view's throttles rejects the
+    request, like APIView.check_throttles() would. The request is first
+    authenticated like DRF views do, so throttles see the user of a JWT
+    too, and a 401 is returned when its credentials are invalid.
+    """
+    view = view_class(action_map=actions, kwargs=kwargs)
+    request = view.initialize_request(request)
+    try:
+        view.perform_authentication(request)
+    except AuthenticationFailed as exception:
+        return authentication_failed(request, view, exception)
+
+    waits = [
+        throttle.wait()
+        for throttle in view.get_throttles()
+        if not throttle.allow_request(request, view)
+    ]
+    if not waits:
+        return None
+    exception = Throttled(max(waits))
+    response = render(
+        {"detail": exception.detail}, status=exception.status_code
+    )
+    response["Retry-After"] = "%d" % exception.wait
+    return response
+
+
+def authentication_failed(request, view, exception) -> HttpResponse:
+    # Like APIView.handle_exception()
+    header = view.get_authenticate_header(request)
+    response = render(
+        {"detail": exception.detail},
+        status=(
+            exception.status_code if header else status.HTTP_403_FORBIDDEN
+        ),
+    )
+    if header:
+        response["WWW-Authenticate"] = header
+    return response
+
+
+def read_path(fallback):
+    """
+    Serves GET requests with the decorated coroutine, and every other
+    method with the sync DRF view it replaces.
+
+    The coroutine only awaits the async ORM; serializers then work on the
+    loaded objects, which raises SynchronousOnlyOperation if one of them
+    still needs a query. GET requests are throttled like the DRF view's,
+    off the event loop and only when its scope has a rate.
+    """
+    view_class = fallback.cls
+    actions = fallback.actions
+    scope = getattr(view_class, "throttle_scope", None)
+    throttle = sync_to_async(check_throttles)
+    fallback = sync_to_async(fallback)
+
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method == "GET":
+                if api_settings.DEFAULT_THROTTLE_RATES.get(scope):
+                    response = await throttle(
+                        request, view_class, actions, kwargs
+                    )
+                    if response is not None:
+                        return response
+                return await view(request, *args, **kwargs)
+            return await fallback(request, *args, **kwargs)
+
+        # Like DRF views, so middleware sees the view's attributes
+        wrapper.cls = view_class
+        return wrapper
+
+    return decorator
+
+
+@read_path(views.ProductViewSet.as_view({"get": "list", "post": "create"}))
+async def product_list(request):
+    filterset = ProductFilter(
+        request.GET, queryset=views.ProductViewSet.queryset
+    )
+    if not filterset.is_valid():
+        # Same error format as DjangoFilterBackend
+        return render(
+            ValidationError(filterset.errors).detail,
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    page_size = TenObjectPagination.page_size
+    queryset = filterset.qs
+    count = await queryset.acount()
+    try:
+        page_number = int(request.GET.get("page", 1))
+    except ValueError:
+        page_number = 0
+    if page_number < 1 or (
+        page_number > 1 and (page_number - 1) * page_size >= count
+    ):
+        return render(
+            {"detail": "Invalid page."}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    start = (page_number - 1) * page_size
+    products = [
+        product
+        async for product in queryset[start : start + page_size].aiterator(
+            chunk_size=page_size
+        )
+    ]
+
+    url = request.build_absolute_uri()
+    next_url = None
+    if start + page_size < count:
+        next_url = replace_query_param(url, "page", page_number + 1)
+    previous_url = None
+    if page_number == 2:
+        previous_url = remove_query_param(url, "page")
+    elif page_number > 2:
+        previous_url = replace_query_param(url, "page", page_number - 1)
+
+    return render(
+        {
+            "count": count,
+            "next": next_url,
+            "previous": previous_url,
+            "results": ProductSerializer(products, many=True).data,
+        }
+    )
+
+
+@read_path(
+    views.ProductViewSet.as_view(
+        {
+            "get": "retrieve",
+            "put": "update",
+            "patch": "partial_update",
+            "delete": "destroy",
+        }
+    )
+)
+async def product_detail(request, pk):
+    try:
+        product = await views.ProductViewSet.queryset.aget(pk=pk)
+    except Product.DoesNotExist:
+        return not_found(Product)
+    return render(ProductSerializer(product).data)
+
+
+@read_path(views.CollectionViewSet.as_view({"get": "list", "post": "create"}))
+async def collection_list(request):
+    collections = [
+        collection
+        async for collection in views.CollectionViewSet.queryset.all()
+    ]
+    return render(CollectionSerializer(collections, many=True).data)
+
+
+@read_path(views.CartViewSet.as_view({"get": "retrieve", "delete": "destroy"}))
+async def cart_detail(request, pk):
+    try:
+        cart = await views.CartViewSet.queryset.aget(pk=pk)
+    except Cart.DoesNotExist:
+        return not_found(Cart)
+    return render(CartSerializer(cart).data)
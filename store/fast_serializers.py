@@ -0,0 +1,187 @@
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+
+from store.models import Product
+from store.serializers import (
+    GetCartItemSerializer,
+    GetOrderSerializer,
+    ProductSerializer,
+)
+from tags.models import TaggedItem
+
+# Fields whose to_representation() returns values read from the database
+# unchanged, so it can be skipped
+PLAIN_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+    serializers.ReadOnlyField,
+)
+
+
+class CompiledSerializer:
+    """
+    A DRF serializer class flattened into the values_list() lookups it
+    reads, and the steps that turn a row of them into its representation.
+
+    Nested serializers are read through joins in the same row, except for
+    many=True ones over a reverse foreign key, which take one query per
+    page. SerializerMethodFields call get_<name>(values) on the
+    ValuesSerializer, with the row as a {lookup: value} dict.
+    """
+
+    def __init__(self, serializer_class, prefix="", extra_lookups=()):
+        serializer = serializer_class()
+        # The primary key comes first, to group children and spot nulls
+        self.lookups = [f"{prefix}pk"]
+        self.steps = []
+
+        for name, field in serializer.fields.items():
+            source = prefix + "__".join(field.source_attrs)
+            if isinstance(field, serializers.SerializerMethodField):
+                if prefix:
+                    raise ImproperlyConfigured(
+                        f"{serializer_class.__name__}.{name}: method fields "
+                        f"are only supported on the outer serializer"
+                    )
+                self.steps.append(("method", name, field.method_name))
+            elif isinstance(field, serializers.ListSerializer):
+                relation = getattr(serializer.Meta.model, field.source).field
+                self.steps.append(
+                    (
+                        "many",
+                        name,
+                        (relation, CompiledSerializer(type(field.child))),
+                    )
+                )
+            elif isinstance(field, serializers.BaseSerializer):
+                child = CompiledSerializer(type(field), f"{source}__")
+                self.steps.append(("nested", name, (len(self.lookups), child)))
+                self.lookups.extend(child.lookups)
+            else:
+                converter = (
+                    None
+                    if isinstance(field, PLAIN_FIELDS)
+                    else field.to_representation
+                )
+                self.steps.append(
+                    ("column", name, (len(self.lookups), converter))
+                )
+                self.lookups.append(source)
+
+        self.lookups.extend(extra_lookups)
+
+    def represent(self, row, offset=0, owner=None, children=None) -> dict:
+        data = {}
+        values = None
+        for kind, name, payload in self.steps:
+            if kind == "column":
+                index, converter = payload
+                value = row[offset + index]
+                if converter is not None and value is not None:
+                    value = converter(value)
+                data[name] = value
+            elif kind == "nested":
+                start, child = payload
+                data[name] = (
+                    None
+                    if row[offset + start] is None
+                    else child.represent(row, offset + start)
+                )
+            elif kind == "many":
+                data[name] = children[name].get(row[offset], [])
+            else:
+                if values is None:
+                    values = dict(zip(self.lookups, row[offset:]))
+                data[name] = getattr(owner, payload)(values)
+        return data
+
+    def represent_children(self, ids) -> dict[str, dict]:
+        children = {}
+        for kind, name, payload in self.steps:
+            if kind != "many":
+                continue
+            relation, child = payload
+            rows = relation.model._default_manager.filter(
+                **{f"{relation.name}__in": ids}
+            ).values_list(relation.attname, *child.lookups)
+
+            grouped = defaultdict(list)
+            for row in rows:
+                grouped[row[0]].append(child.represent(row, 1))
+            children[name] = grouped
+        return children
+
+
+class ValuesSerializer:
+    """
+    Read-only stand-in for `serializer_class` that produces the same
+    representation from values_list() rows instead of model instances.
+
+    The serializer class is compiled once per ValuesSerializer subclass.
+    `values` lists the extra lookups read by get_<field> methods, and
+    prefetch() loads whatever those need for a page of primary keys.
+    """
+
+    serializer_class = None
+    values = []
+
+    compiled = {}
+
+    @classmethod
+    def compile(cls) -> CompiledSerializer:
+        if cls not in ValuesSerializer.compiled:
+            ValuesSerializer.compiled[cls] = CompiledSerializer(
+                cls.serializer_class, extra_lookups=cls.values
+            )
+        return ValuesSerializer.compiled[cls]
+
+    def rows(self, queryset):
+        # Instances are never built, so neither are their prefetches
+        return queryset.prefetch_related(None).values_list(
+            *self.compile().lookups
+        )
+
+    def represent(self, rows) -> list[dict]:
+        compiled = self.compile()
+        rows = list(rows)
+        ids = [row[0] for row in rows]
+        self.prefetch(ids)
+        children = compiled.represent_children(ids)
+        return [compiled.represent(row, 0, self, children) for row in rows]
+
+    def prefetch(self, ids):
+        pass
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+    values = ["collection__id", "collection__title"]
+
+    def prefetch(self, ids):
+        self.labels = TaggedItem.objects.get_labels_for_objects(Product, ids)
+
+    def get_collection(self, values: dict) -> dict:
+        return {
+            "id": values["collection__id"],
+            "title": values["collection__title"],
+        }
+
+    def get_tags(self, values: dict) -> list[str]:
+        return self.labels.get(values["pk"], [])
+
+
+class OrderValuesSerializer(ValuesSerializer):
+    serializer_class = GetOrderSerializer
+
+
+class CartItemValuesSerializer(ValuesSerializer):
+    serializer_class = GetCartItemSerializer
+    values = ["product__price"]
+
+    def get_total_price(self, values: dict):
+        return values["quantity"] * values["product__price"]
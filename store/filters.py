@@ -1,13 +1,65 @@
-from django_filters import FilterSet
+from django_filters import (
+    BaseInFilter,
+    CharFilter,
+    ChoiceFilter,
+    FilterSet,
+    NumberFilter,
+    OrderingFilter,
+)
 
 from store.models import Product
+from tags.models import TaggedItem
+
+
+class CharInFilter(BaseInFilter, CharFilter):
+    pass
 
 
 class ProductFilter(FilterSet):
+    TAGS_MATCH_ANY = "any"
+    TAGS_MATCH_ALL = "all"
+
+    TAGS_MATCH_CHOICES = [
+        (TAGS_MATCH_ANY, "Any"),
+        (TAGS_MATCH_ALL, "All"),
+    ]
+
+    tags = CharInFilter(method="filter_tags")
+    tags_match = ChoiceFilter(
+        choices=TAGS_MATCH_CHOICES, method="filter_tags_match"
+    )
+    # On the stock annotated by Product.objects.with_stock()
+    inventory__gt = NumberFilter(field_name="stock", lookup_expr="gt")
+    inventory__lt = NumberFilter(field_name="stock", lookup_expr="lt")
+    ordering = OrderingFilter(
+        fields=(
+            ("price", "price"),
+            ("last_update", "last_update"),
+            ("likes_count", "likes"),
+        )
+    )
+
+    def filter_tags(self, queryset, name, value):
+        labels = [label.strip() for label in value if label.strip()]
+        if not labels:
+            return queryset
+
+        match_all = self.form.cleaned_data.get("tags_match") == (
+            self.TAGS_MATCH_ALL
+        )
+        return queryset.filter(
+            pk__in=TaggedItem.objects.get_tagged_object_ids(
+                Product, labels, match_all
+            )
+        )
+
+    def filter_tags_match(self, queryset, name, value):
+        # Only changes how `tags` is applied, see filter_tags()
+        return queryset
+
     class Meta:
         model = Product
         fields = {
             "collection_id": ["exact"],
-            "inventory": ["gt", "lt"],
             "price": ["gt", "lt"],
         }
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django import forms
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Greatest, Least, Round
+
+from store.models import Product, Promotion
+
+
+class AdjustPriceForm(forms.Form):
+    MODE_PERCENTAGE = "percentage"
+    MODE_AMOUNT = "amount"
+
+    MODE_CHOICES = [
+        (MODE_PERCENTAGE, "Percentage"),
+        (MODE_AMOUNT, "Fixed amount"),
+    ]
+
+    mode = forms.ChoiceField(choices=MODE_CHOICES)
+    value = forms.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        help_text="Use a negative value to lower prices.",
+    )
+
+    def price_expression(self):
+        """
+        Returns the new price of each product as an expression of its
+        current one, rounded to cents and kept within what the price
+        column and its validators accept.
+        """
+        value = Value(self.cleaned_data["value"])
+        if self.cleaned_data["mode"] == self.MODE_PERCENTAGE:
+            price = F("price") * (Value(Decimal(100)) + value) / 100
+        else:
+            price = F("price") + value
+
+        field = Product._meta.get_field("price")
+        step = Decimal(10) ** -field.decimal_places
+        highest = Decimal(10) ** (field.max_digits - field.decimal_places)
+        return Least(
+            Greatest(
+                Round(price, field.decimal_places),
+                Value(Decimal(1)),
+            ),
+            Value(highest - step),
+            output_field=DecimalField(
+                max_digits=field.max_digits,
+                decimal_places=field.decimal_places,
+            ),
+        )
+
+
+class PromotionForm(forms.Form):
+    promotion = forms.ModelChoiceField(Promotion.objects.all())
+
+
+class ProductAdminForm(forms.ModelForm):
+    """
+    Shows and edits the inventory of a product as its whole stock, with
+    what its inventory shards hold, see store/inventory.py.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and "inventory" in self.fields:
+            self.initial["inventory"] = self.instance.stock
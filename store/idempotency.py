@@ -0,0 +1,164 @@
+"""
+Idempotency-Key support for the create endpoints clients retry.
+
+The first request with a key claims it with an IdempotencyKey row, and
+stores its response there once it is done. Retries with the same key
+and payload get that response back without running the view again,
+until the key is IDEMPOTENCY_KEY_TTL_SECONDS old. Expired keys are
+deleted by the purge_idempotency_keys command.
+
+Keys are scoped to the user and path, or to the client IP and path for
+anonymous clients, so one client can't replay another's response, such
+as the id of the cart it created.
+"""
+
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+import orjson
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+
+from core.renderers import ORJSONRenderer
+from store.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+# Keys still marked in progress after this long belong to a request whose
+# worker died, well past any request timeout, and can be claimed again
+ABANDONED_AFTER = timedelta(minutes=1)
+
+
+def expired_before():
+    return timezone.now() - timedelta(
+        seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS
+    )
+
+
+def fingerprint(request) -> str:
+    payload = orjson.dumps(
+        request.data,
+        default=str,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+def get_scope(request) -> str:
+    if request.user.is_authenticated:
+        client = request.user.pk
+    else:
+        # The same client IP as for throttling, behind NUM_PROXIES proxies
+        client = f"ip:{BaseThrottle().get_ident(request)}"
+    return f"{client}:{request.path}"[:255]
+
+
+def claim(scope: str, key: str, digest: str):
+    """
+    Claims the key and returns None, or returns the row of the request
+    that claimed it first while that one is still valid.
+    """
+    while True:
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=digest
+                )
+            return None
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(
+                scope=scope, key=key
+            ).first()
+        if existing is None:
+            continue
+        abandoned = (
+            existing.status_code is None
+            and existing.created_at <= timezone.now() - ABANDONED_AFTER
+        )
+        if existing.created_at > expired_before() and not abandoned:
+            return existing
+        IdempotencyKey.objects.filter(
+            pk=existing.pk, created_at=existing.created_at
+        ).delete()
+
+
+def replay(existing: IdempotencyKey, digest: str) -> Response:
+    if existing.fingerprint != digest:
+        return Response(
+            {"detail": f"This {HEADER} was used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if existing.status_code is None:
+        return Response(
+            {"detail": f"A request with this {HEADER} is in progress."},
+            status=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": "1"},
+        )
+    data = orjson.loads(existing.response) if existing.response else None
+    return Response(
+        data,
+        status=existing.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def idempotent(create):
+    """
+    Makes a viewset's create() honour the Idempotency-Key header.
+
+    Only successful and client error responses are kept. When the view
+    raises, such as for invalid data, or fails with a server error, the
+    key is released so a retry runs the view again.
+    """
+
+    @wraps(create)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return create(self, request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            return Response(
+                {"detail": f"{HEADER} must be 1 to 255 characters long."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        scope = get_scope(request)
+        digest = fingerprint(request)
+        existing = claim(scope, key, digest)
+        if existing is not None:
+            return replay(existing, digest)
+
+        claimed = IdempotencyKey.objects.filter(scope=scope, key=key)
+        try:
+            response = create(self, request, *args, **kwargs)
+        except Exception:
+            claimed.delete()
+            raise
+        if response.status_code >= 500:
+            claimed.delete()
+        else:
+            claimed.update(
+                status_code=response.status_code,
+                response=ORJSONRenderer().render(response.data).decode(),
+            )
+        return response
+
+    return wrapper
+
+
+def purge_expired(batch_size: int = 1000) -> int:
+    purged = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(
+                created_at__lte=expired_before()
+            ).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,287 @@
+"""
+Stock reservations, used when INVENTORY_RESERVATIONS is on.
+
+Adding a product to a cart takes the quantity out of stock for
+RESERVATION_TTL_SECONDS, renewed on every change to the cart. Checkout
+turns the cart's reservations into the order, while deleting the cart
+or one of its items, or the release_expired_reservations command, puts
+the stock back. Product.inventory is then the stock nobody holds.
+
+The stock of a hot product can be spread across InventoryShard rows
+with the shard_inventory command, so concurrent reservations update
+different rows instead of queueing on the product's lock. A product's
+stock is its inventory plus the quantity of its shards, Product.stock,
+which is what the API's and the admin's inventory show, filter on and
+set, through save_product() and clear().
+"""
+
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from store.models import CartItem, InventoryShard, Product, StockReservation
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def expiry():
+    return timezone.now() + timedelta(seconds=settings.RESERVATION_TTL_SECONDS)
+
+
+def take(model, pk, field: str, quantity: int) -> bool:
+    """Decrements the row's stock unless it holds less than quantity."""
+    updated = model.objects.filter(
+        pk=pk, **{f"{field}__gte": quantity}
+    ).update(**{field: F(field) - quantity})
+    return updated == 1
+
+
+def take_stock(product_id: int, quantity: int) -> list[tuple[int, int]]:
+    """
+    Takes quantity of the product out of stock, and returns the shard id,
+    None for the product row, and quantity taken from each row.
+
+    Each row is tried on its own first, with an update that only applies
+    when the row holds enough, so concurrent reservations of a sharded
+    product mostly lock different rows. Only when no row holds enough are
+    they all locked, to take the quantity across them.
+    """
+    shard_ids = list(
+        InventoryShard.objects.filter(product_id=product_id).values_list(
+            "id", flat=True
+        )
+    )
+    random.shuffle(shard_ids)
+    for shard_id in shard_ids:
+        if take(InventoryShard, shard_id, "quantity", quantity):
+            return [(shard_id, quantity)]
+    if take(Product, product_id, "inventory", quantity):
+        return [(None, quantity)]
+    if not shard_ids:
+        raise OutOfStock
+
+    # Locked in the same order as shard_inventory
+    product = (
+        Product.objects.select_for_update()
+        .only("inventory")
+        .get(pk=product_id)
+    )
+    shards = list(
+        InventoryShard.objects.select_for_update()
+        .filter(product_id=product_id)
+        .order_by("id")
+    )
+    rows = [(None, product.inventory)] + [
+        (shard.id, shard.quantity) for shard in shards
+    ]
+    if sum(available for _, available in rows) < quantity:
+        raise OutOfStock
+
+    taken = []
+    for shard_id, available in rows:
+        amount = min(available, quantity - sum(q for _, q in taken))
+        if amount <= 0:
+            continue
+        if shard_id is None:
+            take(Product, product_id, "inventory", amount)
+        else:
+            take(InventoryShard, shard_id, "quantity", amount)
+        taken.append((shard_id, amount))
+    return taken
+
+
+def renew(cart_id):
+    StockReservation.objects.filter(cart_item__cart_id=cart_id).update(
+        expires_at=expiry()
+    )
+
+
+@transaction.atomic()
+def reserve(cart_item: CartItem, quantity: int):
+    """
+    Reserves quantity more of the cart item's product, and renews the
+    other reservations of its cart. Raises OutOfStock without reserving
+    anything when there is not enough stock.
+    """
+    expires_at = expiry()
+    StockReservation.objects.bulk_create(
+        StockReservation(
+            cart_item=cart_item,
+            product_id=cart_item.product_id,
+            shard_id=shard_id,
+            quantity=amount,
+            expires_at=expires_at,
+        )
+        for shard_id, amount in take_stock(cart_item.product_id, quantity)
+    )
+    renew(cart_item.cart_id)
+
+
+@transaction.atomic()
+def release(reservations) -> int:
+    """
+    Puts the stock held by the reservations back, deletes them and
+    returns how many were released.
+    """
+    rows = list(
+        reservations.select_for_update().values_list(
+            "id", "product_id", "shard_id", "quantity"
+        )
+    )
+    if not rows:
+        return 0
+    StockReservation.objects.filter(pk__in=[row[0] for row in rows]).delete()
+
+    by_product = defaultdict(int)
+    by_shard = defaultdict(int)
+    for _, product_id, shard_id, quantity in rows:
+        if shard_id is None:
+            by_product[product_id] += quantity
+        else:
+            by_shard[(product_id, shard_id)] += quantity
+    for (product_id, shard_id), quantity in sorted(by_shard.items()):
+        restored = InventoryShard.objects.filter(pk=shard_id).update(
+            quantity=F("quantity") + quantity
+        )
+        if not restored:
+            by_product[product_id] += quantity
+    for product_id, quantity in sorted(by_product.items()):
+        Product.objects.filter(pk=product_id).update(
+            inventory=F("inventory") + quantity
+        )
+    return len(rows)
+
+
+def release_item(cart_item: CartItem) -> int:
+    return release(StockReservation.objects.filter(cart_item=cart_item))
+
+
+def release_cart(cart_id) -> int:
+    return release(StockReservation.objects.filter(cart_item__cart_id=cart_id))
+
+
+def release_expired(batch_size: int = 1000) -> int:
+    released = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(
+                expires_at__lte=timezone.now()
+            ).values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return released
+        released += release(StockReservation.objects.filter(pk__in=ids))
+
+
+@transaction.atomic()
+def check_out(cart_id):
+    """
+    Consumes the reservations of the cart's items, after reserving what
+    expired reservations no longer hold. Raises OutOfStock when that is
+    not available anymore.
+
+    The reservations are locked before counting what they hold, so
+    release_expired() can't put their stock back while the order is
+    placed: it either released them before, and they are reserved again,
+    or waits and finds them consumed.
+    """
+    reservations = StockReservation.objects.filter(
+        cart_item_id__in=CartItem.objects.filter(cart_id=cart_id).values("id")
+    )
+    reserved = defaultdict(int)
+    for cart_item_id, quantity in reservations.select_for_update().values_list(
+        "cart_item_id", "quantity"
+    ):
+        reserved[cart_item_id] += quantity
+
+    items = CartItem.objects.filter(cart_id=cart_id).order_by("product_id")
+    for item in items:
+        missing = item.quantity - reserved[item.id]
+        if missing > 0:
+            reserve(item, missing)
+    reservations.delete()
+
+
+@transaction.atomic()
+def shard(product_id: int, count: int, stock: int = None) -> int:
+    """
+    Spreads the product's stock, or `stock` when given, evenly across
+    `count` shards, or moves it back into Product.inventory when count is
+    0. Returns the product's new inventory.
+    """
+    product = (
+        Product.objects.select_for_update()
+        .only("inventory")
+        .get(pk=product_id)
+    )
+    shards = list(
+        InventoryShard.objects.select_for_update()
+        .filter(product_id=product_id)
+        .order_by("id")
+    )
+    total = (
+        product.inventory + sum(row.quantity for row in shards)
+        if stock is None
+        else stock
+    )
+
+    # Reservations of deleted shards are released into the product row
+    InventoryShard.objects.filter(
+        pk__in=[row.pk for row in shards[count:]]
+    ).delete()
+    shards = shards[:count]
+    shards += [
+        InventoryShard(product_id=product_id, quantity=0)
+        for _ in range(count - len(shards))
+    ]
+
+    inventory = total
+    if count and total < 0:
+        raise ValueError("Cannot shard a negative inventory")
+    if count:
+        share, remainder = divmod(total, count)
+        for index, inventory_shard in enumerate(shards):
+            inventory_shard.quantity = share + (index < remainder)
+            inventory_shard.save()
+        inventory = 0
+    Product.objects.filter(pk=product_id).update(inventory=inventory)
+    return inventory
+
+
+def save_product(product: Product, stock: int = None):
+    """
+    Saves the product without overwriting what reservations took out of
+    its inventory since it was loaded, then sets its stock when given,
+    spread across its shards if it has any.
+    """
+    if stock is None and not settings.INVENTORY_RESERVATIONS:
+        product.save()
+        return
+
+    with transaction.atomic():
+        product.inventory = (
+            Product.objects.select_for_update()
+            .values_list("inventory", flat=True)
+            .get(pk=product.pk)
+        )
+        product.save()
+        if stock is not None:
+            count = InventoryShard.objects.filter(
+                product_id=product.pk
+            ).count()
+            product.inventory = shard(product.pk, count, stock)
+            product.stock = stock
+
+
+@transaction.atomic()
+def clear(products) -> int:
+    """Empties the stock of the products, shards included."""
+    InventoryShard.objects.filter(product__in=products).update(quantity=0)
+    return products.update(inventory=0)
@@ -0,0 +1,288 @@
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from store.models import Collection, Customer, Product
+from tags.models import Tag
+
+# Relative frequency of each scenario in the request mix
+SCENARIOS = {
+    "browse_products": 40,
+    "product_detail": 15,
+    "list_collections": 5,
+    "list_reviews": 10,
+    "add_to_cart": 15,
+    "checkout": 5,
+    "order_history": 10,
+}
+
+
+def percentile(values: list[float], percent: float) -> float:
+    # Nearest-rank percentile of already sorted values
+    index = max(0, math.ceil(len(values) * percent / 100) - 1)
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a realistic mix of store API requests through the Django "
+        "test client and reports throughput, latency percentiles and SQL "
+        "query counts per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Number of measured requests.",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=50,
+            help="Number of requests run before measuring.",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed for picking scenarios, products and filters.",
+        )
+        parser.add_argument(
+            "--user",
+            help="Username of the customer placing orders.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Writes the results to this JSON file.",
+        )
+        parser.add_argument(
+            "--commit",
+            action="store_true",
+            help="Keeps the carts and orders created by the benchmark.",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.product_ids = list(Product.objects.values_list("id", flat=True))
+        self.collection_ids = list(
+            Collection.objects.values_list("id", flat=True)
+        )
+        self.tag_labels = list(Tag.objects.values_list("label", flat=True))
+        customer = self.get_customer(options["user"])
+        if not self.product_ids or customer is None:
+            raise CommandError(
+                "The benchmark needs products and customers, "
+                "run seed_data first."
+            )
+
+        token = RefreshToken.for_user(customer.user).access_token
+        self.client = Client(HTTP_AUTHORIZATION=f"JWT {token}")
+        self.cart_id = None
+        self.cart_size = 0
+        self.samples = defaultdict(list)
+
+        started_at = timezone.now()
+        # The debug toolbar would instrument every request when DEBUG is on,
+        # and every request comes from the same user, which throttling and
+        # load shedding would reject instead of measuring the endpoints
+        with override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            # Views read their throttle classes once, but scopes without
+            # a rate are never throttled
+            REST_FRAMEWORK={
+                **settings.REST_FRAMEWORK,
+                "DEFAULT_THROTTLE_RATES": {},
+            },
+            LOAD_SHEDDING_MAX_IN_FLIGHT=0,
+            LOAD_SHEDDING_DB_LATENCY_MS=0,
+        ):
+            with transaction.atomic():
+                self.run(options["warmup"])
+                self.samples.clear()
+
+                started = time.perf_counter()
+                self.run(options["requests"])
+                duration = time.perf_counter() - started
+
+                if not options["commit"]:
+                    transaction.set_rollback(True)
+
+        results = self.summarize(options, started_at, duration)
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+    def get_customer(self, username):
+        customers = Customer.objects.select_related("user")
+        if username:
+            return customers.filter(user__username=username).first()
+        return customers.filter(user__is_staff=False).order_by("id").first()
+
+    def run(self, count: int):
+        scenarios = self.rng.choices(
+            list(SCENARIOS), weights=list(SCENARIOS.values()), k=count
+        )
+        for scenario in scenarios:
+            getattr(self, scenario)()
+
+    def request(self, endpoint: str, method: str, path: str, **kwargs):
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, **kwargs)
+            elapsed = time.perf_counter() - started
+
+        self.samples[f"{method.upper()} {endpoint}"].append(
+            (elapsed, queries, response.status_code)
+        )
+        return response
+
+    def random_product(self) -> int:
+        return self.rng.choice(self.product_ids)
+
+    def browse_products(self):
+        filters = self.rng.choice(
+            [
+                {},
+                {"page": self.rng.randint(1, 5)},
+                {"collection_id": self.rng.choice(self.collection_ids)},
+                {"price__gt": 100, "price__lt": self.rng.randint(200, 5000)},
+                {"inventory__gt": 0, "ordering": "price"},
+                {"ordering": "-likes"},
+                (
+                    {"tags": self.rng.choice(self.tag_labels)}
+                    if self.tag_labels
+                    else {}
+                ),
+            ]
+        )
+        self.request(
+            "/store/products/", "get", "/store/products/", data=filters
+        )
+
+    def product_detail(self):
+        self.request(
+            "/store/products/{id}/",
+            "get",
+            f"/store/products/{self.random_product()}/",
+        )
+
+    def list_collections(self):
+        self.request("/store/collections/", "get", "/store/collections/")
+
+    def list_reviews(self):
+        self.request(
+            "/store/products/{id}/reviews/",
+            "get",
+            f"/store/products/{self.random_product()}/reviews/",
+        )
+
+    def add_to_cart(self):
+        if self.cart_id is None:
+            response = self.request("/store/carts/", "post", "/store/carts/")
+            self.cart_id = response.json()["id"]
+            self.cart_size = 0
+
+        response = self.request(
+            "/store/carts/{id}/items/",
+            "post",
+            f"/store/carts/{self.cart_id}/items/",
+            data={"product_id": self.random_product(), "quantity": 1},
+            content_type="application/json",
+        )
+        if response.status_code < 400:
+            self.cart_size += 1
+        self.request(
+            "/store/carts/{id}/", "get", f"/store/carts/{self.cart_id}/"
+        )
+
+    def checkout(self):
+        if not self.cart_size:
+            self.add_to_cart()
+
+        self.request(
+            "/store/orders/",
+            "post",
+            "/store/orders/",
+            data={"cart_id": self.cart_id},
+            content_type="application/json",
+        )
+        self.cart_id = None
+        self.cart_size = 0
+
+    def order_history(self):
+        self.request("/store/orders/", "get", "/store/orders/")
+
+    def summarize(
+        self, options: dict, started_at: datetime, duration: float
+    ) -> dict:
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+            total = sum(latencies) / 1000
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": sum(1 for _, _, status in samples if status >= 400),
+                "throughput": round(len(samples) / total, 2),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+                "queries_avg": round(
+                    sum(queries for _, queries, _ in samples) / len(samples),
+                    2,
+                ),
+                "queries_max": max(queries for _, queries, _ in samples),
+            }
+
+        requests = sum(len(samples) for samples in self.samples.values())
+        return {
+            "started_at": started_at.isoformat(),
+            "database": connection.vendor,
+            "seed": options["seed"],
+            "products": len(self.product_ids),
+            "requests": requests,
+            "duration_s": round(duration, 3),
+            "throughput": round(requests / duration, 2),
+            "endpoints": endpoints,
+        }
+
+    def report(self, results: dict):
+        self.stdout.write(
+            f"{'endpoint':<36}{'reqs':>6}{'err':>5}{'req/s':>9}"
+            f"{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}"
+        )
+        for endpoint, stats in results["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:<36}{stats['requests']:>6}{stats['errors']:>5}"
+                f"{stats['throughput']:>9.1f}{stats['p50_ms']:>9.2f}"
+                f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+                f"{stats['queries_avg']:>9.1f}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{results['requests']} requests in "
+                f"{results['duration_s']}s "
+                f"({results['throughput']} req/s)"
+            )
+        )
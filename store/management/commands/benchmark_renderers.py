@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import ORJSONRenderer
+from store.models import Cart, CartItem, Product
+from store.serializers import CartSerializer, ProductSerializer
+from store.views import tags_prefetch
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the stock DRF JSONRenderer with ORJSONRenderer on "
+        "ProductSerializer and CartSerializer payloads, and checks that "
+        "both produce the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=100,
+            help="Number of products in the product payload.",
+        )
+        parser.add_argument(
+            "--carts",
+            type=int,
+            default=50,
+            help="Number of carts in the cart payload.",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=200,
+            help="Number of times each payload is rendered.",
+        )
+
+    def handle(self, *args, **options):
+        products = (
+            Product.objects.with_stock()
+            .select_related("collection")
+            .prefetch_related(tags_prefetch)
+            .order_by("id")[: options["products"]]
+        )
+        carts = (
+            Cart.objects.prefetch_related(
+                Prefetch(
+                    "cartitem_set",
+                    queryset=CartItem.objects.select_related("product"),
+                )
+            )
+            .filter(cartitem__isnull=False)
+            .distinct()[: options["carts"]]
+        )
+
+        payloads = {
+            "ProductSerializer": ProductSerializer(products, many=True).data,
+            "CartSerializer": CartSerializer(carts, many=True).data,
+        }
+        if not payloads["ProductSerializer"]:
+            raise CommandError("No products found, run seed_data first.")
+
+        renderers = [JSONRenderer(), ORJSONRenderer()]
+        self.stdout.write(
+            f"{'payload':<20}{'renderer':<18}{'items':>7}{'bytes':>10}"
+            f"{'ms/render':>12}{'speedup':>10}"
+        )
+        for name, data in payloads.items():
+            baseline = None
+            outputs = []
+            for renderer in renderers:
+                started = time.perf_counter()
+                for _ in range(options["iterations"]):
+                    output = renderer.render(data)
+                elapsed = (time.perf_counter() - started) / options[
+                    "iterations"
+                ]
+                baseline = baseline or elapsed
+                outputs.append(output)
+                self.stdout.write(
+                    f"{name:<20}{type(renderer).__name__:<18}"
+                    f"{len(data):>7}{len(output):>10}"
+                    f"{elapsed * 1000:>12.3f}{baseline / elapsed:>9.1f}x"
+                )
+
+            if outputs[0] != outputs[1]:
+                self.stdout.write(
+                    self.style.ERROR(f"{name}: the renderers' output differs")
+                )
+        self.stdout.write(self.style.SUCCESS("Done"))
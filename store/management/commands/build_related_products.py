@@ -0,0 +1,171 @@
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from scipy import sparse
+
+from likes.models import LikedItem
+from store.models import OrderItem, Product, RelatedProduct
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes the top related products for every product from "
+        "products bought together in orders and liked by the same users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of related products stored per product.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50000,
+            help="Number of orders (or users for likes) read per batch.",
+        )
+        parser.add_argument(
+            "--orders-weight",
+            type=float,
+            default=1.0,
+            help="Weight of products bought together in the same order.",
+        )
+        parser.add_argument(
+            "--likes-weight",
+            type=float,
+            default=0.5,
+            help="Weight of products liked by the same user.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of related products inserted per query.",
+        )
+
+    def handle(self, *args, **options):
+        product_count = (
+            Product.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        ) + 1
+        product_ids = np.fromiter(
+            Product.objects.values_list("id", flat=True).iterator(),
+            dtype=np.int64,
+        )
+        existing = np.zeros(product_count, dtype=bool)
+        existing[product_ids] = True
+
+        co_occurrence = sparse.csr_matrix(
+            (product_count, product_count), dtype=np.float32
+        )
+
+        self.stdout.write("Counting products bought together...")
+        co_occurrence += options["orders_weight"] * self.co_occurrence(
+            OrderItem.objects.all(),
+            "order_id",
+            "product_id",
+            product_count,
+            existing,
+            options["chunk_size"],
+        )
+
+        self.stdout.write("Counting products liked together...")
+        content_type = ContentType.objects.get_for_model(Product)
+        co_occurrence += options["likes_weight"] * self.co_occurrence(
+            LikedItem.objects.filter(content_type=content_type),
+            "user_id",
+            "object_id",
+            product_count,
+            existing,
+            options["chunk_size"],
+        )
+
+        similarity = self.cosine_similarity(co_occurrence)
+        related_products = self.top_related(similarity, options["top"])
+
+        with transaction.atomic():
+            RelatedProduct.objects.all().delete()
+            RelatedProduct.objects.bulk_create(
+                related_products, batch_size=options["batch_size"]
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored {len(related_products)} related products."
+            )
+        )
+
+    def co_occurrence(
+        self, queryset, group_field, product_field, size, existing, chunk
+    ) -> sparse.csr_matrix:
+        # Product x product counts of groups (orders or users) containing
+        # both products, read in group id ranges to bound memory use
+        bounds = queryset.aggregate(
+            first=Min(group_field), last=Max(group_field)
+        )
+        total = sparse.csr_matrix((size, size), dtype=np.float32)
+        if bounds["first"] is None:
+            return total
+
+        for start in range(bounds["first"], bounds["last"] + 1, chunk):
+            rows = np.array(
+                queryset.filter(
+                    **{
+                        f"{group_field}__gte": start,
+                        f"{group_field}__lt": start + chunk,
+                    }
+                ).values_list(group_field, product_field),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            rows = rows[rows[:, 1] < size]
+            rows = rows[existing[rows[:, 1]]]
+            if not len(rows):
+                continue
+
+            groups = sparse.csr_matrix(
+                (
+                    np.ones(len(rows), dtype=np.float32),
+                    (rows[:, 0] - start, rows[:, 1]),
+                ),
+                shape=(chunk, size),
+            )
+            # A product listed twice in the same group still counts once
+            groups.data[:] = 1
+            total += (groups.T @ groups).tocsr()
+        return total
+
+    def cosine_similarity(self, co_occurrence) -> sparse.csr_matrix:
+        counts = co_occurrence.diagonal()
+        norms = np.zeros_like(counts)
+        np.sqrt(counts, out=norms, where=counts > 0)
+        np.divide(1, norms, out=norms, where=norms > 0)
+
+        scale = sparse.diags(norms)
+        similarity = (scale @ co_occurrence @ scale).tocsr()
+        similarity -= sparse.diags(similarity.diagonal())
+        similarity.eliminate_zeros()
+        return similarity
+
+    def top_related(self, similarity, top) -> list[RelatedProduct]:
+        related_products = []
+        for product_id in np.flatnonzero(np.diff(similarity.indptr)):
+            start, end = similarity.indptr[product_id : product_id + 2]
+            scores = similarity.data[start:end]
+            related_ids = similarity.indices[start:end]
+
+            if len(scores) > top:
+                best = np.argpartition(scores, -top)[-top:]
+                scores, related_ids = scores[best], related_ids[best]
+
+            related_products.extend(
+                RelatedProduct(
+                    product_id=int(product_id),
+                    related_product_id=int(related_id),
+                    score=float(score),
+                )
+                for related_id, score in zip(related_ids, scores)
+            )
+        return related_products
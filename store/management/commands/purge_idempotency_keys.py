@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store import idempotency
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes Idempotency-Key responses older than "
+        "IDEMPOTENCY_KEY_TTL_SECONDS. Meant to run every hour or so."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of keys deleted per query.",
+        )
+
+    def handle(self, *args, **options):
+        purged = idempotency.purge_expired(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Purged {purged} expired idempotency keys")
+        )
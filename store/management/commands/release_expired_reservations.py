@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store import inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Puts the stock held by expired cart reservations back. Meant to "
+        "run every minute or so when INVENTORY_RESERVATIONS is on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of reservations released per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        released = inventory.release_expired(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Released {released} expired reservations")
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import inventory
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Spreads the stock of hot products across several counter rows, so "
+        "concurrent cart reservations don't all wait on the same row lock. "
+        "The API and admin keep showing and setting the product's whole "
+        "stock. --shards 0 moves the stock back into the product."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="+", type=int)
+        parser.add_argument(
+            "--shards",
+            type=int,
+            default=8,
+            help="Number of counter rows per product.",
+        )
+
+    def handle(self, *args, **options):
+        if options["shards"] < 0:
+            raise CommandError("--shards cannot be negative.")
+
+        for product_id in options["product_ids"]:
+            try:
+                inventory.shard(product_id, options["shards"])
+            except Product.DoesNotExist:
+                raise CommandError(f"No product with id {product_id}.")
+            self.stdout.write(
+                f"Product {product_id}: {options['shards']} shards"
+            )
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_likes(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    LikedItem = apps.get_model("likes", "LikedItem")
+
+    for model_name in ("product", "collection"):
+        content_type = ContentType.objects.filter(
+            app_label="store", model=model_name
+        ).first()
+        if content_type is None:
+            continue
+
+        model = apps.get_model("store", model_name)
+        counts = (
+            LikedItem.objects.filter(content_type=content_type)
+            .values("object_id")
+            .annotate(count=Count("id"))
+        )
+        for row in counts:
+            model.objects.filter(pk=row["object_id"]).update(
+                likes_count=row["count"]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("likes", "0002_unique_user_liked_item"),
+        ("store", "0013_remove_customer_email_remove_customer_first_name_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collection",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="likes_count",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:16
+
+import uuid
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils.text import slugify
+
+
+def deduplicate_slugs(apps, schema_editor):
+    # Keeps the slug of the oldest product of every duplicate, and gives
+    # the others and the ones without a slug a new one
+    Product = apps.get_model("store", "Product")
+
+    duplicates = (
+        Product.objects.values("slug")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("slug", flat=True)
+    )
+    products = Product.objects.filter(
+        models.Q(slug__in=list(duplicates)) | models.Q(slug="")
+    ).order_by("id")
+
+    seen = set()
+    renamed = []
+    for product in products.only("id", "title", "slug").iterator():
+        if product.slug and product.slug not in seen:
+            seen.add(product.slug)
+            continue
+        suffix = f"-{uuid.uuid4()}"
+        product.slug = slugify(product.title)[: 255 - len(suffix)] + suffix
+        renamed.append(product)
+    Product.objects.bulk_update(renamed, ["slug"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0015_relatedproduct"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="product",
+            name="slug",
+            field=models.SlugField(editable=False, max_length=255),
+        ),
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="product",
+            name="slug",
+            field=models.SlugField(editable=False, max_length=255, unique=True),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from uuid import uuid4
 
+from django.contrib.contenttypes.fields import GenericRelation
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Coalesce
 
 from nexa import settings
+from store.slugs import unique_slug
 
 
 class Promotion(models.Model):
@@ -23,14 +26,34 @@ class Collection(models.Model):
         null=True,
         blank=True,
     )
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    tags = GenericRelation("tags.TaggedItem")
+    likes = GenericRelation("likes.LikedItem")
 
     def __str__(self) -> str:
         return self.title
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_stock(self):
+        """
+        Annotates the products' stock, their inventory plus the quantity of
+        their inventory shards, see store/inventory.py.
+        """
+        shards = (
+            InventoryShard.objects.filter(product=models.OuterRef("pk"))
+            .values("product")
+            .annotate(total=models.Sum("quantity"))
+            .values("total")
+        )
+        return self.annotate(
+            stock=models.F("inventory") + Coalesce(models.Subquery(shards), 0)
+        )
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255)
-    slug = models.SlugField(editable=False)
+    slug = models.SlugField(max_length=255, unique=True, editable=False)
     description = models.TextField()
     price = models.DecimalField(
         max_digits=6, decimal_places=2, validators=[MinValueValidator(1)]
@@ -39,6 +62,40 @@ class Product(models.Model):
     last_update = models.DateTimeField(auto_now=True)
     collection = models.ForeignKey(Collection, on_delete=models.PROTECT)
     promotions = models.ManyToManyField(Promotion, blank=True)
+    likes_count = models.PositiveIntegerField(
+        default=0, editable=False, db_index=True
+    )
+    tags = GenericRelation("tags.TaggedItem")
+    likes = GenericRelation("likes.LikedItem")
+
+    objects = ProductQuerySet.as_manager()
+
+    _stock = None
+
+    @property
+    def stock(self) -> int:
+        """
+        The product's inventory plus what its inventory shards hold, read
+        from the with_stock() annotation when the product was loaded with
+        it.
+        """
+        if self._stock is None:
+            shards = self.inventory_shards.aggregate(
+                total=models.Sum("quantity")
+            )
+            self._stock = self.inventory + (shards["total"] or 0)
+        return self._stock
+
+    @stock.setter
+    def stock(self, value: int):
+        self._stock = value
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slug(
+                self.title, self._meta.get_field("slug").max_length
+            )
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.title
@@ -140,3 +197,67 @@ class Review(models.Model):
         blank=True,
         related_name="children",
     )
+
+
+class RelatedProduct(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="related_products"
+    )
+    related_product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="+"
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "related_product"],
+                name="unique_product_related_product",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["product", "-score"], name="store_related_score_idx"
+            )
+        ]
+
+
+class InventoryShard(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="inventory_shards"
+    )
+    quantity = models.PositiveIntegerField()
+
+
+class StockReservation(models.Model):
+    # Reservations outlive cart items deleted without releasing them, such
+    # as from the admin, until they expire. Without a constraint, deleting
+    # carts doesn't have to look for reservations to detach.
+    cart_item = models.ForeignKey(
+        CartItem, on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    shard = models.ForeignKey(
+        InventoryShard, on_delete=models.SET_NULL, null=True
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    # The user and path the key was sent for, so keys of different
+    # clients and endpoints never collide
+    scope = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request with the key is still running
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "key"], name="unique_idempotency_scope_key"
+            )
+        ]
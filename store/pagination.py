@@ -1,5 +1,69 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 
+# Row count estimates kept by the database for its query planner
+ESTIMATED_COUNT_QUERIES = {
+    "mysql": (
+        "SELECT table_rows FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name = %s"
+    ),
+    "postgresql": "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+}
+
+
+def estimated_count(queryset) -> int | None:
+    """
+    Returns the estimated number of rows in the queryset's table, or None
+    when the database keeps no estimate.
+    """
+    connection = connections[queryset.db]
+    sql = ESTIMATED_COUNT_QUERIES.get(connection.vendor)
+    if sql is None:
+        return None
+
+    table = queryset.model._meta.db_table
+    if connection.vendor == "postgresql":
+        table = connection.ops.quote_name(table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [table])
+        row = cursor.fetchone()
+
+    # PostgreSQL reports -1 for tables that were never analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
 
 class TenObjectPagination(PageNumberPagination):
     page_size = 10
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the count of an unfiltered queryset from the
+    table statistics once they estimate ESTIMATED_COUNT_THRESHOLD rows or
+    more. Filtered querysets and smaller tables are counted exactly.
+
+    The estimate can be off by a few percent, so the last pages may come
+    out empty or miss a few rows.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        query = getattr(self.object_list, "query", None)
+        if (
+            query is not None
+            and not query.where
+            and not query.distinct
+            and not query.is_sliced
+        ):
+            estimate = estimated_count(self.object_list)
+            if (
+                estimate is not None
+                and estimate >= settings.ESTIMATED_COUNT_THRESHOLD
+            ):
+                return estimate
+        return super().count
@@ -1,10 +1,9 @@
-import uuid
-
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.utils.text import slugify
 from rest_framework import serializers
 from django.db import transaction
 
+from store import inventory
 from store.models import (
     Cart,
     CartItem,
@@ -16,14 +15,28 @@ from store.models import (
     Review,
 )
 from store.signals import order_created
+from store.slugs import product_slugs, unique_slug
 
 
 class CollectionSerializer(serializers.ModelSerializer):
     product_count = serializers.IntegerField(read_only=True)
+    tags = serializers.SerializerMethodField(method_name="get_tags")
+
+    def get_tags(self, collection: Collection) -> list[str]:
+        return [tagged_item.tag.label for tagged_item in collection.tags.all()]
 
     class Meta:
         model = Collection
-        fields = ["id", "title", "product_count"]
+        fields = ["id", "title", "product_count", "tags", "likes_count"]
+
+
+def reserve_or_fail(cart_item: CartItem, quantity: int):
+    try:
+        inventory.reserve(cart_item, quantity)
+    except inventory.OutOfStock:
+        raise serializers.ValidationError(
+            {"quantity": "Not enough stock left for this product."}
+        )
 
 
 class SimpleProductSerializer(serializers.ModelSerializer):
@@ -41,6 +54,9 @@ class ProductSerializer(serializers.ModelSerializer):
     collection = serializers.SerializerMethodField(
         method_name="get_collection"
     )
+    tags = serializers.SerializerMethodField(method_name="get_tags")
+    # The whole stock, with what inventory shards hold, see store/inventory.py
+    inventory = serializers.IntegerField(source="stock")
 
     def get_collection(self, product: Product) -> dict:
         return {
@@ -48,12 +64,27 @@ class ProductSerializer(serializers.ModelSerializer):
             "title": product.collection.title,
         }
 
+    def get_tags(self, product: Product) -> list[str]:
+        return [tagged_item.tag.label for tagged_item in product.tags.all()]
+
+    def create(self, validated_data: dict) -> Product:
+        validated_data["inventory"] = validated_data.pop("stock")
+        return super().create(validated_data)
+
     def update(self, instance: Product, validated_data: dict) -> Product:
+        stock = validated_data.pop("stock", None)
         if "title" in validated_data:
-            validated_data["slug"] = (
-                slugify(validated_data["title"]) + "-" + str(uuid.uuid4())
+            product_slugs.discard(instance.slug)
+            validated_data["slug"] = unique_slug(
+                validated_data["title"],
+                Product._meta.get_field("slug").max_length,
             )
-        return super().update(instance, validated_data)
+        # None of the writable fields are many-to-many ones, which
+        # ModelSerializer.update() would also set
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        inventory.save_product(instance, stock)
+        return instance
 
     class Meta:
         model = Product
@@ -65,6 +96,8 @@ class ProductSerializer(serializers.ModelSerializer):
             "price",
             "inventory",
             "collection",
+            "tags",
+            "likes_count",
         ]
 
 
@@ -93,6 +126,15 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         return value
 
     def save(self, **kwargs):
+        if not settings.INVENTORY_RESERVATIONS:
+            return self.add_item()
+
+        with transaction.atomic():
+            cart_item = self.add_item()
+            reserve_or_fail(cart_item, self.validated_data["quantity"])
+        return cart_item
+
+    def add_item(self) -> CartItem:
         cart_id = self.context["cart_id"]
         product_id = self.validated_data["product_id"]
         quantity = self.validated_data["quantity"]
@@ -116,6 +158,16 @@ class AddCartItemSerializer(serializers.ModelSerializer):
 
 
 class UpdateCartItemSerializer(serializers.ModelSerializer):
+    def update(self, instance: CartItem, validated_data: dict) -> CartItem:
+        if not settings.INVENTORY_RESERVATIONS:
+            return super().update(instance, validated_data)
+
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            inventory.release_item(instance)
+            reserve_or_fail(instance, instance.quantity)
+        return instance
+
     class Meta:
         model = CartItem
         fields = ["quantity"]
@@ -221,6 +273,13 @@ class AddOrderSerializer(serializers.Serializer):
             )
             for item in cart_items
         ]
+        if settings.INVENTORY_RESERVATIONS:
+            try:
+                inventory.check_out(cart_id)
+            except inventory.OutOfStock:
+                raise serializers.ValidationError(
+                    {"cart_id": "Some products are out of stock."}
+                )
         OrderItem.objects.bulk_create(order_items)
         Cart.objects.filter(pk=cart_id).delete()
         order_created.send_robust(self.__class__, order=order)
@@ -1,10 +1,44 @@
-from nexa import settings
-from store.models import Customer
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+
+from likes.models import LikedItem
+from nexa import settings
+from store.models import Collection, Customer, Product
+from store.slugs import product_slugs
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs["created"]:
         Customer.objects.create(user=kwargs["instance"])
+
+
+def update_likes_count(liked_item: LikedItem, delta: int):
+    model = ContentType.objects.get_for_id(
+        liked_item.content_type_id
+    ).model_class()
+    if model in (Product, Collection):
+        objects = model.objects.filter(pk=liked_item.object_id)
+        if delta < 0:
+            # The counter may have missed likes created without signals,
+            # such as by bulk_create(), and can't go below 0
+            objects = objects.filter(likes_count__gt=0)
+        objects.update(likes_count=F("likes_count") + delta)
+
+
+@receiver(post_save, sender=LikedItem)
+def increment_likes_count(sender, **kwargs):
+    if kwargs["created"]:
+        update_likes_count(kwargs["instance"], 1)
+
+
+@receiver(post_delete, sender=LikedItem)
+def decrement_likes_count(sender, **kwargs):
+    update_likes_count(kwargs["instance"], -1)
+
+
+@receiver(post_delete, sender=Product)
+def forget_product_slug(sender, **kwargs):
+    product_slugs.discard(kwargs["instance"].slug)
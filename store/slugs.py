@@ -0,0 +1,49 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.text import slugify
+
+
+def unique_slug(title: str, max_length: int) -> str:
+    """Slug of the title made unique with a UUID, cut to fit max_length."""
+    suffix = f"-{uuid.uuid4()}"
+    return slugify(title)[: max_length - len(suffix)] + suffix
+
+
+class SlugCache:
+    """
+    Thread safe LRU map of slugs to primary keys, holding up to `size`
+    entries.
+
+    Each process keeps its own, so an entry can outlive a rename made by
+    another process: lookups have to check that the object still has the
+    slug.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, slug: str) -> int | None:
+        with self.lock:
+            id = self.ids.get(slug)
+            if id is not None:
+                self.ids.move_to_end(slug)
+            return id
+
+    def set(self, slug: str, id: int):
+        with self.lock:
+            self.ids[slug] = id
+            self.ids.move_to_end(slug)
+            while len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+
+    def discard(self, slug: str):
+        with self.lock:
+            self.ids.pop(slug, None)
+
+
+product_slugs = SlugCache(settings.PRODUCT_SLUG_CACHE_SIZE)
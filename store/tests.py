@@ -1,2 +1,1622 @@
+import csv
+import io
+import json
+import threading
+import time
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.messages import get_messages
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import (
+    AsyncRequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import User
+from core.queries import detect_n_plus_one
+from core.renderers import ORJSONRenderer
+from likes.models import LikedItem
+from store import async_views, inventory, urls
+from store.admin import CustomerAdmin, ProductAdmin
+from store.exports import iterate_rows
+from store.fast_serializers import (
+    CartItemValuesSerializer,
+    OrderValuesSerializer,
+    ProductValuesSerializer,
+)
+from store.models import (
+    Cart,
+    CartItem,
+    Collection,
+    IdempotencyKey,
+    Order,
+    OrderItem,
+    Product,
+    Promotion,
+    Review,
+    StockReservation,
+)
+from store.pagination import EstimatedCountPaginator
+from store.serializers import (
+    GetCartItemSerializer,
+    GetOrderSerializer,
+    ProductSerializer,
+)
+from store.slugs import product_slugs
+from store.views import tags_prefetch
+from tags.models import Tag, TaggedItem
+
+# Number of queries allowed per (method, route name), whatever the amount
+# of data behind the endpoint
+QUERY_BUDGETS = {
+    ("get", "product-list"): 3,
+    ("get", "product-detail"): 2,
+    ("patch", "product-detail"): 12,
+    ("post", "product-like"): 6,
+    ("delete", "product-like"): 5,
+    ("get", "product-related"): 2,
+    ("get", "product-by-slug"): 2,
+    ("get", "collection-list"): 2,
+    ("get", "collection-detail"): 2,
+    ("post", "cart-list"): 3,
+    ("get", "cart-detail"): 3,
+    ("delete", "cart-detail"): 5,
+    ("get", "customer-list"): 2,
+    ("get", "customer-me"): 2,
+    ("put", "customer-me"): 5,
+    ("get", "customer-detail"): 2,
+    ("get", "order-list"): 3,
+    ("post", "order-list"): 15,
+    ("get", "order-detail"): 4,
+    ("patch", "order-detail"): 5,
+    ("get", "product-review-list"): 2,
+    ("post", "product-review-list"): 3,
+    ("get", "product-review-detail"): 2,
+    ("get", "cart-item-list"): 1,
+    ("post", "cart-item-list"): 3,
+    ("get", "cart-item-detail"): 1,
+    ("patch", "cart-item-detail"): 2,
+    ("delete", "cart-item-detail"): 2,
+}
+
+AUTH_QUERY_BUDGETS = {
+    ("get", "/auth/users/me/"): 1,
+    ("post", "/auth/jwt/create/"): 1,
+}
+
+ADMIN_QUERY_BUDGETS = {
+    "auth.Group": 5,
+    "core.User": 6,
+    "store.Address": 5,
+    "store.Cart": 4,
+    "store.Collection": 5,
+    "store.Customer": 4,
+    "store.Order": 4,
+    "store.Product": 5,
+    "store.Promotion": 5,
+    "tags.Tag": 5,
+}
+
+
+class QueryBudgetTestCase(TestCase):
+    # Every endpoint is requested once per size, after the data behind it
+    # has grown, and must use the same number of queries each time
+    SIZES = [2, 12]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "Pass@123"
+        )
+        cls.user = User.objects.create_user(
+            "customer", "customer@example.com", "Pass@123"
+        )
+        cls.customer = cls.user.customer
+        cls.promotion = Promotion.objects.create(
+            description="Sale", discount=10
+        )
+        cls.tag = Tag.objects.create(label="New")
+        cls.collection = Collection.objects.create(title="Toys")
+        cls.cart = Cart.objects.create()
+        cls.order = Order.objects.create(customer=cls.customer)
+        cls.product = cls.create_product()
+        cls.review = Review.objects.create(
+            description="Nice", customer=cls.customer, product=cls.product
+        )
+        cls.cart_item = CartItem.objects.create(
+            cart=cls.cart, product=cls.product, quantity=1
+        )
+
+    @classmethod
+    def create_product(cls) -> Product:
+        product = Product.objects.create(
+            title="Product",
+            slug=f"product-{Product.objects.count()}",
+            description="Description",
+            price=10,
+            inventory=100,
+            collection=cls.collection,
+        )
+        product.promotions.add(cls.promotion)
+        TaggedItem.objects.create(tag=cls.tag, content=product)
+        return product
+
+    def grow(self, size: int):
+        for _ in range(size):
+            product = self.create_product()
+            user = User.objects.create_user(
+                f"user{product.id}", f"user{product.id}@example.com"
+            )
+            LikedItem.objects.create(user=user, content=product)
+            LikedItem.objects.create(user=self.user, content=product)
+            collection = Collection.objects.create(title="Collection")
+            TaggedItem.objects.create(tag=self.tag, content=collection)
+            Review.objects.create(
+                description="Review",
+                customer=user.customer,
+                product=self.product,
+            )
+            CartItem.objects.create(
+                cart=self.cart, product=product, quantity=1
+            )
+            OrderItem.objects.create(
+                order=self.order, product=product, quantity=1, unit_price=10
+            )
+            order = Order.objects.create(customer=self.customer)
+            OrderItem.objects.create(
+                order=order, product=product, quantity=1, unit_price=10
+            )
+
+    def login(self, user: User) -> APIClient:
+        client = APIClient()
+        token = RefreshToken.for_user(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f"JWT {token}")
+        return client
+
+    def assertQueryBudget(
+        self, client, method, route, url_kwargs=None, data=None
+    ):
+        url = reverse(route, kwargs=url_kwargs)
+        with (
+            detect_n_plus_one(),
+            self.assertNumQueries(QUERY_BUDGETS[(method, route)]),
+        ):
+            response = getattr(client, method)(url, data, format="json")
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+    def assertReadBudgets(self, client, method, routes: list):
+        for size in self.SIZES:
+            self.grow(size)
+            for route, url_kwargs in routes:
+                with self.subTest(route=route, size=size):
+                    self.assertQueryBudget(client, method, route, url_kwargs)
+
+    def test_every_route_has_a_budget(self):
+        routes = {
+            pattern.name
+            for router in (urls.router, urls.product_router, urls.cart_router)
+            for pattern in router.urls
+        }
+        budgeted = {route for _, route in QUERY_BUDGETS}
+        self.assertEqual(routes - budgeted, set())
+
+    def test_anonymous_reads(self):
+        product = {"pk": self.product.id}
+        self.assertReadBudgets(
+            APIClient(),
+            "get",
+            [
+                ("product-list", None),
+                ("product-detail", product),
+                ("product-related", product),
+                ("product-by-slug", {"slug": self.product.slug}),
+                ("collection-list", None),
+                ("collection-detail", {"pk": self.collection.id}),
+                ("cart-detail", {"pk": self.cart.id}),
+                ("cart-item-list", {"cart_pk": self.cart.id}),
+                (
+                    "cart-item-detail",
+                    {"cart_pk": self.cart.id, "pk": self.cart_item.id},
+                ),
+            ],
+        )
+
+    def test_customer_reads(self):
+        self.assertReadBudgets(
+            self.login(self.user),
+            "get",
+            [
+                ("customer-me", None),
+                ("order-list", None),
+                ("order-detail", {"pk": self.order.id}),
+                ("product-review-list", {"product_pk": self.product.id}),
+                (
+                    "product-review-detail",
+                    {"product_pk": self.product.id, "pk": self.review.id},
+                ),
+            ],
+        )
+
+    def test_admin_reads(self):
+        self.assertReadBudgets(
+            self.login(self.admin),
+            "get",
+            [
+                ("customer-list", None),
+                ("customer-detail", {"pk": self.customer.id}),
+                ("order-list", None),
+            ],
+        )
+
+    def test_cart_writes(self):
+        client = APIClient()
+        for size in self.SIZES:
+            self.grow(size)
+            with self.subTest(size=size):
+                cart_id = self.assertQueryBudget(
+                    client, "post", "cart-list"
+                ).data["id"]
+                for product in Product.objects.all()[:size]:
+                    response = self.assertQueryBudget(
+                        client,
+                        "post",
+                        "cart-item-list",
+                        {"cart_pk": cart_id},
+                        {"product_id": product.id, "quantity": 1},
+                    )
+                item = {"cart_pk": cart_id, "pk": response.data["id"]}
+                self.assertQueryBudget(
+                    client, "patch", "cart-item-detail", item, {"quantity": 2}
+                )
+                self.assertQueryBudget(
+                    client, "delete", "cart-item-detail", item
+                )
+                self.assertQueryBudget(
+                    client, "delete", "cart-detail", {"pk": cart_id}
+                )
+
+    def test_checkout(self):
+        client = self.login(self.user)
+        for size in self.SIZES:
+            self.grow(size)
+            with self.subTest(size=size):
+                cart = Cart.objects.create()
+                CartItem.objects.bulk_create(
+                    CartItem(cart=cart, product=product, quantity=1)
+                    for product in Product.objects.all()[:size]
+                )
+                response = self.assertQueryBudget(
+                    client, "post", "order-list", data={"cart_id": cart.id}
+                )
+                self.assertEqual(len(response.data["items"]), size)
+
+    def test_customer_writes(self):
+        client = self.login(self.user)
+        for size in self.SIZES:
+            self.grow(size)
+            with self.subTest(size=size):
+                product = {"pk": self.product.id}
+                self.assertQueryBudget(client, "post", "product-like", product)
+                self.assertQueryBudget(
+                    client, "delete", "product-like", product
+                )
+                self.assertQueryBudget(
+                    client,
+                    "post",
+                    "product-review-list",
+                    {"product_pk": self.product.id},
+                    {"description": "Great", "customer": self.customer.id},
+                )
+                self.assertQueryBudget(
+                    client, "put", "customer-me", data={"phone": "555"}
+                )
+
+    def test_admin_writes(self):
+        client = self.login(self.admin)
+        for size in self.SIZES:
+            self.grow(size)
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    client,
+                    "patch",
+                    "product-detail",
+                    {"pk": self.product.id},
+                    {"title": f"Product {size}"},
+                )
+                self.assertQueryBudget(
+                    client,
+                    "patch",
+                    "order-detail",
+                    {"pk": self.order.id},
+                    {"payment_status": Order.PAYMENT_COMPLETE},
+                )
+
+    def test_auth(self):
+        client = self.login(self.user)
+        for size in self.SIZES:
+            self.grow(size)
+            for (method, url), budget in AUTH_QUERY_BUDGETS.items():
+                with self.subTest(url=url, size=size):
+                    data = {"username": "customer", "password": "Pass@123"}
+                    with self.assertNumQueries(budget):
+                        response = getattr(client, method)(url, data)
+                    self.assertLess(response.status_code, 400)
+
+    def test_admin_changelists(self):
+        client = APIClient()
+        client.force_login(self.admin)
+        for size in self.SIZES:
+            self.grow(size)
+            for model in admin.site._registry:
+                label = model._meta.label
+                with self.subTest(model=label, size=size):
+                    url = reverse(
+                        f"admin:{model._meta.app_label}_"
+                        f"{model._meta.model_name}_changelist"
+                    )
+                    with (
+                        detect_n_plus_one(),
+                        self.assertNumQueries(ADMIN_QUERY_BUDGETS[label]),
+                    ):
+                        response = client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_admin_autocomplete(self):
+        client = APIClient()
+        client.force_login(self.admin)
+        url = reverse("admin:autocomplete")
+        params = {
+            "app_label": "store",
+            "model_name": "order",
+            "field_name": "customer",
+        }
+        for size in self.SIZES:
+            self.grow(size)
+            with self.subTest(size=size):
+                with detect_n_plus_one(), self.assertNumQueries(4):
+                    response = client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+
+
+class AsyncCatalogViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tag = Tag.objects.create(label="New")
+        cls.collection = Collection.objects.create(title="Toys")
+        TaggedItem.objects.create(tag=tag, content=cls.collection)
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                price=index + 1,
+                inventory=10,
+                collection=cls.collection,
+            )
+            for index in range(12)
+        ]
+        for product in cls.products[::2]:
+            TaggedItem.objects.create(tag=tag, content=product)
+        cls.cart = Cart.objects.create()
+        for product in cls.products[:3]:
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=2)
+
+    async def assertSameAsViewSet(self, view, path, **kwargs):
+        expected = await self.async_client.get(path)
+        response = await view(AsyncRequestFactory().get(path), **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(
+            json.loads(response.content), json.loads(expected.content)
+        )
+
+    async def test_product_list(self):
+        for query in (
+            "",
+            "?page=2",
+            "?page=3",
+            "?page=x",
+            "?ordering=-price&tags=New",
+            "?price__gt=5&inventory__gt=1",
+            "?price__gt=x",
+        ):
+            with self.subTest(query=query):
+                await self.assertSameAsViewSet(
+                    async_views.product_list, f"/store/products/{query}"
+                )
+
+    async def test_product_detail(self):
+        for pk in (self.products[0].id, 0):
+            with self.subTest(pk=pk):
+                await self.assertSameAsViewSet(
+                    async_views.product_detail,
+                    f"/store/products/{pk}/",
+                    pk=pk,
+                )
+
+    async def test_collection_list(self):
+        await self.assertSameAsViewSet(
+            async_views.collection_list, "/store/collections/"
+        )
+
+    async def test_cart_detail(self):
+        await self.assertSameAsViewSet(
+            async_views.cart_detail,
+            f"/store/carts/{self.cart.id}/",
+            pk=self.cart.id,
+        )
+
+    async def test_writes_use_the_viewsets(self):
+        response = await async_views.product_list(
+            AsyncRequestFactory().post("/store/products/")
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ValuesSerializerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(
+            "customer", "customer@example.com", "Pass@123"
+        )
+        new = Tag.objects.create(label="New")
+        sale = Tag.objects.create(label="Sale")
+        collection = Collection.objects.create(title="Toys")
+        products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                description="" if index % 2 else "Description",
+                price=f"{index}.25",
+                inventory=index,
+                collection=collection,
+            )
+            for index in range(6)
+        ]
+        for product in products[:4]:
+            TaggedItem.objects.create(tag=new, content=product)
+        TaggedItem.objects.create(tag=sale, content=products[0])
+
+        cls.cart = Cart.objects.create()
+        for product in products[:3]:
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=3)
+        Order.objects.create(customer=user.customer)
+        order = Order.objects.create(
+            customer=user.customer, payment_status="C"
+        )
+        for product in products[2:]:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=2, unit_price="1.50"
+            )
+
+    def assertSameRepresentation(
+        self, values_serializer, serializer, queryset
+    ):
+        expected = serializer(queryset, many=True).data
+        data = values_serializer().represent(
+            values_serializer().rows(queryset)
+        )
+        self.assertEqual(data, expected)
+        renderer = ORJSONRenderer()
+        self.assertEqual(renderer.render(data), renderer.render(expected))
+
+    def test_products(self):
+        self.assertSameRepresentation(
+            ProductValuesSerializer,
+            ProductSerializer,
+            Product.objects.with_stock()
+            .select_related("collection")
+            .prefetch_related(tags_prefetch)
+            .order_by("id"),
+        )
+
+    def test_orders(self):
+        self.assertSameRepresentation(
+            OrderValuesSerializer,
+            GetOrderSerializer,
+            Order.objects.prefetch_related("orderitem_set__product").order_by(
+                "id"
+            ),
+        )
+
+    def test_cart_items(self):
+        self.assertSameRepresentation(
+            CartItemValuesSerializer,
+            GetCartItemSerializer,
+            CartItem.objects.select_related("product").filter(cart=self.cart),
+        )
+
+    def test_empty(self):
+        self.assertEqual(
+            OrderValuesSerializer().represent(
+                OrderValuesSerializer().rows(Order.objects.none())
+            ),
+            [],
+        )
+
+
+@override_settings(ESTIMATED_COUNT_THRESHOLD=1000)
+class EstimatedCountPaginatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Cart.objects.bulk_create(Cart() for _ in range(15))
+
+    def count(self, queryset, estimate) -> int:
+        with mock.patch(
+            "store.pagination.estimated_count", return_value=estimate
+        ):
+            return EstimatedCountPaginator(queryset, 10).count
+
+    def test_large_tables_are_estimated(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(Cart.objects.all(), 5000), 5000)
+
+    def test_small_tables_are_counted(self):
+        self.assertEqual(self.count(Cart.objects.all(), 999), 15)
+
+    def test_filtered_querysets_are_counted(self):
+        queryset = Cart.objects.filter(cartitem__isnull=True)
+        self.assertEqual(self.count(queryset, 5000), 15)
+
+    def test_without_statistics(self):
+        self.assertEqual(self.count(Cart.objects.all(), None), 15)
+
+
+class CsvExportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "Pass@123"
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.products = [
+            Product.objects.create(
+                title=f"Product, {index}",
+                slug=f"product-{index}",
+                price=index + 1,
+                inventory=index,
+                collection=collection,
+            )
+            for index in range(5)
+        ]
+        User.objects.create_user("customer", "customer@example.com")
+        for user in User.objects.all():
+            Order.objects.create(customer=user.customer)
+
+    def export(self, model: str, data: dict) -> list[list[str]]:
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            reverse(f"admin:store_{model}_changelist"),
+            {"action": "export_csv", **data},
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_selected_rows(self):
+        rows = self.export(
+            "product",
+            {"_selected_action": [self.products[1].id, self.products[3].id]},
+        )
+        self.assertEqual(rows[0], ProductAdmin.export_fields)
+        self.assertEqual(
+            [row[:2] for row in rows[1:]],
+            [
+                [str(self.products[1].id), "Product, 1"],
+                [str(self.products[3].id), "Product, 3"],
+            ],
+        )
+        self.assertEqual(rows[1][5], "Toys")
+
+    def test_whole_changelist(self):
+        rows = self.export(
+            "customer",
+            {
+                # The page's rows stay ticked when selecting all of them
+                "_selected_action": [self.admin.customer.id],
+                "select_across": "1",
+                "index": "0",
+            },
+        )
+        self.assertEqual(rows[0], CustomerAdmin.export_fields)
+        self.assertEqual(
+            [(row[3], row[-1]) for row in rows[1:]],
+            [("admin@example.com", "1"), ("customer@example.com", "1")],
+        )
+
+    def test_rows_are_read_in_chunks(self):
+        with self.assertNumQueries(3):
+            rows = list(
+                iterate_rows(Product.objects.all(), ["title"], chunk_size=2)
+            )
+        self.assertEqual(rows, [(product.title,) for product in self.products])
+
+
+class ProductBulkActionsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "Pass@123"
+        )
+        cls.promotion = Promotion.objects.create(
+            description="Sale", discount=10
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                slug=f"product-{index}",
+                price=price,
+                inventory=1,
+                collection=collection,
+            )
+            for index, price in enumerate(["10.00", "2.50", "9990.00"])
+        ]
+        cls.products[0].promotions.add(cls.promotion)
+
+    def post_action(self, action: str, data: dict):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("admin:store_product_changelist"),
+                {
+                    "action": action,
+                    helpers.ACTION_CHECKBOX_NAME: [
+                        product.id for product in self.products
+                    ],
+                    **data,
+                },
+            )
+        writes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+            and "django_session" not in query["sql"]
+        ]
+        return response, writes
+
+    def prices(self) -> list[Decimal]:
+        return [
+            Product.objects.get(pk=product.pk).price
+            for product in self.products
+        ]
+
+    def test_asks_for_the_parameters(self):
+        response, writes = self.post_action("adjust_prices", {})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "3 products selected.")
+        self.assertEqual(writes, [])
+
+    def test_percentage(self):
+        response, writes = self.post_action(
+            "adjust_prices", {"post": "yes", "mode": "percentage", "value": 10}
+        )
+        self.assertRedirects(
+            response,
+            reverse("admin:store_product_changelist"),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(
+            self.prices(),
+            [Decimal("11.00"), Decimal("2.75"), Decimal("9999.99")],
+        )
+
+    def test_amount(self):
+        self.post_action(
+            "adjust_prices", {"post": "yes", "mode": "amount", "value": -5}
+        )
+        self.assertEqual(
+            self.prices(),
+            [Decimal("5.00"), Decimal("1.00"), Decimal("9985.00")],
+        )
+
+    def test_promotions(self):
+        self.products[0].promotions.add(self.promotion)
+        response, writes = self.post_action(
+            "add_promotion", {"post": "yes", "promotion": self.promotion.id}
+        )
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.promotion.product_set.count(), 3)
+        # Only counts the products that didn't have the promotion yet
+        [message] = get_messages(response.wsgi_request)
+        self.assertTrue(str(message).endswith(" to 2 products"))
+
+        response, writes = self.post_action(
+            "remove_promotion", {"post": "yes", "promotion": self.promotion.id}
+        )
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.promotion.product_set.count(), 0)
+
+
+class ProductSlugTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "Pass@123"
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.products = [
+            Product.objects.create(
+                title="Red Ball", price=5, inventory=1, collection=collection
+            )
+            for _ in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        for product in self.products:
+            product_slugs.discard(product.slug)
+
+    def get(self, slug: str):
+        return self.client.get(
+            reverse("product-by-slug", kwargs={"slug": slug})
+        )
+
+    def test_slugs_are_unique(self):
+        first, second = (product.slug for product in self.products)
+        self.assertTrue(first.startswith("red-ball-"))
+        self.assertNotEqual(first, second)
+
+    def test_lookup(self):
+        product = self.products[0]
+        detail = self.client.get(
+            reverse("product-detail", kwargs={"pk": product.id})
+        )
+        for _ in range(2):
+            response = self.get(product.slug)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), detail.json())
+        self.assertEqual(product_slugs.get(product.slug), product.id)
+        self.assertEqual(self.get("missing").status_code, 404)
+
+    def test_rename(self):
+        product = self.products[0]
+        self.get(product.slug)
+        self.client.force_authenticate(self.admin)
+        response = self.client.patch(
+            reverse("product-detail", kwargs={"pk": product.id}),
+            {"title": "Blue Ball"},
+            format="json",
+        )
+        self.assertIsNone(product_slugs.get(product.slug))
+        self.assertEqual(self.get(product.slug).status_code, 404)
+        self.assertEqual(self.get(response.json()["slug"]).status_code, 200)
+
+    def test_renamed_by_another_process(self):
+        first, second = self.products
+        product_slugs.set(second.slug, first.id)
+        response = self.get(second.slug)
+        self.assertEqual(response.json()["id"], second.id)
+        self.assertEqual(product_slugs.get(second.slug), second.id)
+
+    def test_delete(self):
+        product = self.products[0]
+        self.get(product.slug)
+        product.delete()
+        self.assertIsNone(product_slugs.get(product.slug))
+
+
+class TagsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        new, sale, gift = (
+            Tag.objects.create(label=label)
+            for label in ("New", "Sale", "Gift")
+        )
+        cls.collections = [
+            Collection.objects.create(title=title)
+            for title in ("Toys", "Books")
+        ]
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {index}",
+                price=5,
+                inventory=1,
+                collection=cls.collections[index % 2],
+            )
+            for index in range(6)
+        ]
+        cls.product_tags = {}
+        for index, product in enumerate(cls.products):
+            tags = (new, sale)[: index % 3]
+            for tag in tags:
+                TaggedItem.objects.create(tag=tag, content=product)
+            cls.product_tags[product.id] = [tag.label for tag in tags]
+        TaggedItem.objects.create(tag=gift, content=cls.collections[0])
+        cls.collection_tags = {
+            cls.collections[0].id: ["Gift"],
+            cls.collections[1].id: [],
+        }
+        # Tags of another model with a product's id aren't the product's
+        TaggedItem.objects.create(
+            tag=gift,
+            content_type=ContentType.objects.get_for_model(Order),
+            object_id=cls.products[1].id,
+        )
+
+    def get(self, name: str, queries: int, **kwargs):
+        # The number of queries doesn't depend on the number of tags
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_product_list(self):
+        results = self.get("product-list", 3)["results"]
+        self.assertEqual(
+            {product["id"]: product["tags"] for product in results},
+            self.product_tags,
+        )
+
+    def test_product_detail(self):
+        for product in self.products[:3]:
+            response = self.get("product-detail", 2, pk=product.id)
+            self.assertEqual(response["tags"], self.product_tags[product.id])
+
+    def test_collection_list(self):
+        response = self.get("collection-list", 2)
+        self.assertEqual(
+            {collection["id"]: collection["tags"] for collection in response},
+            self.collection_tags,
+        )
+
+    def test_collection_detail(self):
+        for collection in self.collections:
+            response = self.get("collection-detail", 2, pk=collection.id)
+            self.assertEqual(
+                response["tags"], self.collection_tags[collection.id]
+            )
+
+    def test_get_tags_for_objects(self):
+        ids = [product.id for product in self.products]
+        ContentType.objects.get_for_model(Product)
+        with self.assertNumQueries(1):
+            tags = TaggedItem.objects.get_tags_for_objects(Product, ids)
+        self.assertEqual(
+            {id: [tag.label for tag in tags[id]] for id in ids},
+            self.product_tags,
+        )
+        self.assertEqual(
+            TaggedItem.objects.get_labels_for_objects(Product, ids),
+            {id: labels for id, labels in self.product_tags.items() if labels},
+        )
+
+
+class ProductTagFilterTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        new, sale = (
+            Tag.objects.create(label=label) for label in ("New", "Sale")
+        )
+        # Labels aren't unique
+        other_new = Tag.objects.create(label="New")
+        collection = Collection.objects.create(title="Toys")
+        cls.products = {
+            title: Product.objects.create(
+                title=title, price=5, inventory=1, collection=collection
+            )
+            for title in ("both", "new", "sale", "untagged", "new twice")
+        }
+        for title, tags in (
+            ("both", [new, sale]),
+            ("new", [new]),
+            ("sale", [sale]),
+            ("new twice", [new, other_new]),
+        ):
+            for tag in tags:
+                TaggedItem.objects.create(tag=tag, content=cls.products[title])
+
+    def filter(self, **params) -> set[str]:
+        response = self.client.get(reverse("product-list"), params)
+        self.assertEqual(response.status_code, 200)
+        return {product["title"] for product in response.json()["results"]}
+
+    def test_any(self):
+        for params, expected in (
+            ({"tags": "New"}, {"both", "new", "new twice"}),
+            ({"tags": "New,Sale"}, {"both", "new", "sale", "new twice"}),
+            ({"tags": "Sale", "tags_match": "any"}, {"both", "sale"}),
+            ({"tags": "Sale,Sale"}, {"both", "sale"}),
+            ({"tags": "Sale,Unknown"}, {"both", "sale"}),
+            ({"tags": "Unknown"}, set()),
+            ({"tags": " , "}, set(self.products)),
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.filter(**params), expected)
+
+    def test_all(self):
+        for tags, expected in (
+            ("New", {"both", "new", "new twice"}),
+            ("New,Sale", {"both"}),
+            ("Sale, New", {"both"}),
+            ("New,New", {"both", "new", "new twice"}),
+            ("New,Sale,Sale", {"both"}),
+            ("New,Unknown", set()),
+        ):
+            with self.subTest(tags=tags):
+                self.assertEqual(
+                    self.filter(tags=tags, tags_match="all"), expected
+                )
+
+    def test_invalid_match(self):
+        response = self.client.get(
+            reverse("product-list"), {"tags": "New", "tags_match": "some"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductLikeTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            "user", "user@example.com", "Pass@123"
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.products = [
+            Product.objects.create(
+                title=title, price=5, inventory=1, collection=collection
+            )
+            for title in ("Ball", "Kite")
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def url(self, pk) -> str:
+        return reverse("product-like", kwargs={"pk": pk})
+
+    def likes_count(self, product: Product) -> int:
+        product.refresh_from_db(fields=["likes_count"])
+        return product.likes_count
+
+    def test_like(self):
+        product = self.products[0]
+        self.assertEqual(
+            self.client.post(self.url(product.id)).status_code, 201
+        )
+        self.assertEqual(self.likes_count(product), 1)
+
+        # Liking again changes nothing
+        self.assertEqual(
+            self.client.post(self.url(product.id)).status_code, 200
+        )
+        self.assertEqual(self.likes_count(product), 1)
+
+    def test_unlike(self):
+        product = self.products[0]
+        self.client.post(self.url(product.id))
+        for _ in range(2):
+            response = self.client.delete(self.url(product.id))
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(self.likes_count(product), 0)
+        self.assertFalse(LikedItem.objects.exists())
+
+    def test_unlike_uncounted_like(self):
+        product = self.products[0]
+        # Likes created without signals aren't counted
+        LikedItem.objects.bulk_create(
+            [
+                LikedItem(
+                    user=self.user,
+                    content_type=ContentType.objects.get_for_model(Product),
+                    object_id=product.id,
+                )
+            ]
+        )
+        response = self.client.delete(self.url(product.id))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.likes_count(product), 0)
+
+    def test_concurrent_like(self):
+        product = self.products[0]
+        # Another request for the same user inserted the like first, so
+        # this one runs into the unique constraint
+        LikedItem.objects.like(self.user, Product, product.id)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url(product.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.likes_count(product), 1)
+        self.assertTrue(
+            any(query["sql"].startswith("INSERT") for query in queries)
+        )
+
+    def test_missing_product(self):
+        for pk in (0, "abc"):
+            with self.subTest(pk=pk):
+                for method in (self.client.post, self.client.delete):
+                    self.assertEqual(method(self.url(pk)).status_code, 404)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.post(self.url(self.products[0].id))
+        self.assertEqual(response.status_code, 401)
+
+    def test_ordering(self):
+        ball, kite = self.products
+        self.client.post(self.url(kite.id))
+        for ordering, expected in (
+            ("likes", [ball.id, kite.id]),
+            ("-likes", [kite.id, ball.id]),
+        ):
+            with self.subTest(ordering=ordering):
+                response = self.client.get(
+                    reverse("product-list"), {"ordering": ordering}
+                )
+                self.assertEqual(
+                    [item["id"] for item in response.json()["results"]],
+                    expected,
+                )
+
+
+class RelatedProductTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("user", "user@example.com", "Pass@123")
+        collection = Collection.objects.create(title="Toys")
+        cls.products = [
+            Product.objects.create(
+                title=title, price=5, inventory=1, collection=collection
+            )
+            for title in ("Ball", "Kite", "Yoyo", "Drum")
+        ]
+        ball, kite, yoyo, drum = cls.products
+        for products in (
+            [ball, kite],
+            [ball, kite],
+            [ball, yoyo],
+            [kite, drum],
+        ):
+            order = Order.objects.create(customer=user.customer)
+            for product in products:
+                OrderItem.objects.create(
+                    order=order, product=product, quantity=1, unit_price=5
+                )
+
+    def related(self, pk) -> list[int]:
+        response = self.client.get(
+            reverse("product-related", kwargs={"pk": pk})
+        )
+        self.assertEqual(response.status_code, 200)
+        return [product["id"] for product in response.json()]
+
+    def test_ranking(self):
+        call_command("build_related_products", stdout=io.StringIO())
+        ball, kite, yoyo, drum = self.products
+        # Ball and kite are bought together twice out of three orders each,
+        # ball and yoyo once out of three and one
+        self.assertEqual(self.related(ball.id), [kite.id, yoyo.id])
+        self.assertEqual(self.related(kite.id), [ball.id, drum.id])
+        self.assertEqual(self.related(yoyo.id), [ball.id])
+
+    def test_top(self):
+        call_command("build_related_products", top=1, stdout=io.StringIO())
+        ball, kite, yoyo, drum = self.products
+        self.assertEqual(self.related(ball.id), [kite.id])
+        self.assertEqual(self.related(drum.id), [kite.id])
+
+    def test_missing_product(self):
+        for pk in (0, "abc"):
+            with self.subTest(pk=pk):
+                response = self.client.get(
+                    reverse("product-related", kwargs={"pk": pk})
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(INVENTORY_RESERVATIONS=True)
+class InventoryReservationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            "customer", "customer@example.com", "Pass@123"
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.product = Product.objects.create(
+            title="Ball", price=5, inventory=10, collection=collection
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cart_id = self.client.post(reverse("cart-list")).json()["id"]
+
+    def add(self, quantity: int, cart_id=None):
+        return self.client.post(
+            reverse(
+                "cart-item-list", kwargs={"cart_pk": cart_id or self.cart_id}
+            ),
+            {"product_id": self.product.id, "quantity": quantity},
+            format="json",
+        )
+
+    def stock(self) -> int:
+        product = Product.objects.get(pk=self.product.pk)
+        shards = product.inventory_shards.aggregate(total=Sum("quantity"))
+        return product.inventory + (shards["total"] or 0)
+
+    def reserved(self) -> int:
+        return (
+            StockReservation.objects.aggregate(total=Sum("quantity"))["total"]
+            or 0
+        )
+
+    def test_add_reserves(self):
+        self.assertEqual(self.add(3).status_code, 201)
+        self.assertEqual(self.add(4).status_code, 201)
+        self.assertEqual((self.stock(), self.reserved()), (3, 7))
+
+        response = self.add(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("quantity", response.json())
+        self.assertEqual(CartItem.objects.get().quantity, 7)
+        self.assertEqual((self.stock(), self.reserved()), (3, 7))
+
+    def test_update_reserves_the_new_quantity(self):
+        item_id = self.add(3).json()["id"]
+        url = reverse(
+            "cart-item-detail", kwargs={"cart_pk": self.cart_id, "pk": item_id}
+        )
+        self.client.patch(url, {"quantity": 8}, format="json")
+        self.assertEqual((self.stock(), self.reserved()), (2, 8))
+
+        response = self.client.patch(url, {"quantity": 11}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get().quantity, 8)
+        self.assertEqual((self.stock(), self.reserved()), (2, 8))
+
+    def test_deletes_release(self):
+        item_id = self.add(3).json()["id"]
+        self.client.delete(
+            reverse(
+                "cart-item-detail",
+                kwargs={"cart_pk": self.cart_id, "pk": item_id},
+            )
+        )
+        self.assertEqual((self.stock(), self.reserved()), (10, 0))
+
+        self.add(5)
+        self.client.delete(reverse("cart-detail", kwargs={"pk": self.cart_id}))
+        self.assertEqual((self.stock(), self.reserved()), (10, 0))
+
+    def test_checkout_consumes(self):
+        self.add(4)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse("order-list"), {"cart_id": self.cart_id}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((self.stock(), self.reserved()), (6, 0))
+
+    def test_checkout_reserves_released_stock_again(self):
+        self.add(4)
+        StockReservation.objects.update(expires_at=timezone.now())
+        inventory.release_expired()
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse("order-list"), {"cart_id": self.cart_id}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((self.stock(), self.reserved()), (6, 0))
+
+    def test_expired_reservations(self):
+        self.add(4)
+        StockReservation.objects.update(expires_at=timezone.now())
+        call_command("release_expired_reservations", stdout=io.StringIO())
+        self.assertEqual((self.stock(), self.reserved()), (10, 0))
+
+        # Someone else took the stock in the meantime
+        other_cart = self.client.post(reverse("cart-list")).json()["id"]
+        self.add(8, other_cart)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse("order-list"), {"cart_id": self.cart_id}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((self.stock(), self.reserved()), (2, 8))
+        self.assertFalse(Order.objects.exists())
+
+    def test_shards(self):
+        inventory.shard(self.product.id, 3)
+        self.assertEqual(
+            sorted(
+                self.product.inventory_shards.values_list(
+                    "quantity", flat=True
+                )
+            ),
+            [3, 3, 4],
+        )
+        # Takes from a single shard, then across all of them
+        self.assertEqual(self.add(2).status_code, 201)
+        self.assertEqual(self.add(7).status_code, 201)
+        self.assertEqual((self.stock(), self.reserved()), (1, 9))
+
+        inventory.shard(self.product.id, 0)
+        self.assertFalse(self.product.inventory_shards.exists())
+        self.client.delete(reverse("cart-detail", kwargs={"pk": self.cart_id}))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory, 10)
+
+
+class ShardedStockTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "Pass@123"
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.product = Product.objects.create(
+            title="Ball", price=5, inventory=10, collection=collection
+        )
+        inventory.shard(cls.product.id, 3)
+
+    def shards(self) -> list[int]:
+        return sorted(
+            self.product.inventory_shards.values_list("quantity", flat=True)
+        )
+
+    def test_api_shows_the_stock(self):
+        url = reverse("product-detail", kwargs={"pk": self.product.pk})
+        self.assertEqual(self.client.get(url).json()["inventory"], 10)
+        response = self.client.get(reverse("product-list"))
+        self.assertEqual(response.json()["results"][0]["inventory"], 10)
+
+        for query, count in (
+            ("inventory__gt=9", 1),
+            ("inventory__gt=10", 0),
+            ("inventory__lt=11", 1),
+            ("inventory__lt=10", 0),
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(
+                    f"{reverse('product-list')}?{query}"
+                )
+                self.assertEqual(response.json()["count"], count)
+
+    def test_api_sets_the_stock(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.patch(
+            reverse("product-detail", kwargs={"pk": self.product.pk}),
+            {"inventory": 20},
+            format="json",
+        )
+        self.assertEqual(response.json()["inventory"], 20)
+        self.assertEqual(self.shards(), [6, 7, 7])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory, 0)
+
+    def test_admin_edits_the_stock(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:store_product_changelist")
+        self.assertContains(
+            self.client.get(url),
+            'name="form-0-inventory" value="10"',
+        )
+
+        self.client.post(
+            url,
+            {
+                "form-TOTAL_FORMS": 1,
+                "form-INITIAL_FORMS": 1,
+                "form-0-id": self.product.pk,
+                "form-0-price": "5.00",
+                "form-0-inventory": 4,
+                "_save": "Save",
+            },
+        )
+        self.assertEqual(self.shards(), [1, 1, 2])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory, 0)
+
+    def test_clear_inventory(self):
+        self.client.force_login(self.admin)
+        self.client.post(
+            reverse("admin:store_product_changelist"),
+            {
+                "action": "clear_inventory",
+                helpers.ACTION_CHECKBOX_NAME: [self.product.pk],
+            },
+        )
+        self.assertEqual(self.shards(), [0, 0, 0])
+        self.assertEqual(
+            Product.objects.with_stock().get(pk=self.product.pk).stock, 0
+        )
+
+
+@skipUnlessDBFeature("test_db_allows_multiple_connections")
+@override_settings(INVENTORY_RESERVATIONS=True)
+class InventoryStressTestCase(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS = 10
+    STOCK = 25
+
+    def test_no_overselling(self):
+        collection = Collection.objects.create(title="Toys")
+        product = Product.objects.create(
+            title="Ball", price=5, inventory=self.STOCK, collection=collection
+        )
+        inventory.shard(product.id, 4)
+        items = [
+            CartItem.objects.create(
+                cart=Cart.objects.create(), product=product, quantity=2
+            )
+            for _ in range(self.THREADS * self.ATTEMPTS)
+        ]
+        results = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def buy(thread_items):
+            barrier.wait()
+            try:
+                for item in thread_items:
+                    try:
+                        inventory.reserve(item, item.quantity)
+                        results.append(True)
+                    except inventory.OutOfStock:
+                        results.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=buy, args=(items[index :: self.THREADS],))
+            for index in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), len(items))
+        self.assertEqual(results.count(True), self.STOCK // 2)
+        reserved = StockReservation.objects.aggregate(total=Sum("quantity"))
+        self.assertEqual(reserved["total"], self.STOCK // 2 * 2)
+        remaining = product.inventory_shards.aggregate(total=Sum("quantity"))
+        self.assertEqual(
+            Product.objects.get(pk=product.pk).inventory + remaining["total"],
+            self.STOCK % 2,
+        )
+
+    def test_expired_reservations_released_during_checkout(self):
+        collection = Collection.objects.create(title="Toys")
+        product = Product.objects.create(
+            title="Ball", price=5, inventory=5, collection=collection
+        )
+        cart = Cart.objects.create()
+        item = CartItem.objects.create(cart=cart, product=product, quantity=3)
+        inventory.reserve(item, item.quantity)
+        StockReservation.objects.update(expires_at=timezone.now())
+        locked = threading.Event()
+        released = []
+
+        def pause_after_lock(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not locked.is_set() and "stockreservation" in sql:
+                # Lets release_expired() run against the locked rows
+                locked.set()
+                time.sleep(0.5)
+            return result
+
+        def release():
+            locked.wait()
+            try:
+                released.append(inventory.release_expired())
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=release)
+        thread.start()
+        with connection.execute_wrapper(pause_after_lock):
+            inventory.check_out(cart.id)
+        thread.join()
+
+        self.assertEqual(released, [0])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Product.objects.get(pk=product.pk).inventory, 2)
+
+
+class IdempotencyKeyTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            "customer", "customer@example.com", "Pass@123"
+        )
+        collection = Collection.objects.create(title="Toys")
+        cls.product = Product.objects.create(
+            title="Ball", price=5, inventory=10, collection=collection
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, data=None, key="key"):
+        return self.client.post(
+            url, data, format="json", headers={"Idempotency-Key": key}
+        )
+
+    def cart(self) -> str:
+        cart_id = self.client.post(reverse("cart-list")).json()["id"]
+        self.client.post(
+            reverse("cart-item-list", kwargs={"cart_pk": cart_id}),
+            {"product_id": self.product.id, "quantity": 2},
+            format="json",
+        )
+        return cart_id
+
+    def test_retries_replay_the_response(self):
+        cart = self.post(reverse("cart-list"))
+        self.assertEqual(self.post(reverse("cart-list")).json(), cart.json())
+        self.assertEqual(Cart.objects.count(), 1)
+
+        data = {"cart_id": self.cart()}
+        response = self.post(reverse("order-list"), data, key="order")
+        retry = self.post(reverse("order-list"), data, key="order")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.content, response.content)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_reused_for_another_request(self):
+        self.post(reverse("order-list"), {"cart_id": self.cart()}, key="order")
+        response = self.post(
+            reverse("order-list"), {"cart_id": self.cart()}, key="order"
+        )
+        self.assertEqual(response.status_code, 422)
+
+    def test_in_progress(self):
+        self.post(reverse("cart-list"))
+        IdempotencyKey.objects.update(status_code=None)
+        response = self.post(reverse("cart-list"))
+        self.assertEqual(response.status_code, 409)
+
+        # Until the request is considered abandoned
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.assertEqual(self.post(reverse("cart-list")).status_code, 201)
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_errors_release_the_key(self):
+        response = self.post(reverse("order-list"), {"cart_id": str(uuid4())})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_are_scoped_to_the_user(self):
+        self.post(reverse("cart-list"))
+        self.client.force_authenticate(None)
+        self.post(reverse("cart-list"))
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_anonymous_keys_are_scoped_to_the_ip(self):
+        self.client.force_authenticate(None)
+        self.client.defaults["REMOTE_ADDR"] = "10.0.0.1"
+        cart = self.post(reverse("cart-list")).json()
+        self.assertEqual(self.post(reverse("cart-list")).json(), cart)
+
+        # Another anonymous client doesn't get the first one's cart
+        self.client.defaults["REMOTE_ADDR"] = "10.0.0.2"
+        other = self.post(reverse("cart-list"))
+        self.assertEqual(other.status_code, 201)
+        self.assertNotIn("Idempotent-Replayed", other.headers)
+        self.assertNotEqual(other.json()["id"], cart["id"])
+        self.assertEqual(Cart.objects.count(), 2)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL_SECONDS=60)
+    def test_expiry(self):
+        self.post(reverse("cart-list"))
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.post(reverse("cart-list"))
+        self.assertEqual(Cart.objects.count(), 2)
+
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.post(reverse("cart-list"), key="other")
+        call_command("purge_idempotency_keys", stdout=io.StringIO())
+        self.assertQuerySetEqual(
+            IdempotencyKey.objects.values_list("key", flat=True), ["other"]
+        )
+
+
+class BenchmarkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user("customer", "customer@example.com")
+        collection = Collection.objects.create(title="Toys")
+        for title in ("Ball", "Kite"):
+            Product.objects.create(
+                title=title, price=5, inventory=100, collection=collection
+            )
+
+    def benchmark(self, **options) -> dict:
+        with tempfile.TemporaryDirectory() as directory:
+            output = f"{directory}/results.json"
+            call_command(
+                "benchmark",
+                requests=30,
+                warmup=5,
+                seed=1,
+                output=output,
+                stdout=io.StringIO(),
+                **options,
+            )
+            with open(output) as file:
+                return json.load(file)
+
+    def test_results(self):
+        before = timezone.now()
+        results = self.benchmark()
+        self.assertEqual(
+            list(results),
+            [
+                "started_at",
+                "database",
+                "seed",
+                "products",
+                "requests",
+                "duration_s",
+                "throughput",
+                "endpoints",
+            ],
+        )
+        self.assertEqual(results["seed"], 1)
+        self.assertEqual(results["products"], 2)
+        # Some of the 30 scenarios make several requests
+        self.assertGreaterEqual(results["requests"], 30)
+        self.assertEqual(
+            sum(stats["requests"] for stats in results["endpoints"].values()),
+            results["requests"],
+        )
+        for endpoint, stats in results["endpoints"].items():
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(stats["errors"], 0)
+                self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+                self.assertGreater(stats["queries_max"], 0)
+
+        # Nothing is kept without --commit
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+        self.assertLessEqual(
+            before, datetime.fromisoformat(results["started_at"])
+        )
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"catalog": "1/min", "carts": "1/min"},
+        },
+        LOAD_SHEDDING_DB_LATENCY_MS=0.001,
+    )
+    def test_throttling_and_load_shedding_are_off(self):
+        results = self.benchmark()
+        self.assertEqual(
+            sum(stats["errors"] for stats in results["endpoints"].values()), 0
+        )
+
+    def test_commit(self):
+        results = self.benchmark(commit=True)
+        self.assertTrue(Order.objects.exists())
+        # Taken before the first request
+        self.assertFalse(
+            Cart.objects.filter(
+                create_at__lt=datetime.fromisoformat(results["started_at"])
+            ).exists()
+        )
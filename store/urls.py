@@ -1,8 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 from rest_framework_nested.routers import NestedSimpleRouter
 
-from store import views
+from store import async_views, views
 
 router = SimpleRouter()
 router.register(r"products", views.ProductViewSet, basename="product")
@@ -24,3 +25,12 @@ urlpatterns = [
     path("", include(product_router.urls)),
     path("", include(cart_router.urls)),
 ]
+
+if settings.ASYNC_CATALOG_VIEWS:
+    # Matched before the router, other methods are passed on to the viewsets
+    urlpatterns = [
+        path("products/", async_views.product_list),
+        path("products/<int:pk>/", async_views.product_detail),
+        path("collections/", async_views.collection_list),
+        path("carts/<uuid:pk>/", async_views.cart_detail),
+    ] + urlpatterns
@@ -1,7 +1,9 @@
-from django.db.models import Count
+from django.conf import settings
+from django.db.models import Count, Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.mixins import (
     CreateModelMixin,
     DestroyModelMixin,
@@ -11,7 +13,16 @@ from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
+from core import metrics
+from likes.models import LikedItem
+from store import inventory
+from store.fast_serializers import (
+    CartItemValuesSerializer,
+    OrderValuesSerializer,
+    ProductValuesSerializer,
+)
 from store.filters import ProductFilter
+from store.idempotency import idempotent
 from store.models import (
     Cart,
     CartItem,
@@ -20,6 +31,7 @@ from store.models import (
     Order,
     OrderItem,
     Product,
+    RelatedProduct,
     Review,
 )
 from store.pagination import TenObjectPagination
@@ -34,18 +46,51 @@ from store.serializers import (
     GetOrderSerializer,
     ProductSerializer,
     ReviewSerializer,
+    SimpleProductSerializer,
     UpdateCartItemSerializer,
     UpdateOrderSerializer,
 )
+from store.slugs import product_slugs
+from tags.models import TaggedItem
+
+tags_prefetch = Prefetch(
+    "tags", queryset=TaggedItem.objects.select_related("tag")
+)
+
+
+class ValuesListMixin:
+    """
+    Serves list() with `values_serializer_class`, which renders the same
+    payload as the serializer from values_list() rows.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.values_serializer_class()
+        rows = serializer.rows(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.represent(page))
+        return Response(serializer.represent(rows))
 
 
-class ProductViewSet(ModelViewSet):
-    queryset = Product.objects.select_related("collection").all()
+class ProductViewSet(ValuesListMixin, ModelViewSet):
+    queryset = (
+        Product.objects.with_stock()
+        .select_related("collection")
+        .prefetch_related(tags_prefetch)
+        .all()
+    )
     serializer_class = ProductSerializer
+    values_serializer_class = ProductValuesSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
     pagination_class = TenObjectPagination
     permission_classes = [IsAdminUserOrReadOnly]
+    throttle_scope = "catalog"
+    load_shedding_priority = "low"
 
     def destroy(self, request, *args, **kwargs):
         if OrderItem.objects.filter(product_id=kwargs["pk"]).count() > 0:
@@ -57,13 +102,68 @@ class ProductViewSet(ModelViewSet):
             )
         return super().destroy(request, *args, **kwargs)
 
+    @action(
+        detail=True,
+        methods=["post", "delete"],
+        permission_classes=[IsAuthenticated],
+    )
+    def like(self, request, pk=None):
+        get_object_or_404(Product.objects.only("id"), pk=pk)
+
+        if request.method == "POST":
+            created = LikedItem.objects.like(request.user, Product, pk)
+            return Response(
+                status=(
+                    status.HTTP_201_CREATED if created else status.HTTP_200_OK
+                )
+            )
+
+        if request.method == "DELETE":
+            LikedItem.objects.unlike(request.user, Product, pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, url_path=r"by-slug/(?P<slug>[-\w]+)")
+    def by_slug(self, request, slug=None):
+        queryset = self.get_queryset()
+        product = None
+        product_id = product_slugs.get(slug)
+        metrics.record_cache_lookup("product_slug", product_id is not None)
+        if product_id is not None:
+            # The product may have been renamed by another process
+            product = queryset.filter(pk=product_id, slug=slug).first()
+            if product is None:
+                product_slugs.discard(slug)
+        if product is None:
+            product = get_object_or_404(queryset, slug=slug)
+            product_slugs.set(slug, product.id)
+
+        serializer = self.get_serializer(product)
+        return Response(serializer.data)
+
+    @action(detail=True)
+    def related(self, request, pk=None):
+        get_object_or_404(Product.objects.only("id"), pk=pk)
+        related_products = (
+            RelatedProduct.objects.select_related("related_product")
+            .filter(product_id=pk)
+            .order_by("-score")
+        )
+        serializer = SimpleProductSerializer(
+            [item.related_product for item in related_products], many=True
+        )
+        return Response(serializer.data)
+
 
 class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(
-        product_count=Count("product")
-    ).all()
+    queryset = (
+        Collection.objects.prefetch_related(tags_prefetch)
+        .annotate(product_count=Count("product"))
+        .all()
+    )
     serializer_class = CollectionSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    throttle_scope = "catalog"
+    load_shedding_priority = "low"
 
     def destroy(self, request, *args, **kwargs):
         if Product.objects.filter(collection_id=kwargs["pk"]).count() > 0:
@@ -78,6 +178,8 @@ class CollectionViewSet(ModelViewSet):
 
 class ReviewViewSet(ModelViewSet):
     serializer_class = ReviewSerializer
+    throttle_scope = "catalog"
+    load_shedding_priority = "low"
 
     def get_queryset(self):
         product_id = self.kwargs["product_pk"]
@@ -96,11 +198,30 @@ class CartViewSet(
     queryset = Cart.objects.prefetch_related("cartitem_set__product").all()
     serializer_class = CartSerializer
     permission_classes = [AllowAny]
+    throttle_scope = "carts"
+    throttle_identity = "cart"
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        metrics.cart_operations.inc(operation="create_cart")
+
+    def perform_destroy(self, instance):
+        if settings.INVENTORY_RESERVATIONS:
+            inventory.release_cart(instance.id)
+        super().perform_destroy(instance)
+        metrics.cart_operations.inc(operation="delete_cart")
 
 
-class CartItemViewSet(ModelViewSet):
+class CartItemViewSet(ValuesListMixin, ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
     permission_classes = [AllowAny]
+    values_serializer_class = CartItemValuesSerializer
+    throttle_scope = "carts"
+    throttle_identity = "cart"
 
     def get_queryset(self):
         cart_id = self.kwargs["cart_pk"]
@@ -118,6 +239,24 @@ class CartItemViewSet(ModelViewSet):
     def get_serializer_context(self):
         return {"cart_id": self.kwargs["cart_pk"]}
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        metrics.cart_operations.inc(operation="add_item")
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        metrics.cart_operations.inc(operation="update_item")
+
+    def perform_destroy(self, instance):
+        if settings.INVENTORY_RESERVATIONS:
+            inventory.release_item(instance)
+        super().perform_destroy(instance)
+        metrics.cart_operations.inc(operation="remove_item")
+
 
 class CustomerViewSet(ModelViewSet):
     queryset = Customer.objects.all()
@@ -148,15 +287,29 @@ class CustomerViewSet(ModelViewSet):
             return Response(serializer.data)
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(ValuesListMixin, ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete", "head", "options"]
+    values_serializer_class = OrderValuesSerializer
+    throttle_scope = "orders"
+    # Checkout is kept up, order history is shed like other reads
+    load_shedding_priorities = {"create": "high"}
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         serializer = AddOrderSerializer(
             data=request.data, context={"request": self.request}
         )
-        serializer.is_valid(raise_exception=True)
-        order = serializer.save()
+        try:
+            serializer.is_valid(raise_exception=True)
+            order = serializer.save()
+        except Exception:
+            metrics.checkouts.inc(result="failure")
+            raise
+        metrics.checkouts.inc(result="success")
+        # Reload with its items so serializing them does not query per item
+        order = Order.objects.prefetch_related("orderitem_set__product").get(
+            pk=order.pk
+        )
         serializer = GetOrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -178,8 +331,7 @@ class OrderViewSet(ModelViewSet):
         if user.is_staff:
             return queryset.all()
         else:
-            customer = Customer.objects.only("id").get(user_id=user.id)
-            return queryset.filter(customer_id=customer.id)
+            return queryset.filter(customer__user_id=user.id)
 
     def get_serializer_class(self):
         if self.request.method == "POST":
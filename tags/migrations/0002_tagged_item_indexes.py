@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("tags", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tag",
+            name="label",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="taggeditem",
+            index=models.Index(
+                fields=["content_type", "object_id"], name="tags_tagged_object_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taggeditem",
+            index=models.Index(
+                fields=["content_type", "tag", "object_id"],
+                name="tags_tagged_tag_object_idx",
+            ),
+        ),
+    ]
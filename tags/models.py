@@ -1,6 +1,9 @@
+from collections import defaultdict
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import Count
 
 
 class TagModelManager(models.Manager):
@@ -10,9 +13,51 @@ class TagModelManager(models.Manager):
             content_type=content_type, object_id=id
         )
 
+    def get_tags_for_objects(
+        self, model: models.Model, ids
+    ) -> dict[int, list["Tag"]]:
+        content_type = ContentType.objects.get_for_model(model)
+        tagged_items = TaggedItem.objects.select_related("tag").filter(
+            content_type=content_type, object_id__in=ids
+        )
+
+        tags = defaultdict(list)
+        for tagged_item in tagged_items:
+            tags[tagged_item.object_id].append(tagged_item.tag)
+        return tags
+
+    def get_labels_for_objects(
+        self, model: models.Model, ids
+    ) -> dict[int, list[str]]:
+        content_type = ContentType.objects.get_for_model(model)
+        tagged_items = TaggedItem.objects.filter(
+            content_type=content_type, object_id__in=ids
+        ).values_list("object_id", "tag__label")
+
+        labels = defaultdict(list)
+        for object_id, label in tagged_items:
+            labels[object_id].append(label)
+        return labels
+
+    def get_tagged_object_ids(
+        self, model: models.Model, labels: list[str], match_all=False
+    ):
+        content_type = ContentType.objects.get_for_model(model)
+        tagged_items = TaggedItem.objects.filter(
+            content_type=content_type, tag__label__in=labels
+        )
+
+        if match_all:
+            tagged_items = (
+                tagged_items.values("object_id")
+                .annotate(tag_count=Count("tag__label", distinct=True))
+                .filter(tag_count=len(set(labels)))
+            )
+        return tagged_items.values("object_id")
+
 
 class Tag(models.Model):
-    label = models.CharField(max_length=255)
+    label = models.CharField(max_length=255, db_index=True)
 
     def __str__(self) -> str:
         return self.label
@@ -24,3 +69,15 @@ class TaggedItem(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content = GenericForeignKey()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["content_type", "object_id"],
+                name="tags_tagged_object_idx",
+            ),
+            models.Index(
+                fields=["content_type", "tag", "object_id"],
+                name="tags_tagged_tag_object_idx",
+            ),
+        ]